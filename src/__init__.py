@@ -5,90 +5,205 @@
 # src/__init__.py
 # **************************
 
-from .calculation import (
-    calculate_line_daily_mileage,
-    calculate_period_idle_max_value,
-    calculate_periods_surplus_wagons,
-    calculate_standing_dates,
-    calculate_standing_trains_wagons,
-    calculate_train_mileage_ne,
-    calculate_train_lenght,
-    calculate_transportation_values,
-    calculate_wagon_daily_mileage,
-    calculate_wagon_mileage_ne,
-    calculate_wagon_service_mileage,
-    count_idle_wagons,
-    count_wagons_in_motion,
-)
-from changing import (
-    adding_wagon_service_periods,
-    change_trains_daily_mileage,
-    change_unhitched_wagons,
-    update_wagon_service_period,
-    update_wagons_attrs,
-    unify_train_service_period,
-)
-from .classes import (
-    Normatives,
-    Registry,
-    Train,
-    Wagon
-)
-from .confirmation import (
-    confirm_possible_trains
-)
-from .conversion import (
-    convert_confirmed_trains,
-    convert_preplanned_services,
-    convert_wagons_attrs
-)
-from .creation import (
-    create_debug_file_output,
-    create_trains,
-    create_wagons
-)
-from .definition import (
-    define_periods_startdates,
-    define_wagons_outside_service_periods
-)
-from .normatives import (
-    mileage_frequency_standards,
-    service_duration_standards
-)
-from .parsing import (
-    convert_start_date,
-    pars_wagons_data
-)
-from .planning import (
-    service_planning
-)
-from .selection import (
-    select_current_idle_end,
-    select_debug_data_path,
-    select_extra_wagon_data_path,
-    select_hitched_wagons,
-    select_idle_wagons,
-    select_line_motion_time,
-    select_main_wagon_data_path,
-    select_output_data_path,
-    select_planning_end_date,
-    select_possible_trains,
-    select_preplanned_services,
-    select_text_result_data_path,
-    select_transportation_values,
-    select_unhitched_wagons
-)
-from .utility import (
-    daterange,
-    check_input_dates_planning,
-    check_input_dates_usage,
-    print_result_services_to_file,
-    print_service_wagons_to_file,
-    print_standing_dates_to_file,
-    workdate,
-    workdayrange
-)
-from .verification import (
-    verify_allowed_service_start_date,
-    verify_planning_results
-)
+import importlib
+
+# Модули пакета и имена, доступные из пакета.
+# Модуль загружается при первом обращении к любому из его имен (см. __getattr__),
+# поэтому импорт пакета не загружает модули расчета.
+submodules_exports = {
+    "benchmark": (
+        "BENCHMARK_HORIZONS",
+        "BENCHMARK_SIZES",
+        "generate_synthetic_exports",
+        "generate_synthetic_inputs",
+        "generate_synthetic_transportation_values",
+        "measure",
+        "run_benchmark",
+        "run_benchmarks",
+        "save_benchmark_results",
+        "write_synthetic_html_exports",
+    ),
+    "calculation": (
+        "calculate_fleet_mileage",
+        "calculate_line_daily_mileage",
+        "calculate_period_idle_max_value",
+        "calculate_periods_idle_max_values",
+        "calculate_periods_surplus_wagons",
+        "calculate_reserve_wagons",
+        "calculate_standing_dates",
+        "calculate_standing_trains_wagons",
+        "calculate_train_mileage_ne",
+        "calculate_train_lenght",
+        "calculate_transportation_values",
+        "calculate_wagon_daily_mileage",
+        "calculate_wagon_mileage_ne",
+        "calculate_wagon_service_mileage",
+        "count_idle_wagons",
+        "count_wagons_in_motion",
+    ),
+    "changing": (
+        "adding_wagon_service_periods",
+        "change_trains_daily_mileage",
+        "change_unhitched_wagons",
+        "update_wagon_service_period",
+        "update_wagons_attrs",
+        "unify_train_service_period",
+    ),
+    "classes": (
+        "DailyCounter",
+        "DateIntervals",
+        "DebugLog",
+        "FleetMileage",
+        "MileageRecord",
+        "MileageTable",
+        "Normatives",
+        "PlanningSession",
+        "RangeMaxTree",
+        "Registry",
+        "Train",
+        "Wagon",
+        "WagonTimeline",
+        "WorkCalendar",
+    ),
+    "confirmation": (
+        "confirm_possible_trains",
+    ),
+    "conversion": (
+        "EXTRA_DATA_COLUMNS",
+        "MAIN_DATA_COLUMNS",
+        "convert_confirmed_trains",
+        "convert_extra_wagons_attrs",
+        "convert_preplanned_services",
+        "convert_wagons_attrs",
+    ),
+    "creation": (
+        "create_columnar_file_output",
+        "create_debug_file_output",
+        "create_planning_session",
+        "create_sqlite_file_output",
+        "create_trains",
+        "create_wagons",
+    ),
+    "definition": (
+        "define_periods_startdates",
+        "define_periods_trains_queues",
+        "define_startdates_service_wagons",
+        "define_wagons_outside_service_periods",
+    ),
+    "longterm": (
+        "calculate_monthly_values",
+        "extend_transportation_values",
+        "format_long_term_services",
+        "plan_long_term_services",
+        "seed_preplanned_services",
+    ),
+    "main": (
+        "SERVICE_TYPES",
+        "parse_arguments",
+        "run_planning",
+    ),
+    "normatives": (
+        "mileage_frequency_standards",
+        "models_standards",
+        "service_duration_standards",
+    ),
+    "parsing": (
+        "PARSER_VERSION",
+        "StreamingTableParser",
+        "convert_start_date",
+        "pars_wagons_data",
+        "pars_wagons_data_cached",
+        "pars_wagons_data_streaming",
+        "read_columnar_file_header",
+        "read_columnar_file_output",
+        "read_columnar_file_outputs",
+        "read_sqlite_planned_services",
+    ),
+    "planning": (
+        "service_planning",
+    ),
+    "profiling": (
+        "Profiler",
+        "profile_stage",
+        "profiled",
+    ),
+    "replanning": (
+        "define_drifted_trains",
+        "define_kept_services",
+        "replan_services",
+    ),
+    "scenarios": (
+        "calculate_scenario_results",
+        "format_scenarios_results",
+        "init_scenario_worker",
+        "run_scenario",
+        "run_scenarios",
+    ),
+    "selection": (
+        "select_benchmark_data_path",
+        "select_cache_data_path",
+        "select_columnar_output_data_path",
+        "select_current_idle_end",
+        "select_debug_data_path",
+        "select_debug_level",
+        "select_extra_wagon_data_path",
+        "select_hitched_wagons",
+        "select_idle_wagons",
+        "select_line_motion_time",
+        "select_long_term_end_date",
+        "select_main_wagon_data_path",
+        "select_mileage_tolerance",
+        "select_output_data_path",
+        "select_planning_end_date",
+        "select_planning_inputs",
+        "select_possible_trains",
+        "select_preplanned_services",
+        "select_profiling_data_path",
+        "select_profiling_mode",
+        "select_scenarios",
+        "select_sqlite_output_data_path",
+        "select_text_result_data_path",
+        "select_transportation_values",
+        "select_unhitched_wagons",
+    ),
+    "utility": (
+        "daterange",
+        "check_input_dates_planning",
+        "check_input_dates_usage",
+        "get_work_calendar",
+        "print_result_services_to_file",
+        "print_service_wagons_to_file",
+        "print_standing_dates_to_file",
+        "workdate",
+        "workdayrange",
+    ),
+    "verification": (
+        "verify_allowed_service_start_date",
+        "verify_fleet_counters",
+        "verify_planning_results",
+    ),
+}
+
+# словарь вида {имя: модуль}
+exports_submodules = {name: submodule
+                      for submodule, names in submodules_exports.items()
+                      for name in names}
+
+__all__ = sorted(exports_submodules)
+
+
+def __getattr__(name):
+    """
+    Загружает модуль пакета, из которого экспортируется name,
+    и запоминает значение name в пакете.
+    """
+    submodule = exports_submodules.get(name)
+    if submodule is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{submodule}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(exports_submodules))
@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# **************************
+# src/__main__.py
+# **************************
+
+# Запуск пакета: python -m src [аргументы] (см. main.parse_arguments)
+
+import sys
+from .main import main
+
+sys.exit(main())
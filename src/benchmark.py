@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# **************************
+# src/benchmark.py
+# **************************
+
+__all__ = [
+    "BENCHMARK_HORIZONS",
+    "BENCHMARK_SIZES",
+    "generate_synthetic_exports",
+    "generate_synthetic_inputs",
+    "generate_synthetic_transportation_values",
+    "measure",
+    "run_benchmark",
+    "run_benchmarks",
+    "save_benchmark_results",
+    "write_synthetic_html_exports",
+]
+
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+if __name__ == "__main__" and not __package__:
+    # Запуск файлом (python benchmark.py): модули загружаются как пакет src
+    from os.path import abspath, basename, dirname
+    sys.path.insert(0, dirname(dirname(abspath(__file__))))
+    __package__ = basename(dirname(abspath(__file__)))
+
+from .classes import DebugLog, PlanningSession
+from .creation import create_planning_session, create_wagons
+
+# Размеры синтетического парка (количество сцепов) и горизонты планирования (лет)
+BENCHMARK_SIZES = (50, 200, 1000)
+BENCHMARK_HORIZONS = (1, 3, 10)
+
+# Модели вагонов сцепа по семействам (в порядке номеров вагонов в сцепе)
+# и первые цифры номеров вагонов каждой модели
+SYNTHETIC_MODELS = {
+    "81-722": (("81-722.3", 22), ("81-723.3", 23), ("81-724.3", 24)),
+    "81-556": (("81-556", 56), ("81-557", 57), ("81-558", 58)),
+    "81-556.1": (("81-556.1", 56), ("81-557.1", 57), ("81-558.1", 58)),
+    "81-556.2": (("81-556.2", 56), ("81-557.2", 57), ("81-558.2", 58)),
+}
+
+# Парности реальной выгрузки (select_transportation_values) и количество сцепов в ней,
+# синтетические парности масштабируются пропорционально количеству сцепов
+BASE_TRAINS_COUNT = 55
+BASE_WINTER_VALUES = {"workday": 390, "holiday": 350, "max": 26}
+BASE_SUMMER_VALUES = {"workday": 371, "holiday": 324, "max": 24}
+
+
+def generate_synthetic_transportation_values(trains_count: int,
+                                             start_date: datetime.date,
+                                             end_date: datetime.date):
+    """
+    Возвращает парности (см. select_transportation_values) для парка из trains_count сцепов
+    на период с start_date по end_date: летние (с 1 июня) и зимние (с 1 сентября) значения
+    реальной выгрузки, масштабированные пропорционально количеству сцепов.
+    """
+    ratio = trains_count / BASE_TRAINS_COUNT
+    res = {}
+    for year in range(start_date.year - 1, end_date.year + 1):
+        for period_start_date, base_values in ((datetime.date(year, 6, 1), BASE_SUMMER_VALUES),
+                                               (datetime.date(year, 9, 1), BASE_WINTER_VALUES)):
+            if period_start_date < end_date:
+                res[period_start_date] = {key: max(1, round(value * ratio))
+                                          for key, value in base_values.items()}
+    return res
+
+
+def generate_synthetic_exports(trains_count: int,
+                               train_lenght: int = 6,
+                               start_date: datetime.date = datetime.date(2022, 3, 31),
+                               seed: int = 0):
+    """
+    Детерминированно (при одинаковом seed) формирует необработанные атрибуты вагонов
+    синтетического парка из trains_count сцепов по train_lenght вагонов
+    моделей 81-722/723/724 и 81-556/557/558 на дату start_date.
+    Возвращает словарь вида:
+    {"raw_start_date": дата_начала_расчета,
+     "raw_main_wagons_attrs": {номер_строки: {индекс_столбца: значение}} (ТР-1 - КР),
+     "raw_extra_wagons_attrs": {номер_строки: {индекс_столбца: значение}} (ТО-1 - ТР-2)
+     }
+    Атрибуты имеют тот же вид, что и после парсинга выгрузок АСУ Депо
+    со столбцами MAIN_DATA_COLUMNS и EXTRA_DATA_COLUMNS.
+    Пробеги от ТОиР каждого сцепа равномерно распределены по межремонтному циклу ТР-3,
+    пробеги от более мелких видов ТОиР - остатки от деления на их средние нормы,
+    пробеги вагонов одного сцепа различаются не более чем на 50 км.
+    """
+    from .normatives import mileage_frequency_standards, models_standards
+
+    rng = random.Random(seed)
+    standards = models_standards(mileage_frequency_standards())
+    number_base = 10 ** max(4, len(str(trains_count * train_lenght)))
+    families = tuple(SYNTHETIC_MODELS)
+    blank = "\xa0"
+    raw_main_wagons_attrs = {}
+    raw_extra_wagons_attrs = {}
+    for train_number in range(1, trains_count + 1):
+        # 60% сцепов - модели 81-722, остальные - модификации 81-556
+        family = families[0] if rng.random() < 0.6 else rng.choice(families[1:])
+        models = SYNTHETIC_MODELS[family]
+        train_standards = standards[models[0][0]]
+        cycles = {service_type: (train_standards[service_type]["min"] +
+                                 train_standards[service_type]["max"]) // 2
+                  for service_type in ("tr3", "tr2", "tr1", "to2", "to1")}
+        mileage_tr3 = rng.randrange(1_000, train_standards["tr3"]["max"] * 9 // 10)
+        mileage_tr2 = mileage_tr3 % cycles["tr2"]
+        mileage_tr1 = mileage_tr2 % cycles["tr1"]
+        mileage_to2 = mileage_tr1 % cycles["to2"]
+        mileage_to1 = mileage_to2 % cycles["to1"]
+        mileage_ne = mileage_tr3 + rng.randrange(0, 5) * cycles["tr3"]
+        production_date = (datetime.date(2012, 1, 1) +
+                           datetime.timedelta(days=rng.randrange(8 * 365))).strftime("%d.%m.%Y")
+        for index in range(train_lenght):
+            wagon_model, number_prefix = models[index * len(models) // train_lenght]
+            wagon_number = number_prefix * number_base + (train_number - 1) * train_lenght + index + 1
+            noise = rng.randrange(50)
+            row = len(raw_main_wagons_attrs)
+            raw_main_wagons_attrs[row] = {0: "+",
+                                          1: str(train_number),
+                                          3: str(wagon_number),
+                                          4: production_date,
+                                          5: wagon_model,
+                                          6: str(mileage_ne + noise),
+                                          7: blank,
+                                          8: str(mileage_tr3 + noise),
+                                          13: str(mileage_tr1 + noise),
+                                          14: str(mileage_tr2 + noise)}
+            raw_extra_wagons_attrs[row] = {2: str(wagon_number),
+                                           3: "ТО-1",
+                                           5: str(mileage_to1 + noise),
+                                           6: "ТО-2",
+                                           8: str(mileage_to2 + noise),
+                                           11: str(mileage_tr1 + noise),
+                                           14: str(mileage_tr2 + noise)}
+    return {"raw_start_date": start_date.strftime("%d.%m.%Y"),
+            "raw_main_wagons_attrs": raw_main_wagons_attrs,
+            "raw_extra_wagons_attrs": raw_extra_wagons_attrs}
+
+
+def generate_synthetic_inputs(trains_count: int,
+                              years: int = 1,
+                              train_lenght: int = 6,
+                              start_date: datetime.date = datetime.date(2022, 3, 31),
+                              seed: int = 0):
+    """
+    Формирует исходные данные расчета (см. selection.select_planning_inputs)
+    для синтетического парка (см. generate_synthetic_exports) на years лет от start_date.
+    """
+    from .conversion import convert_extra_wagons_attrs, convert_wagons_attrs
+
+    exports = generate_synthetic_exports(trains_count, train_lenght, start_date, seed)
+    planning_end_date = start_date + datetime.timedelta(days=365 * years)
+    return {"raw_start_date": exports["raw_start_date"],
+            "wagons_attrs": convert_wagons_attrs(exports["raw_main_wagons_attrs"]),
+            "extra_wagons_attrs": convert_extra_wagons_attrs(exports["raw_extra_wagons_attrs"]),
+            "planning_end_date": planning_end_date,
+            "transportation_values": generate_synthetic_transportation_values(trains_count,
+                                                                              start_date,
+                                                                              planning_end_date),
+            "line_motion_time": 41.48333333333333,
+            "preplanned_services": []
+            }
+
+
+def write_synthetic_html_exports(exports: dict, write_dir):
+    """
+    Записывает необработанные атрибуты вагонов (см. generate_synthetic_exports)
+    в папку write_dir в виде html-файлов выгрузок
+    "Пробеги вагонов" и "Техническое обслуживание вагонов" АСУ Депо (кодировка cp1251).
+    Возвращает кортеж (путь_к_основному_файлу, путь_к_дополнительному_файлу).
+    """
+    res = []
+    for file_name, title, raw_attrs in (
+            ("main.html",
+             f"Пробеги вагонов по {exports['raw_start_date']}",
+             exports["raw_main_wagons_attrs"]),
+            ("extra.html",
+             "Техническое обслуживание вагонов",
+             exports["raw_extra_wagons_attrs"])):
+        columns_count = max(max(attrs) for attrs in raw_attrs.values()) + 1
+        write_path = os.path.join(write_dir, file_name)
+        with open(write_path, mode="wt", encoding="cp1251", newline="\r\n") as html_file:
+            print("<HTML><BODY>", "<TABLE>", "<THEAD>",
+                  f"<TR><TH>{title}</TH></TR>", "</THEAD>", "<TBODY>",
+                  sep="\n", file=html_file)
+            for attrs in raw_attrs.values():
+                print("<TR>", file=html_file)
+                for column in range(columns_count):
+                    value = attrs.get(column, "\xa0")
+                    print(f"<TD>{'&nbsp;' if value == chr(0xa0) else value}</TD>", file=html_file)
+                print("</TR>", file=html_file)
+            print("</TBODY>", "</TABLE>", "</BODY></HTML>", sep="\n", file=html_file)
+        res.append(write_path)
+    return tuple(res)
+
+
+def measure(function, repeat: int = 1):
+    """
+    Выполняет function() repeat раз.
+    Возвращает минимальное время выполнения в секундах.
+    """
+    res = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start_time
+        if res is None or elapsed < res:
+            res = elapsed
+    return res
+
+
+def run_benchmark(trains_count: int,
+                  years: int,
+                  service_types=("tr3", "tr2", "tr1"),
+                  repeat: int = 3,
+                  seed: int = 0):
+    """
+    Замеряет время этапов расчета для синтетического парка из trains_count сцепов
+    на years лет (см. generate_synthetic_inputs):
+    потоковый парсинг html-выгрузок с преобразованием атрибутов,
+    отдельно преобразование атрибутов и создание вагонов,
+    подготовку сессии (create_planning_session), полный расчет service_planning,
+    проверку результатов и расчетные функции calculate_*/count_* по итоговой сессии.
+    Быстрые этапы выполняются repeat раз (учитывается минимальное время),
+    подготовка сессии, расчет и проверка - один раз.
+    Функции, вызываемые только внутри цикла планирования (calculate_standing_dates и т.п.),
+    отдельно не замеряются и входят во время service_planning.
+    Вывод расчета в консоль отключается.
+    Возвращает словарь вида:
+    {"trains": количество_сцепов, "years": лет, "wagons": количество_вагонов,
+     "days": дней_в_периоде, "stages": {этап: секунды}}
+    """
+    from .calculation import (
+        calculate_fleet_mileage,
+        calculate_line_daily_mileage,
+        calculate_train_mileage_ne,
+        calculate_transportation_values,
+        calculate_wagon_daily_mileage,
+        calculate_wagon_service_mileage,
+        count_idle_wagons,
+        count_wagons_in_motion
+    )
+    from .conversion import (
+        EXTRA_DATA_COLUMNS,
+        MAIN_DATA_COLUMNS,
+        convert_extra_wagons_attrs,
+        convert_wagons_attrs
+    )
+    from .normatives import (
+        mileage_frequency_standards,
+        models_standards,
+        service_duration_standards
+    )
+    from .parsing import convert_start_date, pars_wagons_data_streaming
+    from .planning import service_planning
+    from .verification import verify_planning_results
+
+    exports = generate_synthetic_exports(trains_count, seed=seed)
+    planning_inputs = generate_synthetic_inputs(trains_count, years, seed=seed)
+    start_date = convert_start_date(planning_inputs["raw_start_date"])
+    end_date = planning_inputs["planning_end_date"]
+    stages = {}
+    stdout = sys.stdout
+    with tempfile.TemporaryDirectory() as temp_dir, \
+            open(os.devnull, mode="wt", encoding="utf-8") as devnull:
+        sys.stdout = devnull
+        try:
+            main_path, extra_path = write_synthetic_html_exports(exports, temp_dir)
+            stages["pars_wagons_data_streaming_main"] = measure(
+                lambda: pars_wagons_data_streaming(main_path, MAIN_DATA_COLUMNS, convert_wagons_attrs),
+                repeat)
+            stages["pars_wagons_data_streaming_extra"] = measure(
+                lambda: pars_wagons_data_streaming(extra_path, EXTRA_DATA_COLUMNS, convert_extra_wagons_attrs),
+                repeat)
+
+            stages["convert_wagons_attrs"] = measure(
+                lambda: convert_wagons_attrs(exports["raw_main_wagons_attrs"]), repeat)
+            wagons_session = PlanningSession()
+            wagons_session.models_mileage_standards = models_standards(mileage_frequency_standards())
+            wagons_session.models_duration_standards = models_standards(service_duration_standards())
+            stages["create_wagons"] = measure(
+                lambda: create_wagons(planning_inputs["wagons_attrs"], start_date, end_date,
+                                      session=wagons_session),
+                repeat)
+
+            session = PlanningSession()
+            session.debug_log = DebugLog(os.path.join(temp_dir, "debug.txt"))
+            stages["create_planning_session"] = measure(
+                lambda: create_planning_session(planning_inputs,
+                                                confirm_trains=lambda possible_trains: None,
+                                                current_idle_end=lambda idle_wagons, session: {},
+                                                session=session))
+            stages["service_planning"] = measure(
+                lambda: service_planning(service_types, session=session))
+            stages["verify_planning_results"] = measure(
+                lambda: verify_planning_results(service_types, session=session))
+            session.debug_log.close()
+
+            stages["calculate_transportation_values"] = measure(
+                lambda: calculate_transportation_values(start_date=start_date,
+                                                        end_date=end_date,
+                                                        basic_values=planning_inputs["transportation_values"],
+                                                        line_motion_time=planning_inputs["line_motion_time"]),
+                repeat)
+            stages["calculate_line_daily_mileage"] = measure(
+                lambda: calculate_line_daily_mileage(session=session), repeat)
+            stages["count_wagons_in_motion"] = measure(
+                lambda: count_wagons_in_motion(session=session), repeat)
+            stages["count_idle_wagons"] = measure(
+                lambda: count_idle_wagons(session=session), repeat)
+            stages["calculate_wagon_daily_mileage"] = measure(
+                lambda: calculate_wagon_daily_mileage(session=session), repeat)
+            stages["calculate_train_mileage_ne"] = measure(
+                lambda: calculate_train_mileage_ne(start_date, end_date, session=session), repeat)
+            stages["calculate_wagon_service_mileage"] = measure(
+                lambda: [calculate_wagon_service_mileage(wagon_number, "tr3", start_date, end_date,
+                                                         session=session)
+                         for train_object in session.trains.values()
+                         for wagon_number in train_object.wagons],
+                repeat)
+            stages["calculate_fleet_mileage"] = measure(
+                lambda: calculate_fleet_mileage("tr3", start_date, end_date, session=session), repeat)
+        finally:
+            sys.stdout = stdout
+    return {"trains": trains_count,
+            "years": years,
+            "wagons": len(planning_inputs["wagons_attrs"]),
+            "days": (end_date - start_date).days,
+            "stages": stages}
+
+
+def run_benchmarks(sizes=BENCHMARK_SIZES,
+                   horizons=BENCHMARK_HORIZONS,
+                   repeat: int = 3,
+                   seed: int = 0,
+                   verbose: bool = True):
+    """
+    Выполняет run_benchmark для всех сочетаний количества сцепов sizes и горизонтов horizons.
+    Возвращает словарь с результатами и сведениями об окружении вида:
+    {"created": дата_и_время, "commit": хэш_коммита_git (None - вне репозитория),
+     "python": версия_Python, "platform": платформа, "seed": seed,
+     "results": [результат_run_benchmark, ...]}
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    results = []
+    for trains_count in sizes:
+        for years in horizons:
+            result = run_benchmark(trains_count, years, repeat=repeat, seed=seed)
+            results.append(result)
+            if verbose:
+                print(f"Сцепов: {trains_count}, лет: {years}:",
+                      ", ".join(f"{stage} - {seconds:.3f} с"
+                                for stage, seconds in result["stages"].items()))
+    return {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "results": results}
+
+
+def save_benchmark_results(benchmark_results: dict, write_path):
+    """
+    Сохраняет результаты run_benchmarks в JSON-файл write_path
+    для сравнения производительности между коммитами.
+    """
+    with open(write_path, mode="wt", encoding="utf-8") as json_file:
+        json.dump(benchmark_results, json_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    import argparse
+    from .selection import select_benchmark_data_path
+
+    parser = argparse.ArgumentParser(description="Замер времени этапов расчета на синтетическом парке")
+    parser.add_argument("--trains", type=int, nargs="+", default=BENCHMARK_SIZES,
+                        help="количество сцепов")
+    parser.add_argument("--years", type=int, nargs="+", default=BENCHMARK_HORIZONS,
+                        help="горизонты планирования, лет")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="повторов для быстрых этапов")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=select_benchmark_data_path(),
+                        help="JSON-файл для результатов")
+    args = parser.parse_args()
+    save_benchmark_results(run_benchmarks(args.trains, args.years, args.repeat, args.seed),
+                           args.output)
+    print(f"Результаты сохранены в {args.output}")
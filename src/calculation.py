@@ -6,9 +6,12 @@
 # **************************
 
 __all__ = [
+    "calculate_fleet_mileage",
     "calculate_line_daily_mileage",
     "calculate_period_idle_max_value",
+    "calculate_periods_idle_max_values",
     "calculate_periods_surplus_wagons",
+    "calculate_reserve_wagons",
     "calculate_standing_dates",
     "calculate_standing_trains_wagons",
     "calculate_train_mileage_ne",
@@ -21,13 +24,16 @@ __all__ = [
     "count_wagons_in_motion",
 ]
 
+from array import array
 import datetime
-from utility import (
+from typing import Union
+from .utility import (
     check_input_dates_planning,
     check_input_dates_usage,
     daterange,
     workdayrange)
-from classes import Registry
+from .classes import DailyCounter, MileageTable, RangeMaxTree, Registry
+from .profiling import profiled
 
 
 def calculate_train_lenght(hitched_wagons: dict):
@@ -52,13 +58,14 @@ def calculate_holidays(start_date: datetime.date, end_date: datetime.date):
     Получает даты начала и конца расчетного периода.
     Возвращает множество дат, являющихся выходными или праздничными днями
     """
-    state_holidays = ("01.01", "02.01", "03.01", "04.01", "05.01", "06.01", "07.01",
-                      "08.01", "23.02", "08.03", "01.05", "02.05", "09.05", "12.06", "04.11")
+    # (день, месяц)
+    state_holidays = {(1, 1), (2, 1), (3, 1), (4, 1), (5, 1), (6, 1), (7, 1),
+                      (8, 1), (23, 2), (8, 3), (1, 5), (2, 5), (9, 5), (12, 6), (4, 11)}
     res = set()
     if start_date > end_date:
         start_date, end_date = end_date, start_date
     for date in daterange(start_date, end_date):
-        if date.strftime("%d.%m") in state_holidays:
+        if (date.day, date.month) in state_holidays:
             res.add(date)
             if date.month != 1:
                 if date.isoweekday() == 7:
@@ -71,6 +78,7 @@ def calculate_holidays(start_date: datetime.date, end_date: datetime.date):
     return res
 
 
+@profiled
 def calculate_transportation_values(*,
                                     start_date: datetime.date,
                                     end_date: datetime.date,
@@ -115,150 +123,277 @@ def calculate_transportation_values(*,
     return res
 
 
-def calculate_line_daily_mileage():
+@profiled
+def calculate_line_daily_mileage(session=None):
     """
     Вычисляет суммарный суточный пробег по линии
     в каждую дату из периода расчета и записывает его
     в словарь вида {дата: пробег} в Registry.line_daily_mileage
     """
+    if session is None:
+        session = Registry
     PAIR = 2
-    for date in daterange(Registry.planning_start_date, Registry.planning_end_date):
-        Registry.line_daily_mileage[date] = Registry.transportation_values[date]["pairs_count_sum"] * \
-            Registry.line_lenght * PAIR * Registry.train_lenght
+    for date in daterange(session.planning_start_date, session.planning_end_date):
+        session.line_daily_mileage[date] = session.transportation_values[date]["pairs_count_sum"] * \
+            session.line_lenght * PAIR * session.train_lenght
 
 
+@profiled
 def count_wagons_in_motion(start_date: datetime.date = None,
-                           end_date: datetime.date = None):
+                           end_date: datetime.date = None,
+                           session=None):
     """
     Подсчитывает количество вагонов в движении (находящихся в сцепе
     и не находящихся на ТОиР или в отстое) в каждую дату из заданного периода
-    и записывает его в словарь вида {дата: количество_вагонов_в_движении}
-    в Registry.wagons_in_motion
+    и записывает его в суточный счетчик (объект DailyCounter на период планирования)
+    в Registry.wagons_in_motion.
+    Далее счетчики поддерживаются в актуальном состоянии методом
+    Wagon.change_idle_reason, поэтому повторный полный подсчет
+    требуется только для проверки (см. verify_fleet_counters).
     """
+    if session is None:
+        session = Registry
     start_date, end_date = check_input_dates_planning(start_date,
-                                                      end_date)
-    for date in daterange(start_date, end_date):
-        counter = 0
-        for train in Registry.trains.values():
-            for wagon in train.wagons.values():
-                if date in wagon.mileage:
-                    if wagon.mileage[date]["idle_reason"] is None:
-                        counter += 1
-        Registry.wagons_in_motion[date] = counter
-
-
-def count_idle_wagons(idle_reason: str,
+                                                      end_date,
+                                                      session=session)
+    counters = [0] * (end_date - start_date).days
+    for train in session.trains.values():
+        for wagon in train.wagons.values():
+            mileage = wagon.mileage
+            offset = mileage.index(start_date)
+            idle_reasons = mileage.columns["idle_reason"]
+            for index in range(max(offset, 0), min(offset + len(counters), len(mileage))):
+                if not idle_reasons[index]:
+                    counters[index - offset] += 1
+    # счетчик ведется на весь период планирования, при его изменении формируется заново
+    wagons_in_motion = session.wagons_in_motion
+    if (wagons_in_motion is None or
+            (wagons_in_motion.start_date, wagons_in_motion.end_date) !=
+            (session.planning_start_date, session.planning_end_date)):
+        wagons_in_motion = DailyCounter(session.planning_start_date, session.planning_end_date)
+    first_index = wagons_in_motion.index(start_date)
+    wagons_in_motion.values[first_index:first_index + len(counters)] = array("l", counters)
+    session.wagons_in_motion = wagons_in_motion
+
+
+@profiled
+def count_idle_wagons(idle_reason: str = None,
                       start_date: datetime.date = None,
-                      end_date: datetime.date = None):
+                      end_date: datetime.date = None,
+                      session=None):
     """
     Подсчитывает количество вагонов в отстое по указанной причине
+    (по умолчанию - по каждой из возможных причин простоя)
     в каждую дату из заданного периода (по умолчанию - весь период планирования)
-    и записывает его в словарь вида {дата: {причина_простоя: количество_вагонов}
-    в Registry.idle_wagons
+    и записывает его в словарь вида {причина_простоя: объект_DailyCounter}
+    в Registry.idle_wagons.
+    Далее счетчики поддерживаются в актуальном состоянии методом
+    Wagon.change_idle_reason, поэтому повторный полный подсчет
+    требуется только для проверки (см. verify_fleet_counters).
     """
+    if session is None:
+        session = Registry
     start_date, end_date = check_input_dates_planning(start_date,
-                                                      end_date)
-    for date in daterange(start_date, end_date):
-        Registry.idle_wagons[date] = Registry.idle_wagons.get(date, {})
-        counter = 0
-        # Потом исправить, чтобы подсчет был по всем вагонам, а не только
-        # по сформированным в сцепы.
-        for train in Registry.trains.values():
-            for wagon in train.wagons.values():
-                if date in wagon.mileage:
-                    if wagon.mileage[date]["idle_reason"] == idle_reason:
-                        counter += 1
-        Registry.idle_wagons[date][idle_reason] = counter
-
-
+                                                      end_date,
+                                                      session=session)
+    idle_reasons_codes = ({MileageTable.codes[idle_reason]: idle_reason}
+                          if idle_reason is not None else
+                          {code: reason for code, reason in enumerate(MileageTable.reasons) if code})
+    days_count = (end_date - start_date).days
+    counters = {code: [0] * days_count for code in idle_reasons_codes}
+    # Потом исправить, чтобы подсчет был по всем вагонам, а не только
+    # по сформированным в сцепы.
+    for train in session.trains.values():
+        for wagon in train.wagons.values():
+            mileage = wagon.mileage
+            offset = mileage.index(start_date)
+            idle_reasons = mileage.columns["idle_reason"]
+            for index in range(max(offset, 0), min(offset + days_count, len(mileage))):
+                code = idle_reasons[index]
+                if code in counters:
+                    counters[code][index - offset] += 1
+    for code, reason in idle_reasons_codes.items():
+        idle_wagons = session.idle_wagons.get(reason)
+        if (idle_wagons is None or
+                (idle_wagons.start_date, idle_wagons.end_date) !=
+                (session.planning_start_date, session.planning_end_date)):
+            idle_wagons = DailyCounter(session.planning_start_date, session.planning_end_date)
+        first_index = idle_wagons.index(start_date)
+        idle_wagons.values[first_index:first_index + days_count] = array("l", counters[code])
+        session.idle_wagons[reason] = idle_wagons
+        session.idle_wagons_index[reason] = RangeMaxTree(list(idle_wagons.values))
+
+
+@profiled
 def calculate_wagon_daily_mileage(start_date: datetime.date = None,
                                   end_date: datetime.date = None,
-                                  usage_ratio: float = 1.0):
+                                  usage_ratio: float = 1.0,
+                                  session=None):
     """
     Вычисляет суточный пробег одного вагона, находящегося в движении,
     в каждую дату из заданного периода и записывает его в словарь
     вида {дата: пробег_вагона} в Registry.wagon_daily_mileage
     """
+    if session is None:
+        session = Registry
     start_date, end_date = check_input_dates_planning(start_date,
-                                                      end_date)
+                                                      end_date,
+                                                      session=session)
     for date in daterange(start_date, end_date):
-        Registry.wagon_daily_mileage[date] = int(Registry.line_daily_mileage[date] * usage_ratio //
-                                                 Registry.wagons_in_motion[date])
+        session.wagon_daily_mileage[date] = int(session.line_daily_mileage[date] * usage_ratio //
+                                                session.wagons_in_motion[date])
 
 
+@profiled
 def calculate_wagon_mileage_ne(wagon_number: int,
                                start_date: datetime.date = None,
-                               end_date: datetime.date = None):
+                               end_date: datetime.date = None,
+                               session=None):
     """
     Вычисляет для указанного вагона значение пробега от н.э. на каждую дату
     из заданного периода эксплуатации вагона на основании значения суточного пробега
-    и пробега от н.э. на предыдущую дату
+    и пробега от н.э. на предыдущую дату.
+    Если период не указан, пробег пересчитывается только начиная с первой даты,
+    требующей пересчета (см. MileageTable.recalculate).
     """
-    date_delta = datetime.timedelta(days=1)
+    if session is None:
+        session = Registry
+    mileage = session.wagons[wagon_number].mileage
+    if start_date is None and end_date is None:
+        mileage.recalculate(("ne",))
+        return
     start_date, end_date = check_input_dates_usage(wagon_number,
                                                    start_date,
-                                                   end_date)
-    wagon_object = Registry.wagons[wagon_number]
-    for date in daterange(start_date, end_date - date_delta):
-        wagon_object.mileage[date + date_delta]["ne"] = (wagon_object.mileage[date]["ne"] +
-                                                         wagon_object.mileage[date]["daily"])
+                                                   end_date,
+                                                   session=session)
+    mileage.accumulate_mileage_ne(mileage.index(start_date) + 1,
+                                  mileage.index(end_date))
 
 
+@profiled
 def calculate_train_mileage_ne(start_date: datetime.date = None,
-                               end_date: datetime.date = None):
+                               end_date: datetime.date = None,
+                               session=None):
     """
     Вычисляет для вагонов в движении значение пробега от н.э. на каждую дату
     из заданного периода эксплуатации вагона на основании значения суточного пробега
     и пробега от н.э. на предыдущую дату
     """
-    for train in Registry.trains.values():
-        for wagon_number in train.wagons.keys():
-            calculate_wagon_mileage_ne(wagon_number,
-                                       start_date,
-                                       end_date)
+    calculate_fleet_mileage(None, start_date, end_date, session=session)
 
 
+@profiled
 def calculate_wagon_service_mileage(wagon_number: int,
                                     service_type: str,
                                     start_date: datetime.date = None,
                                     end_date: datetime.date = None,
-                                    ):
+                                    session=None):
     """
     Получает номер вагона, для которого в указанный период
     (если период не указан, то за весь срок эксплуатации вагона)
     расчитывает и заполняет пробеги от указанного вида ТОиР
-    и от более крупных видов ТОиР
+    и от более крупных видов ТОиР.
+    Если период не указан, пробеги пересчитываются только начиная с первой даты,
+    требующей пересчета (см. MileageTable.recalculate).
     """
+    if session is None:
+        session = Registry
     datedelta = datetime.timedelta(days=1)
     if service_type in ("tr3", "tr2", "tr1", "to3", "to2", "to1"):
         service_type = service_type
     elif service_type in ("sr", "kr"):
         service_type = "kr_sr"
+    services = ("kr_sr", "tr3", "tr2", "tr1", "to3", "to2", "to1")
+    if start_date is None and end_date is None:
+        session.wagons[wagon_number].mileage.recalculate(
+            services[:services.index(service_type) + 1]
+            if service_type in services else
+            services)
+        return
     if (start_date is None or
-            start_date == Registry.wagons[wagon_number].usage_start_date):
-        start_date = Registry.wagons[wagon_number].usage_start_date + datedelta
+            start_date == session.wagons[wagon_number].usage_start_date):
+        start_date = session.wagons[wagon_number].usage_start_date + datedelta
     else:
         start_date = start_date
     if end_date is None:
-        end_date = Registry.wagons[wagon_number].usage_end_date
+        end_date = session.wagons[wagon_number].usage_end_date
     else:
         end_date = end_date
-    mileage = Registry.wagons[wagon_number].mileage
-    for date in daterange(start_date, end_date):
-        previous_date = date - datedelta
-        for service in ("kr_sr", "tr3", "tr2", "tr1", "to3", "to2", "to1"):
-            if mileage[previous_date][service] is not None:
-                date_service_mileage = mileage[date][service]
-                if (date_service_mileage is None or
-                        date_service_mileage > 0):
-                    mileage[date][service] = (mileage[previous_date][service] +
-                                              mileage[previous_date]["daily"])
-            if service == service_type:
-                break
+    mileage = session.wagons[wagon_number].mileage
+    first_index = mileage.index(start_date)
+    last_index = mileage.index(end_date)
+    for service in services:
+        mileage.accumulate_service_mileage(service,
+                                           first_index,
+                                           last_index)
+        if service == service_type:
+            break
+
+
+@profiled
+def calculate_fleet_mileage(service_type: Union[str, None],
+                            start_date: datetime.date = None,
+                            end_date: datetime.date = None,
+                            session=None):
+    """
+    Для всех вагонов всех сцепов в заданном периоде
+    (по умолчанию - за период эксплуатации каждого вагона)
+    пересчитывает пробег от н.э., а при указании вида ТОиР - и пробеги
+    от указанного вида ТОиР и от более крупных видов ТОиР
+    (аналог calculate_train_mileage_ne и calculate_wagon_service_mileage для всех вагонов).
+    Пробеги вычисляются как накопленные суммы суточных пробегов,
+    которые для пробегов от ТОиР начинаются заново с дат выполнения ТОиР.
+    Если период не указан, пересчитываются только пробеги вагонов,
+    измененные с предыдущего пересчета, начиная с первой измененной даты
+    (см. MileageTable.recalculate).
+    """
+    if session is None:
+        session = Registry
+    if service_type in ("sr", "kr"):
+        service_type = "kr_sr"
+    services = ("kr_sr", "tr3", "tr2", "tr1", "to3", "to2", "to1")
+    if service_type is None:
+        services = ()
+    elif service_type in services:
+        services = services[:services.index(service_type) + 1]
+    for train in session.trains.values():
+        for wagon_number, wagon_object in train.wagons.items():
+            mileage = wagon_object.mileage
+            if start_date is None and end_date is None:
+                mileage.recalculate(("ne",) + services)
+                continue
+            first_date, last_date = check_input_dates_usage(wagon_number,
+                                                            start_date,
+                                                            end_date,
+                                                            session=session)
+            first_index = mileage.index(first_date) + 1
+            last_index = mileage.index(last_date)
+            mileage.accumulate_mileage_ne(first_index, last_index)
+            for service in services:
+                mileage.accumulate_service_mileage(service,
+                                                   first_index,
+                                                   last_index)
+
+
+def calculate_reserve_wagons(wagons_in_motion: int,
+                             trains_count_max: int,
+                             session=None):
+    """
+    Возвращает количество вагонов сверх максимальной парности (резерв вагонов):
+    количество вагонов в движении wagons_in_motion за вычетом вагонов составов,
+    необходимых для выдачи при максимальной часовой парности trains_count_max
+    (длина состава - из сессии, по умолчанию - Registry).
+    """
+    if session is None:
+        session = Registry
+    pair_trains = 2
+    return wagons_in_motion - trains_count_max * pair_trains * session.train_lenght
 
 
+@profiled
 def calculate_periods_surplus_wagons(standing_dates: dict,
-                                     verbose: bool = False):
+                                     verbose: bool = False,
+                                     session=None):
     """
     В standing_dates для каждого диапазона дат возможного выполнения ТОиР
     определяет минимальное количество вагонов сверх максимальной парности
@@ -268,23 +403,24 @@ def calculate_periods_surplus_wagons(standing_dates: dict,
     количество вагонов, которое можно поставить в ТОиР посоставно, и указывает его
     в качестве значения "available_train_services_count" для каждой группы периодов.
     """
-    pair_trains = 2
+    if session is None:
+        session = Registry
     for delta, priorities in standing_dates.items():
         for priority, priority_data in priorities.items():
             standing_dates[delta][priority]["available_train_services_count"] = 0
             for period in sorted(priority_data["periods"].keys()):
                 start_date, end_date = period
                 daily_surplus_wagons = []
-                for date in workdayrange(start_date, end_date):
-                    max_date_pairs = Registry.transportation_values[date]["trains_count_max"]
-                    wagons_in_motion = Registry.wagons_in_motion[date]
-                    calc_result = wagons_in_motion - max_date_pairs * \
-                        pair_trains * Registry.train_lenght
+                for date in workdayrange(start_date, end_date, session=session):
+                    calc_result = calculate_reserve_wagons(
+                        session.wagons_in_motion[date],
+                        session.transportation_values[date]["trains_count_max"],
+                        session=session)
                     daily_surplus_wagons.append(calc_result)
                 if len(daily_surplus_wagons):
                     surplus_wagons_count = min(daily_surplus_wagons)
                     standing_dates[delta][priority]["periods"][period]["surplus_wagons_count"] = surplus_wagons_count
-                    if surplus_wagons_count // Registry.train_lenght >= 1:
+                    if surplus_wagons_count // session.train_lenght >= 1:
                         standing_dates[delta][priority]["available_train_services_count"] += surplus_wagons_count
                     if verbose:
                         if surplus_wagons_count <= 0:
@@ -296,23 +432,65 @@ def calculate_periods_surplus_wagons(standing_dates: dict,
 def calculate_period_idle_max_value(start_date: datetime.date,
                                     end_date: datetime.date,
                                     idle_reason: str,
-                                    verbose: bool = False):
+                                    verbose: bool = False,
+                                    session=None):
     """
     Определяет максимальное значение количества заданного вида ТОиР
     в указанном диапазоне дат и возвращает это максимальное значение.
+    При наличии в Registry.idle_wagons_index дерева отрезков для этого вида ТОиР
+    значение определяется по нему за логарифмическое время.
     """
+    if session is None:
+        session = Registry
     start_date, end_date = check_input_dates_planning(start_date,
-                                                      end_date)
-    res = max(Registry.idle_wagons[date][idle_reason]
-              for date in daterange(start_date, end_date))
+                                                      end_date,
+                                                      session=session)
+    idle_wagons_index = session.idle_wagons_index.get(idle_reason)
+    if idle_wagons_index is None:
+        res = max(session.idle_wagons[idle_reason][date]
+                  for date in daterange(start_date, end_date))
+    else:
+        res = idle_wagons_index.max((start_date - session.planning_start_date).days,
+                                    (end_date - session.planning_start_date).days)
     if verbose:
         print(f"В диапазоне {[str(start_date), str(end_date)]}",
               f"максимальное количество {idle_reason} = {res}")
     return res
 
 
+@profiled
+def calculate_periods_idle_max_values(periods,
+                                      idle_reason: str,
+                                      session=None):
+    """
+    Получает диапазоны дат вида [(начальная_дата, конечная_дата), ...].
+    Для каждого диапазона определяет максимальное значение количества заданного вида ТОиР
+    в этом диапазоне и максимальное значение во всех остальных диапазонах (не менее нуля).
+    Возвращает словарь вида {(начальная_дата, конечная_дата): (максимум_в_диапазоне,
+                                                               максимум_в_остальных_диапазонах)}.
+    """
+    periods_max_values = {(start_date, end_date): calculate_period_idle_max_value(start_date,
+                                                                                 end_date,
+                                                                                 idle_reason,
+                                                                                 session=session)
+                          for start_date, end_date in periods}
+    first_max_value = second_max_value = 0
+    first_max_period = None
+    for period, max_value in periods_max_values.items():
+        if max_value > first_max_value:
+            first_max_value, second_max_value = max_value, first_max_value
+            first_max_period = period
+        elif max_value > second_max_value:
+            second_max_value = max_value
+    return {period: (max_value,
+                     second_max_value if period == first_max_period else first_max_value)
+            for period, max_value in periods_max_values.items()}
+
+
+@profiled
 def calculate_standing_dates(service_type: str,
-                             service_wagons: dict):
+                             service_wagons: dict,
+                             session=None):
     """
     Внутри периода планирования определяет диапазоны дат возможного выполнения ТОиР.
     Формирует файл standing_dates вида:
@@ -348,9 +526,12 @@ def calculate_standing_dates(service_type: str,
                       }
                             }
     """
-    from utility import workdate
+    from .utility import workdate
 
-    durations = {Registry.wagons[wagon_number].define_wagon_service_duration(service_type)
+    if session is None:
+        session = Registry
+
+    durations = {session.wagons[wagon_number].define_wagon_service_duration(service_type)
                  for wagon_number in service_wagons.keys()}
     standing_dates = {}
     for delta in durations:
@@ -362,8 +543,8 @@ def calculate_standing_dates(service_type: str,
         if service_type in ("kr", "sr", "tr3"):
             # Старый вариант (цепочка непрерывных диапазонов
             # от конца периода планирования к началу)
-            start_date = Registry.planning_end_date
-            end_date = Registry.planning_start_date + delta
+            start_date = session.planning_end_date
+            end_date = session.planning_start_date + delta
             subdelta = datetime.timedelta(days=int(delta.days/2))
             for date in daterange(start_date, end_date, -delta):
                 standing_dates[delta]["main"]["periods"][(
@@ -384,15 +565,15 @@ def calculate_standing_dates(service_type: str,
         # Для режима работы ремонтного участка 5/2
         # elif service_type in ("tr2", "tr1", "to3", "to2, to1"):
         else:
-            start_date = Registry.planning_start_date
-            end_date = Registry.planning_end_date
+            start_date = session.planning_start_date
+            end_date = session.planning_end_date
             nextday = datetime.timedelta(days=1)
             date = start_date
             while True:
                 if date >= end_date:
                     break
-                date_is_holiday = Registry.transportation_values[date]["holiday"]
-                last_date = workdate(date, delta)
+                date_is_holiday = session.transportation_values[date]["holiday"]
+                last_date = workdate(date, delta, session=session)
                 if not date_is_holiday:
                     if last_date is not None:
                         if date.month == last_date.month or\
@@ -410,49 +591,55 @@ def calculate_standing_dates(service_type: str,
     return standing_dates
 
 
+@profiled
 def calculate_standing_trains_wagons(service_type,
                                      service_wagons,
                                      standing_dates,
                                      sim_service_trains,
-                                     single_service_wagons):
+                                     single_service_wagons,
+                                     session=None):
     """
     В standing_dates для каждого диапазона дат возможного выполнения ТОиР
     определяем из service_wagons сцепы, которые должны вставать в ТОиР посоставно,
     и вагоны, которые должны вставать в ТОиР по одиночке.
     Указываем их в "trains" и "single_wagons" соответственно.
+    Вагоны для каждого периода берутся из индекса дат начала периодов
+    (см. define_startdates_service_wagons).
     """
+    from .definition import define_startdates_service_wagons
+
+    if session is None:
+        session = Registry
+
+    startdates_service_wagons = define_startdates_service_wagons(service_wagons,
+                                                                 standing_dates)
+    sim_service_trains = set(sim_service_trains)
+    single_service_wagons = set(single_service_wagons)
+    serv_type = ("kr_sr"
+                 if service_type in ("kr", "sr") else
+                 service_type)
     for delta, priorities in standing_dates.items():
+        startdates_wagons = startdates_service_wagons[delta]
         for priority, priority_data in priorities.items():
             for period, period_data in priority_data["periods"].items():
                 start_date, end_date = period
                 period_data["single_wagons"] = {}
                 period_data["trains"] = {}
-                for wagon_number, periods_deltas in service_wagons.items():
-                    # debug
-                    # if wagon_number in (56009, 56010, 57009, 57010, 58009, 58010):
-                    #     print(f"Вагон № {wagon_number}, диапазоны дат начала ТОиР:"
-                    #           f"{sorted([(str(datelist[0]), str(datelist[-1])) for datelist in service_wagons[wagon_number]['periods'] if len(datelist)])}")
-                    if periods_deltas["delta"] == delta:
-                        for dates in periods_deltas["periods"]:
-                            if start_date in dates:
-                                mileage = Registry.wagons[wagon_number].mileage[start_date]
-                                for wagon_models, mileage_standards in Registry.mileage_standards.items():
-                                    if Registry.wagons[wagon_number].wagon_model in wagon_models:
-                                        max_mileage = mileage_standards[service_type]["max"]
-                                serv_type = ("kr_sr"
-                                             if service_type in ("kr", "sr") else
-                                             service_type)
-                                service_mileage = (mileage["ne"]
-                                                   if mileage[serv_type] is None else
-                                                   mileage[serv_type])
-                                service_mileage_percentage = service_mileage / max_mileage
-                                if wagon_number in single_service_wagons:
-                                    period_data["single_wagons"][wagon_number] = service_mileage_percentage
-                                else:
-                                    train_obj = Registry.trains[Registry.wagons[wagon_number].train_number]
-                                    if train_obj in sim_service_trains:
-                                        train_mileage_percentage = period_data["trains"].get(
-                                            train_obj)
-                                        if (train_mileage_percentage is None or
-                                                train_mileage_percentage < service_mileage_percentage):
-                                            period_data["trains"][train_obj] = service_mileage_percentage
+                for wagon_number in startdates_wagons.get(start_date, ()):
+                    wagon_object = session.wagons[wagon_number]
+                    mileage = wagon_object.mileage[start_date]
+                    max_mileage = wagon_object.mileage_standards[service_type]["max"]
+                    service_mileage = (mileage["ne"]
+                                       if mileage[serv_type] is None else
+                                       mileage[serv_type])
+                    service_mileage_percentage = service_mileage / max_mileage
+                    if wagon_number in single_service_wagons:
+                        period_data["single_wagons"][wagon_number] = service_mileage_percentage
+                    else:
+                        train_obj = session.trains[wagon_object.train_number]
+                        if train_obj in sim_service_trains:
+                            train_mileage_percentage = period_data["trains"].get(
+                                train_obj)
+                            if (train_mileage_percentage is None or
+                                    train_mileage_percentage < service_mileage_percentage):
+                                period_data["trains"][train_obj] = service_mileage_percentage
@@ -16,45 +16,31 @@ __all__ = [
 ]
 
 import datetime
-from classes import Registry, Train
+from .classes import DateIntervals, Registry, Train
+from .profiling import profiled
 from typing import Union
-from utility import daterange
+from .utility import daterange
 
 
-def update_wagons_attrs(raw_wagons_attrs: dict):
+@profiled
+def update_wagons_attrs(extra_wagons_attrs: list, session=None):
     """ 
-    Получает словарь со списками необработанных атрибутов после парсинга дополнительного файла html.
+    Получает список со словарями обработанных атрибутов дополнительного файла html
+    (см. conversion.convert_extra_wagons_attrs).
     Вносит информацию о пробегах от ТО-2 (ТО-1 для АТП) и ТО-3 (ТО-2 для АТП) в объекты вагонов.
     """
-    for i, attrs in raw_wagons_attrs.items():
-        try:
-            wagon_number = int(attrs[2])
-        except ValueError:
-            print(f"Лог функции update_wagons_attrs.\
-                  Для {i} ключа некорректное значение номера вагона {attrs[2]}.")
-            continue
-        wagon_object = Registry.wagons.get(wagon_number)
+    if session is None:
+        session = Registry
+    for attrs in extra_wagons_attrs:
+        wagon_number = attrs["wagon_number"]
+        wagon_object = session.wagons.get(wagon_number)
         if wagon_object is None:
             continue
         else:
             start_date = wagon_object.usage_start_date
             wagon_mileage_0 = wagon_object.mileage[start_date]
-            if attrs[14] == "\xa0":
-                mileage_tr2_0 = None
-            else:
-                try:
-                    mileage_tr2_0 = int(attrs[14])
-                except ValueError:
-                    print(f"Лог функции update_wagons_attrs.\
-                      Для {i} ключа некорректное значение пробега от ТР-2 {attrs[14]}")
-            if attrs[11] == "\xa0":
-                mileage_tr1_0 = None
-            else:
-                try:
-                    mileage_tr1_0 = int(attrs[11])
-                except ValueError:
-                    print(f"Лог функции update_wagons_attrs.\
-                      Для {i} ключа некорректное значение пробега от ТР-1 {attrs[11]}")
+            mileage_tr2_0 = attrs["mileage_tr2_0"]
+            mileage_tr1_0 = attrs["mileage_tr1_0"]
             correct_data_flag = False
             if (mileage_tr2_0 == wagon_mileage_0["tr2"] or
                     (mileage_tr2_0 < 100 and wagon_mileage_0["tr2"] == 0)):
@@ -70,81 +56,28 @@ def update_wagons_attrs(raw_wagons_attrs: dict):
                       '"Пробеги вагонов" и "Техническое обслуживание вагонов" АСУ Депо не совпадают!',
                       "Убедитесь, что выгрузки сделаны в одну дату.")
             if correct_data_flag:
-                # ТО-3 (ТО-2 для АТП)
-                if attrs[6] == "ТО-3":
-                    if attrs[8] == "\xa0":
-                        mileage_to3_0 = None
-                    else:
-                        try:
-                            mileage_to3_0 = int(attrs[8])
-                            if (wagon_mileage_0["tr2"] == 0 and
-                                wagon_mileage_0["tr1"] == 0 and
-                                    mileage_to3_0 < 100):
-                                wagon_mileage_0["to3"] = 0
-                            else:
-                                wagon_mileage_0["to3"] = mileage_to3_0
-                        except ValueError:
-                            print(f"Лог функции update_wagons_attrs.\
-                            Для {i} ключа некорректное значение пробега от ТО-3 {attrs[8]}")
-                elif attrs[6] == "ТО-2":
-                    if attrs[8] == "\xa0":
-                        mileage_to2_0 = None
+                for service_type, service_mileage_0 in attrs["services_mileage_0"]:
+                    if (wagon_mileage_0["tr2"] == 0 and
+                        wagon_mileage_0["tr1"] == 0 and
+                            service_mileage_0 < 100):
+                        wagon_mileage_0[service_type] = 0
                     else:
-                        try:
-                            mileage_to2_0 = int(attrs[8])
-                            if (wagon_mileage_0["tr2"] == 0 and
-                                wagon_mileage_0["tr1"] == 0 and
-                                    mileage_to2_0 < 100):
-                                wagon_mileage_0["to2"] = 0
-                            else:
-                                wagon_mileage_0["to2"] = mileage_to2_0
-                        except ValueError:
-                            print(f"Лог функции update_wagons_attrs.\
-                            Для {i} ключа некорректное значение пробега от ТО-2 {attrs[8]}")
-                # ТО-2 (ТО-1 для АТП)
-                if attrs[3] == "ТО-2":
-                    if attrs[5] == "\xa0":
-                        mileage_to2_0 = None
-                    else:
-                        try:
-                            mileage_to2_0 = int(attrs[5])
-                            if (wagon_mileage_0["tr2"] == 0 and
-                                wagon_mileage_0["tr1"] == 0 and
-                                    mileage_to2_0 < 100):
-                                wagon_mileage_0["to2"] = 0
-                            else:
-                                wagon_mileage_0["to2"] = mileage_to2_0
-                        except ValueError:
-                            print(f"Лог функции update_wagons_attrs.\
-                            Для {i} ключа некорректное значение пробега от ТО-2 {attrs[5]}")
-                elif attrs[3] == "ТО-1":
-                    if attrs[5] == "\xa0":
-                        mileage_to1_0 = None
-                    else:
-                        try:
-                            mileage_to1_0 = int(attrs[5])
-                            if (wagon_mileage_0["tr2"] == 0 and
-                                wagon_mileage_0["tr1"] == 0 and
-                                    mileage_to1_0 < 100):
-                                wagon_mileage_0["to1"] = 0
-                            else:
-                                wagon_mileage_0["to1"] = mileage_to1_0
-                        except ValueError:
-                            print(f"Лог функции update_wagons_attrs.\
-                            Для {i} ключа некорректное значение пробега от ТО-1 {attrs[5]}")
+                        wagon_mileage_0[service_type] = service_mileage_0
 
 
-def change_unhitched_wagons(wagon_number: int, *, add: bool):
+def change_unhitched_wagons(wagon_number: int, *, add: bool, session=None):
     """
     Получает список с номерами вагонов, которые нужно:
     добавить в словарь unhitched_wagons (при add=True)
     или убрать из словаря unhitched_wagons (при add=False).
     Изменяет на месте словарь unhitched_wagons вида {номер_вагона: объект_вагона}
     """
+    if session is None:
+        session = Registry
     if add:
-        Registry.unhitched_wagons[wagon_number] = Registry.wagons[wagon_number]
+        session.unhitched_wagons[wagon_number] = session.wagons[wagon_number]
     elif not add:
-        Registry.unhitched_wagons.pop(
+        session.unhitched_wagons.pop(
             wagon_number, f"Вагон {wagon_number} в словаре невцепленных вагонов отсутствует!")
 
 # Пока нигде не применяется
@@ -204,65 +137,96 @@ def change_unhitched_wagons(wagon_number: int, *, add: bool):
 #                 f"Для вагона №{wagon_number} на {date} уже стоит отметка о допустимой постановке на {new_service}")
 
 
-def change_trains_daily_mileage():
+@profiled
+def change_trains_daily_mileage(session=None):
     """
     Устанавливает для вагонов (находящихся в движении) всех сцепов
     значение суточного пробега, равное значению из Registry.wagon_daily_mileage,
     на каждую дату из периода эксплуатации вагона
     """
-    for train in Registry.trains.values():
+    if session is None:
+        session = Registry
+    for train in session.trains.values():
         for wagon in train.wagons.values():
+            mileage = wagon.mileage
+            idle_reasons = mileage.columns["idle_reason"]
+            mileage_daily = mileage.columns["daily"]
+            first_changed_index = None
             for date in daterange(wagon.usage_start_date, wagon.usage_end_date):
-                if wagon.mileage[date]["idle_reason"] is None:
-                    wagon.mileage[date]["daily"] = Registry.wagon_daily_mileage[date]
+                index = mileage.index(date)
+                if not idle_reasons[index]:
+                    daily_mileage = session.wagon_daily_mileage[date]
+                    if mileage_daily[index] != daily_mileage:
+                        mileage_daily[index] = daily_mileage
+                        if first_changed_index is None:
+                            first_changed_index = index
+            if first_changed_index is not None:
+                mileage.invalidate(first_changed_index)
 
 
+@profiled
 def adding_wagon_service_periods(wagon_number: int,
-                                 date: datetime.date,
-                                 service_wagons: dict):
+                                 start_date: datetime.date,
+                                 end_date: datetime.date,
+                                 service_wagons: dict,
+                                 session=None):
     """
     Проверяет наличие ключа (номера вагона) в словаре service_wagons.
     При отсутствии создает соотвествующую пару ключ-значение со структурой данных.
     При наличии формирует в service_wagons[wagon_number]["periods"] список
     со списками непрерывных диапазонов дат, в которые возможно выполнение ТОиР.
+    Даты добавляются по порядку из диапазона от start_date (включая)
+    до end_date (не включая) - см. Wagon.define_allowed_service_periods.
     """
+    if session is None:
+        session = Registry
     service_wagons[wagon_number] = service_wagons.get(
-        wagon_number, {"periods": [[]]})
-    next_date = date + datetime.timedelta(days=1)
+        wagon_number, {"periods": [DateIntervals()]})
     periods = service_wagons[wagon_number]["periods"]
-    if next_date < Registry.wagons[wagon_number].usage_end_date:
-        next_date_mileage = Registry.wagons[wagon_number].mileage[next_date]
+    wagon_object = session.wagons[wagon_number]
+    mileage = wagon_object.mileage
+    daily_mileage = mileage.columns["daily"]
+    last_index = min(mileage.index(end_date), len(mileage) - 1)
+    for index in range(mileage.index(start_date), last_index):
+        date = mileage.date(index)
+        # отсутствующий пробег (MileageTable.NONE) равнозначен нулевому
+        next_date_daily = daily_mileage[index + 1] > 0
         if len(periods[-1]):
             if (date - periods[-1][-1]).days == 1:
-                if next_date_mileage["daily"]:
-                    periods[-1].append(date)
+                if next_date_daily:
+                    periods[-1].add(date)
                 else:
                     periods.pop()
                     if not len(periods):
-                        periods.append([])
+                        periods.append(DateIntervals())
             elif (date - periods[-1][-1]).days > 1:
-                if all([date not in period for period in periods]):
-                    if next_date_mileage["daily"]:
-                        periods.append([date])
+                if all(date not in period for period in periods):
+                    if next_date_daily:
+                        periods.append(DateIntervals((date,)))
         else:
-            if next_date_mileage["daily"]:
-                periods[-1].append(date)
+            if next_date_daily:
+                periods[-1].add(date)
 
 
+@profiled
 def update_wagon_service_period(wagon_number: int,
                                 service_type: str,
-                                service_wagons: dict):
+                                service_wagons: dict,
+                                session=None):
     """
     Если для вагона предзапланировано выполнении вида ТОиР,
     определяет результирующий диапазон дат возможной постановки вагона 
     на этот вид ТОиР с учетом предзапланированного периода, 
     а для ТР-2 и меньших видов ТОиР - и с учетом выходных.    
     """
-    from verification import verify_allowed_service_start_date
+    from .verification import verify_allowed_service_start_date
+
+    if session is None:
+        session = Registry
 
     wagon_data = service_wagons[wagon_number]
-    wagon_preplanned_services = Registry.wagons[wagon_number].preplanned_services
-    duration = Registry.wagons[wagon_number].define_wagon_service_duration(
+    wagon_preplanned_services = session.wagons[wagon_number].preplanned_services
+    duration = session.wagons[wagon_number].define_wagon_service_duration(
         service_type)
     service_wagons[wagon_number]["delta"] = duration
     if wagon_preplanned_services is not None:
@@ -274,20 +238,17 @@ def update_wagon_service_period(wagon_number: int,
                 # print(f"Для вагона {wagon_number} доступные интервалы {service_type} до изменения:",
                 #       f"{[(str(spis[0]), str(spis[-1])) for spis in service_wagons[wagon_number]['periods'] if len(spis)]}",
                 #       f"предзапланированные интервалы: {[(str(spis[0]), str(spis[-1])) for spis in wagon_preplanned_services[service_type]]}")
-                preplanned_dates = {
-                    date for date in daterange(start_date, end_date)}
+                preplanned_dates = DateIntervals.from_range(start_date, end_date)
                 for list_index in range(len(wagon_data["periods"])):
-                    date_list = wagon_data["periods"][list_index]
-                    dates = set(date_list)
-                    x_dates = preplanned_dates & dates
-                    if len(x_dates):
+                    date_list = wagon_data["periods"][list_index] & preplanned_dates
+                    if len(date_list):
                         no_intersections_flag = False
-                        date_list = sorted(list(x_dates))
                         if service_type in ("tr2, tr1", "to3", "to2", "to1"):
-                            for date in reversed(date_list):
+                            for date in list(reversed(date_list)):
                                 if not verify_allowed_service_start_date(service_type,
                                                                          date,
-                                                                         duration):
+                                                                         duration,
+                                                                         session=session):
                                     date_list.remove(date)
                         service_wagons[wagon_number]["periods"][list_index] = date_list
                         # debug
@@ -302,6 +263,7 @@ def update_wagon_service_period(wagon_number: int,
                 #       "в предзапланированный период по нормам межремонтных пробегов невозвожна!", sep="")
 
 
+@profiled
 def unify_train_service_period(sim_service_trains: list,
                                service_wagons: dict):
     """
@@ -314,20 +276,19 @@ def unify_train_service_period(sim_service_trains: list,
         x_dates = None
         for wagon_number in train_object.wagons.keys():
             if x_dates is None:
-                x_dates = [set(period)
+                x_dates = [period.copy()
                            for period in service_wagons[wagon_number]["periods"]]
             else:
                 for period_index in range(len(service_wagons[wagon_number]["periods"])):
-                    dates_period = set(
-                        service_wagons[wagon_number]["periods"][period_index])
+                    dates_period = service_wagons[wagon_number]["periods"][period_index]
                     if dates_period != x_dates[period_index]:
                         flag_different = True
-                        x_dates[period_index] &= dates_period
+                        x_dates[period_index] = x_dates[period_index] & dates_period
         if flag_different:
             # print(f"Сцеп №{train_object.train_number:3d} ",
             #       f"вагоны {[wagon_number for wagon_number in train_object.wagons.keys()]} ",
             #       "- корректировка периодов", sep="")
-            new_periods = [sorted(list(period)) for period in x_dates]
+            new_periods = x_dates
             for wagon_number in train_object.wagons.keys():
                 service_wagons[wagon_number]["periods"] = new_periods
         # else:
@@ -6,11 +6,24 @@
 # **************************
 
 __all__ = [
+    "DailyCounter",
+    "DateIntervals",
+    "DebugLog",
+    "FleetMileage",
+    "MileageRecord",
+    "MileageTable",
+    "PlanningSession",
+    "RangeMaxTree",
     "Registry",
     "Train",
     "Wagon",
+    "WagonTimeline",
+    "WorkCalendar",
 ]
 
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, groupby
 from typing import Union
 import datetime
 
@@ -82,51 +95,1123 @@ class Normatives:
 Normatives.calculate_standing()
 
 
-class Registry:
-    # длина линии в километрах
-    line_lenght = 27.62
-    # начальная дата расчета
-    planning_start_date = None
-    # конечная дата расчета (следующая за диапазоном расчета)
-    planning_end_date = None
-    # словарь вагонов вида {номер_вагона: объект_вагона}
-    wagons = None
-    # словарь сцепов вида {номер_сцепа: объект_сцепа}
-    trains = None
-    # количество вагонов в сцепе
-    train_lenght = None
-    # словарь невцепленных вагонов
-    unhitched_wagons = None
-    # словарь с парностями на каждую дату расчетного периода вида:
-    # {дата: {"pairs_count_sum": суммарная_суточная_парность,
-    #         "pairs_count_max": максимальная_часовая_парность,
-    #         "holiday": True/False}}
-    transportation_values = None
-    # словарь с суммарным суточным пробегом линии вида {дата: пробег}
-    line_daily_mileage = {}
-    # словарь с суточным пробегом одного вагона в движении вида {дата: пробег}
-    wagon_daily_mileage = {}
-    # словарь с суточным количеством вагонов в движении вида {дата: количество}
-    wagons_in_motion = {}
-    # словарь с суточным количеством вагонов в простое
-    # вида {дата: {причина_простоя: количество_вагонов}}
-    idle_wagons = {}
-    # словарь с нормами межремонтных пробегов
-    mileage_standards = None
-    # словарь с нормами простоя вагонов в ремонте
-    duration_standards = None
+class DebugLog:
     """
-    словарь со всеми запланированными ТОиР по периодам вида
-    result_services =   {
-    вид_ТОиР:   {
-        (начальная_дата, конечная дата):    {
-            "trains": [объект_сцепа, ...],
-            "single_wagons": [объект_вагона, ...]
-                                            },
-        ...     }
-    ...             }
+    Отладочный вывод расчета в файл с уровнями детализации:
+    INFO - замечания по результатам расчета (verify_planning_results),
+    TRACE - подробные выгрузки промежуточных данных планирования
+    (print_service_wagons_to_file, print_standing_dates_to_file и др.).
+    Файл открывается на дозапись один раз (при первом обращении к file)
+    с буферизацией и закрывается методом close.
+    Перед формированием объемной выгрузки вызывающий код проверяет уровень
+    методом enabled, чтобы не форматировать данные, которые не будут выведены.
     """
-    result_services = None
+    INFO = 1
+    TRACE = 2
+
+    def __init__(self,
+                 path,
+                 level: int = INFO,
+                 buffer_size: int = 1 << 20):
+        self.path = path
+        self.level = level
+        self.buffer_size = buffer_size
+        self.debug_file = None
+
+    def enabled(self, level: int):
+        """
+        Возвращает bool - выводится ли информация указанного уровня.
+        """
+        return level <= self.level
+
+    @property
+    def file(self):
+        """
+        Файл отладочного вывода (открывается при первом обращении).
+        """
+        if self.debug_file is None:
+            self.debug_file = open(self.path, mode="at", encoding="utf-8",
+                                   buffering=self.buffer_size)
+        return self.debug_file
+
+    def write(self, *values, level: int = INFO, **kwargs):
+        """
+        Выводит values в файл (аналогично print), если уровень level включен.
+        """
+        if level <= self.level:
+            print(*values, file=self.file, **kwargs)
+
+    def close(self):
+        if self.debug_file is not None:
+            self.debug_file.close()
+            self.debug_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PlanningSession:
+    """
+    Состояние одного расчета: вагоны, сцепы, парности, нормативы,
+    счетчики вагонов и результаты планирования.
+    Функции модулей calculation, changing, planning, selection, verification и др.
+    получают сессию параметром session (по умолчанию - Registry),
+    вагоны и сцепы хранят ссылку на свою сессию в атрибуте session,
+    поэтому в одном процессе можно вести несколько независимых расчетов.
+    """
+
+    def __init__(self):
+        # длина линии в километрах
+        self.line_lenght = 27.62
+        # начальная дата расчета
+        self.planning_start_date = None
+        # конечная дата расчета (следующая за диапазоном расчета)
+        self.planning_end_date = None
+        # словарь вагонов вида {номер_вагона: объект_вагона}
+        self.wagons = None
+        # словарь сцепов вида {номер_сцепа: объект_сцепа}
+        self.trains = None
+        # количество вагонов в сцепе
+        self.train_lenght = None
+        # словарь невцепленных вагонов
+        self.unhitched_wagons = None
+        # словарь с парностями на каждую дату расчетного периода вида:
+        # {дата: {"pairs_count_sum": суммарная_суточная_парность,
+        #         "pairs_count_max": максимальная_часовая_парность,
+        #         "holiday": True/False}}
+        self.transportation_values = None
+        # календарь рабочих дней периода расчета (объект WorkCalendar)
+        self.calendar = None
+        # словарь с суммарным суточным пробегом линии вида {дата: пробег}
+        self.line_daily_mileage = {}
+        # словарь с суточным пробегом одного вагона в движении вида {дата: пробег}
+        self.wagon_daily_mileage = {}
+        # суточное количество вагонов в движении (объект DailyCounter,
+        # None - до подсчета count_wagons_in_motion, после подсчета изменяется
+        # в Wagon.change_idle_reason)
+        self.wagons_in_motion = None
+        # словарь с суточным количеством вагонов в простое
+        # вида {причина_простоя: объект_DailyCounter}
+        # (после подсчета count_idle_wagons изменяется в Wagon.change_idle_reason)
+        self.idle_wagons = {}
+        # словарь вида {причина_простоя: объект_RangeMaxTree} с количеством вагонов
+        # в простое на каждую дату периода планирования (индекс - смещение от planning_start_date)
+        # для поиска максимального количества вагонов в простое в диапазоне дат
+        self.idle_wagons_index = {}
+        # словарь с нормами межремонтных пробегов
+        self.mileage_standards = None
+        # словарь с нормами простоя вагонов в ремонте
+        self.duration_standards = None
+        # словари с теми же нормами вида {модель_вагона: нормативы}
+        # (формируются normatives.models_standards при загрузке норм)
+        self.models_mileage_standards = None
+        self.models_duration_standards = None
+        """
+        словарь со всеми запланированными ТОиР по периодам вида
+        result_services =   {
+        вид_ТОиР:   {
+            (начальная_дата, конечная дата):    {
+                "trains": [объект_сцепа, ...],
+                "single_wagons": [объект_вагона, ...]
+                                                },
+            ...     }
+        ...             }
+        """
+        self.result_services = None
+        # отладочный вывод расчета (объект DebugLog,
+        # None - отладочная информация в файл не выводится)
+        self.debug_log = None
+        # замеры этапов расчета (объект profiling.Profiler,
+        # None - замеры не выполняются)
+        self.profiler = None
+
+
+# сессия по умолчанию (для кода, работающего с единственным расчетом)
+Registry = PlanningSession()
+
+
+class MileageTable:
+    """
+    Поколоночное хранилище пробегов вагона на каждую дату периода эксплуатации.
+    Каждое поле хранится в отдельном типизированном массиве,
+    индекс элемента массива - смещение в днях от начальной даты таблицы
+    (для вагонов, созданных через create_wagons, - от Registry.planning_start_date).
+    Пробеги хранятся как целые числа (None - как MileageTable.NONE),
+    причины простоя и виды ТОиР - как коды из MileageTable.reasons.
+    Для совместимости поддерживает обращение вида mileage[дата][поле].
+    """
+    # значение пробега, соответствующее None
+    NONE = -1
+    # коды причин простоя и видов ТОиР (индекс в кортеже - код)
+    reasons = (None, "o",
+               "kr", "sr", "kr_sr",
+               "tr3", "tr2", "tr1",
+               "to3", "to2", "to1")
+    codes = {reason: code for code, reason in enumerate(reasons)}
+    reason_fields = ("preplanned_service",
+                     "allowed_service",
+                     "idle_reason")
+    mileage_fields = ("daily", "ne", "kr_sr",
+                      "tr3", "tr2", "tr1",
+                      "to3", "to2", "to1")
+    fields = reason_fields + mileage_fields
+    # пробеги, вычисляемые по суточным пробегам
+    derived_fields = mileage_fields[1:]
+
+    def __init__(self,
+                 start_date: datetime.date,
+                 end_date: datetime.date):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.start_ordinal = start_date.toordinal()
+        self.size = (end_date - start_date).days
+        # словарь вида {поле: массив_значений_по_датам}
+        self.columns = {}
+        for field in self.reason_fields:
+            self.columns[field] = array("b", bytes(self.size))
+        for field in self.mileage_fields:
+            self.columns[field] = array("q", [self.NONE]) * self.size
+        # словарь вида {поле: индекс} с первым индексом, начиная с которого
+        # вычисляемый пробег требует пересчета (size - пересчет не требуется)
+        self.dirty = dict.fromkeys(self.derived_fields, 1)
+
+    def index(self, date: datetime.date):
+        """
+        Возвращает смещение в днях указанной даты от начальной даты таблицы
+        (без проверки на попадание в диапазон таблицы).
+        """
+        return date.toordinal() - self.start_ordinal
+
+    def date(self, index: int):
+        """
+        Возвращает дату, соответствующую указанному смещению от начальной даты таблицы.
+        """
+        return datetime.date.fromordinal(self.start_ordinal + index)
+
+    def values(self,
+               field: str,
+               start_date: datetime.date = None,
+               end_date: datetime.date = None):
+        """
+        Возвращает список значений указанного поля на каждую дату
+        из заданного диапазона (по умолчанию - весь диапазон таблицы)
+        в исходном виде (с None вместо отсутствующих значений).
+        """
+        first = 0 if start_date is None else self.index(start_date)
+        last = self.size if end_date is None else self.index(end_date)
+        column = self.columns[field][first:last]
+        if field in self.reason_fields:
+            reasons = self.reasons
+            return [reasons[code] for code in column]
+        none = self.NONE
+        return [None if value == none else value for value in column]
+
+    def accumulate_mileage_ne(self,
+                              first_index: int,
+                              last_index: int):
+        """
+        Пересчитывает пробег от н.э. в индексах [first_index, last_index)
+        как накопленную сумму суточных пробегов от значения на дату first_index - 1.
+        """
+        if first_index < 1:
+            first_index = 1
+        if first_index >= last_index:
+            return
+        mileage_ne = self.columns["ne"]
+        mileage_daily = self.columns["daily"]
+        self.check_daily_mileage(first_index, last_index)
+        mileage_ne[first_index:last_index] = array("q", accumulate(
+            mileage_daily[first_index:last_index - 1],
+            initial=mileage_ne[first_index - 1] + mileage_daily[first_index - 1]))
+        self.mark_calculated("ne", first_index, last_index)
+
+    def accumulate_service_mileage(self,
+                                   field: str,
+                                   first_index: int,
+                                   last_index: int):
+        """
+        Пересчитывает пробег от вида ТОиР в индексах [first_index, last_index)
+        как накопленную сумму суточных пробегов, которая начинается заново
+        с каждой нулевой отметки (даты выполнения ТОиР).
+        Нулевые отметки сохраняются, отсутствующий (None) пробег
+        остается таковым до первой нулевой отметки.
+        """
+        if first_index < 1:
+            first_index = 1
+        if first_index >= last_index:
+            return
+        service_mileage = self.columns[field]
+        mileage_daily = self.columns["daily"]
+        self.check_daily_mileage(first_index, last_index)
+        index = first_index
+        while index < last_index:
+            try:
+                service_index = service_mileage.index(0, index, last_index)
+            except ValueError:
+                service_index = last_index
+            previous_service_mileage = service_mileage[index - 1]
+            if (previous_service_mileage != self.NONE and
+                    service_index > index):
+                service_mileage[index:service_index] = array("q", accumulate(
+                    mileage_daily[index:service_index - 1],
+                    initial=previous_service_mileage + mileage_daily[index - 1]))
+            index = service_index + 1
+        self.mark_calculated(field, first_index, last_index)
+
+    def invalidate(self,
+                   index: int,
+                   fields: tuple = None):
+        """
+        Отмечает, что вычисляемые пробеги указанных полей
+        (по умолчанию - всех вычисляемых полей) требуют пересчета
+        начиная с индекса index (например, после изменения суточного пробега
+        или отметки о ТОиР в этом индексе).
+        """
+        index = max(index, 1)
+        dirty = self.dirty
+        for field in (self.derived_fields if fields is None else fields):
+            if index < dirty[field]:
+                dirty[field] = index
+
+    def mark_calculated(self,
+                        field: str,
+                        first_index: int,
+                        last_index: int):
+        """
+        Отмечает пересчет пробега указанного поля в индексах [first_index, last_index).
+        Если пробег до first_index пересчета не требовал, то не требует его
+        и до last_index.
+        """
+        if self.dirty[field] >= first_index:
+            self.dirty[field] = max(self.dirty[field], last_index)
+
+    def recalculate(self,
+                    fields: tuple = None):
+        """
+        Пересчитывает пробеги указанных полей (по умолчанию - всех вычисляемых полей)
+        до конца таблицы, начиная с первого индекса, требующего пересчета.
+        Результат тот же, что при пересчете за весь диапазон таблицы.
+        """
+        for field in (self.derived_fields if fields is None else fields):
+            first_index = self.dirty[field]
+            if first_index >= self.size:
+                continue
+            if field == "ne":
+                self.accumulate_mileage_ne(first_index, self.size)
+            else:
+                self.accumulate_service_mileage(field, first_index, self.size)
+
+    def check_daily_mileage(self,
+                            first_index: int,
+                            last_index: int):
+        """
+        Проверяет, что на все даты, предшествующие датам из [first_index, last_index),
+        определен суточный пробег.
+        """
+        try:
+            self.columns["daily"].index(self.NONE, first_index - 1, last_index - 1)
+        except ValueError:
+            return
+        raise ValueError(f"В диапазоне {self.date(first_index - 1)} - {self.date(last_index - 1)} "
+                         "не определен суточный пробег!")
+
+    def __contains__(self, date):
+        if isinstance(date, datetime.date):
+            return 0 <= self.index(date) < self.size
+        return False
+
+    def __getitem__(self, date: datetime.date):
+        index = self.index(date)
+        if not 0 <= index < self.size:
+            raise KeyError(date)
+        return MileageRecord(self, index)
+
+    def __iter__(self):
+        for index in range(self.size):
+            yield self.date(index)
+
+    def __len__(self):
+        return self.size
+
+
+class MileageRecord:
+    """
+    Представление одной даты MileageTable в виде словаря
+    {поле: значение} (для совместимости с прежним форматом Wagon.mileage).
+    """
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: MileageTable, index: int):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, field: str):
+        value = self.table.columns[field][self.index]
+        if field in MileageTable.reason_fields:
+            return MileageTable.reasons[value]
+        return None if value == MileageTable.NONE else value
+
+    def __setitem__(self, field: str, value):
+        if field in MileageTable.reason_fields:
+            value = MileageTable.codes[value]
+        else:
+            if value is None:
+                value = MileageTable.NONE
+            if self.table.columns[field][self.index] != value:
+                self.table.invalidate(self.index,
+                                      None if field == "daily" else (field,))
+        self.table.columns[field][self.index] = value
+
+    def __contains__(self, field):
+        return field in MileageTable.fields
+
+    def __iter__(self):
+        return iter(MileageTable.fields)
+
+    def get(self, field: str, default=None):
+        if field in MileageTable.fields:
+            return self[field]
+        return default
+
+    def keys(self):
+        return MileageTable.fields
+
+    def items(self):
+        return [(field, self[field]) for field in MileageTable.fields]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class FleetMileage:
+    """
+    Накопленные суммы суточного пробега одного вагона в движении
+    (одинакового для всех вагонов парка в одну дату, см. calculate_wagon_daily_mileage)
+    на каждую дату периода, начиная с start_date.
+    Пробег вагона в движении за любой диапазон дат вычисляется за постоянное время
+    как разность накопленных сумм.
+    """
+
+    def __init__(self,
+                 start_date: datetime.date,
+                 daily_mileages):
+        self.start_date = start_date
+        self.start_ordinal = start_date.toordinal()
+        # prefix[i] - суммарный пробег за даты от start_date (включая) до индекса i (не включая)
+        self.prefix = array("q", accumulate(daily_mileages, initial=0))
+        self.size = len(self.prefix) - 1
+        self.end_date = self.date(self.size)
+
+    @classmethod
+    def from_session(cls, session=None):
+        """
+        Возвращает накопленные суммы суточного пробега вагона в движении
+        из session.wagon_daily_mileage за период планирования сессии (по умолчанию - Registry).
+        """
+        if session is None:
+            session = Registry
+        start_ordinal = session.planning_start_date.toordinal()
+        return cls(session.planning_start_date,
+                   [session.wagon_daily_mileage[datetime.date.fromordinal(ordinal)]
+                    for ordinal in range(start_ordinal, session.planning_end_date.toordinal())])
+
+    def index(self, date: datetime.date):
+        """
+        Возвращает смещение в днях указанной даты от start_date.
+        """
+        return date.toordinal() - self.start_ordinal
+
+    def date(self, index: int):
+        """
+        Возвращает дату, соответствующую указанному смещению от start_date.
+        """
+        return datetime.date.fromordinal(self.start_ordinal + index)
+
+    def between(self,
+                first: int,
+                last: int):
+        """
+        Возвращает суммарный пробег вагона в движении в индексах [first, last).
+        """
+        return self.prefix[last] - self.prefix[first]
+
+
+class WagonTimeline:
+    """
+    Вспомогательная структура для запросов пробегов вагона в периоде эксплуатации
+    (пробег поля на дату, количество суток перепробега), строящаяся по таблице
+    пробегов вагона (from_wagon).
+    Хранит пробеги на дату начала эксплуатации и отсортированные простои (отстой и ТОиР)
+    с датами начала и окончания. Суточный пробег вагона вне простоев равен пробегу вагона
+    в движении (FleetMileage), поэтому пробег на любую дату вычисляется за логарифмическое время
+    по накопленным суммам FleetMileage за вычетом пробега за даты простоев.
+    Пробеги полей, пересчитанных в MileageTable после change_trains_daily_mileage
+    (calculate_wagon_service_mileage), совпадают с MileageTable. Для полей, которые в сессии
+    не пересчитывались (например, to1 и to2 при планировании только ТР), MileageTable
+    после даты начала эксплуатации содержит None, а здесь пробег вычисляется
+    от значения на дату начала эксплуатации.
+    Индексы - смещения от FleetMileage.start_date, диапазоны - [начало, конец).
+    """
+    # виды ТОиР по возрастанию: ТОиР обнуляет пробеги от своего и меньших видов
+    # (как Wagon.change_idle_reason)
+    service_types = ("to1", "to2",  # "to3",
+                     "tr1", "tr2", "tr3",
+                     "sr", "kr")
+
+    def __init__(self,
+                 fleet_mileage: FleetMileage,
+                 usage_start_date: datetime.date,
+                 usage_end_date: datetime.date,
+                 mileages_0: dict):
+        self.fleet_mileage = fleet_mileage
+        self.first = fleet_mileage.index(usage_start_date)
+        self.last = fleet_mileage.index(usage_end_date)
+        if not 0 <= self.first < self.last <= fleet_mileage.size:
+            raise ValueError(f"Период эксплуатации {usage_start_date} - {usage_end_date} "
+                             f"находится вне диапазона {fleet_mileage.start_date} - {fleet_mileage.end_date}!")
+        # пробеги на дату начала эксплуатации вида {поле: пробег (None - нет данных)}
+        self.mileages_0 = {field: mileages_0.get(field) for field in MileageTable.derived_fields}
+        # простои - непересекающиеся диапазоны индексов, отсортированные по началу
+        self.idle_starts = []
+        self.idle_ends = []
+        self.idle_reasons = []
+        # idle_prefix[k] - пробег вагона в движении за даты простоев с номерами до k (не включая)
+        self.idle_prefix = [0]
+        # ТОиР, обнуляющие пробег поля, вида {поле: ([начала_ТОиР], [окончания_ТОиР])}
+        self.services = {field: ([], []) for field in MileageTable.derived_fields[1:]}
+
+    @classmethod
+    def from_wagon(cls, wagon_object, fleet_mileage: FleetMileage):
+        """
+        Возвращает структуру пробегов вагона по его таблице пробегов:
+        пробеги на дату начала эксплуатации и участки дат с одинаковой причиной простоя.
+        """
+        mileage = wagon_object.mileage
+        first_record = mileage[wagon_object.usage_start_date]
+        timeline = cls(fleet_mileage,
+                       wagon_object.usage_start_date,
+                       wagon_object.usage_end_date,
+                       {field: first_record[field] for field in MileageTable.derived_fields})
+        first = mileage.index(wagon_object.usage_start_date)
+        last = mileage.index(wagon_object.usage_end_date)
+        index = first
+        for code, run in groupby(mileage.columns["idle_reason"][first:last]):
+            start = index
+            index += len(tuple(run))
+            if code:
+                timeline.add_idle(MileageTable.reasons[code], mileage.date(start), mileage.date(index))
+        return timeline
+
+    def add_idle(self,
+                 idle_reason: str,
+                 start_date: datetime.date,
+                 end_date: datetime.date):
+        """
+        Добавляет простой вагона по причине idle_reason ("o" - отстой или вид ТОиР)
+        с start_date (включая) до end_date (не включая).
+        ТОиР обнуляет пробеги от своего и меньших видов ТОиР.
+        Простой не должен пересекаться с ранее добавленными простоями.
+        """
+        first = self.fleet_mileage.index(start_date)
+        last = self.fleet_mileage.index(end_date)
+        if not self.first <= first < last <= self.last:
+            raise ValueError(f"Диапазон дат {start_date} - {end_date} находится вне периода эксплуатации "
+                             f"{self.fleet_mileage.date(self.first)} - {self.fleet_mileage.date(self.last)}!")
+        if idle_reason != "o" and idle_reason not in self.service_types:
+            raise ValueError(f"Неизвестная причина простоя {idle_reason}!")
+        number = bisect_right(self.idle_starts, first)
+        if ((number and self.idle_ends[number - 1] > first) or
+                (number < len(self.idle_starts) and self.idle_starts[number] < last)):
+            raise ValueError(f"Простой {start_date} - {end_date} пересекается с другим простоем!")
+        self.idle_starts.insert(number, first)
+        self.idle_ends.insert(number, last)
+        self.idle_reasons.insert(number, idle_reason)
+        idle_prefix = self.idle_prefix[:number + 1]
+        for index in range(number, len(self.idle_starts)):
+            idle_prefix.append(idle_prefix[-1] +
+                               self.fleet_mileage.between(self.idle_starts[index], self.idle_ends[index]))
+        self.idle_prefix = idle_prefix
+        if idle_reason in self.service_types:
+            # СР и КР обнуляют одно поле kr_sr, поэтому ТОиР добавляется в него один раз
+            fields = {"kr_sr" if service_type in ("sr", "kr") else service_type
+                      for service_type in self.service_types[:self.service_types.index(idle_reason) + 1]}
+            for field in fields:
+                starts, ends = self.services[field]
+                number = bisect_right(starts, first)
+                starts.insert(number, first)
+                ends.insert(number, last)
+
+    def idle_between(self,
+                     first: int,
+                     last: int):
+        """
+        Возвращает пробег вагона в движении за даты простоев в индексах [first, last).
+        """
+        first_number = bisect_right(self.idle_ends, first)
+        last_number = bisect_left(self.idle_starts, last)
+        if first_number >= last_number:
+            return 0
+        res = self.idle_prefix[last_number] - self.idle_prefix[first_number]
+        if self.idle_starts[first_number] < first:
+            res -= self.fleet_mileage.between(self.idle_starts[first_number], first)
+        if self.idle_ends[last_number - 1] > last:
+            res -= self.fleet_mileage.between(last, self.idle_ends[last_number - 1])
+        return res
+
+    def moving_between(self,
+                       first: int,
+                       last: int):
+        """
+        Возвращает пробег вагона в индексах [first, last) (без дат простоев).
+        """
+        return self.fleet_mileage.between(first, last) - self.idle_between(first, last)
+
+    def segment(self,
+                field: str,
+                index: int):
+        """
+        Возвращает участок индексов [начало, конец) без ТОиР, обнуляющих пробег поля,
+        содержащий index, и пробег поля в начале участка (None - нет данных),
+        либо None, если в index вагон находится в таком ТОиР.
+        """
+        if field == "ne":
+            return self.first, self.last, self.mileages_0["ne"]
+        starts, ends = self.services[field]
+        number = bisect_right(starts, index)
+        if number and index < ends[number - 1]:
+            return None
+        first, mileage_0 = ((ends[number - 1], 0) if number else
+                            (self.first, self.mileages_0[field]))
+        last = starts[number] if number < len(starts) else self.last
+        return first, last, mileage_0
+
+    def mileage(self,
+                field: str,
+                date: datetime.date):
+        """
+        Возвращает пробег поля MileageTable.derived_fields ("ne" - от н.э.,
+        "kr_sr", "tr3", ... - от вида ТОиР) на указанную дату (None - нет данных).
+        """
+        index = self.fleet_mileage.index(date)
+        if not self.first <= index < self.last:
+            raise KeyError(date)
+        segment = self.segment(field, index)
+        if segment is None:
+            return 0
+        first, last, mileage_0 = segment
+        if mileage_0 is None:
+            return None
+        return mileage_0 + self.moving_between(first, index)
+
+    def reach_index(self,
+                    value: int,
+                    first: int,
+                    last: int,
+                    mileage_0: int):
+        """
+        На участке [first, last) без ТОиР с пробегом mileage_0 в начале участка
+        возвращает первый индекс, в котором пробег не меньше value (last - не достигается).
+        Пробег на участке не убывает, поэтому индекс находится двоичным поиском.
+        """
+        low, high = first, last
+        while low < high:
+            middle = (low + high) // 2
+            if mileage_0 + self.moving_between(first, middle) >= value:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def reach_date(self,
+                   field: str,
+                   value: int,
+                   start_date: datetime.date = None):
+        """
+        Возвращает первую дату, начиная с start_date (по умолчанию - дата начала эксплуатации),
+        до ближайшего ТОиР, обнуляющего пробег поля, в которую пробег поля
+        не меньше value, либо None, если такой даты нет.
+        """
+        index = self.first if start_date is None else self.fleet_mileage.index(start_date)
+        segment = self.segment(field, index)
+        if segment is None or segment[2] is None:
+            return None
+        first, last, mileage_0 = segment
+        res = self.reach_index(value, index, last,
+                               mileage_0 + self.moving_between(first, index))
+        return None if res == last else self.fleet_mileage.date(res)
+
+    def count_overrun_days(self,
+                           field: str,
+                           max_mileage: int):
+        """
+        Возвращает количество дат периода эксплуатации, в которые пробег поля
+        (при отсутствии данных - пробег от н.э.) больше max_mileage.
+        """
+        res = 0
+        index = self.first
+        while index < self.last:
+            segment = self.segment(field, index)
+            if segment is None:
+                index = self.services[field][1][bisect_right(self.services[field][0], index) - 1]
+                continue
+            first, last, mileage_0 = segment
+            if mileage_0 is None:
+                # до первого ТОиР пробег поля неизвестен - сравнивается пробег от н.э.
+                first_ne, last_ne, mileage_0 = self.segment("ne", first)
+                res += last - self.reach_index(max_mileage + 1, first, last,
+                                               mileage_0 + self.moving_between(first_ne, first))
+            else:
+                res += last - self.reach_index(max_mileage + 1, first, last, mileage_0)
+            index = last
+        return res
+
+
+class RangeMaxTree:
+    """
+    Дерево отрезков над списком целых чисел.
+    Позволяет за логарифмическое время прибавлять значение
+    ко всем элементам диапазона индексов и находить максимальное значение
+    в диапазоне индексов (диапазоны - от first (включая) до last (не включая)).
+    """
+
+    def __init__(self, values: list):
+        self.size = len(values)
+        self.capacity = 1
+        while self.capacity < self.size:
+            self.capacity *= 2
+        # элементы за пределами списка не должны влиять на максимум
+        self.tree = [float("-inf")] * (2 * self.capacity)
+        # значения, прибавленные ко всем элементам узла
+        self.lazy = [0] * (2 * self.capacity)
+        self.tree[self.capacity:self.capacity + self.size] = values
+        for node in reversed(range(1, self.capacity)):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def add(self,
+            first: int,
+            last: int,
+            value: int,
+            node: int = 1,
+            node_first: int = 0,
+            node_last: int = None):
+        """
+        Прибавляет value ко всем элементам с индексами от first до last.
+        """
+        if node_last is None:
+            node_last = self.capacity
+        if last <= node_first or node_last <= first:
+            return
+        if first <= node_first and node_last <= last:
+            self.tree[node] += value
+            self.lazy[node] += value
+            return
+        middle = (node_first + node_last) // 2
+        self.add(first, last, value, 2 * node, node_first, middle)
+        self.add(first, last, value, 2 * node + 1, middle, node_last)
+        self.tree[node] = (max(self.tree[2 * node], self.tree[2 * node + 1]) +
+                           self.lazy[node])
+
+    def max(self,
+            first: int,
+            last: int,
+            node: int = 1,
+            node_first: int = 0,
+            node_last: int = None):
+        """
+        Возвращает максимальное значение среди элементов с индексами от first до last.
+        """
+        if node_last is None:
+            if not 0 <= first < last <= self.size:
+                raise ValueError(f"Диапазон индексов [{first}, {last}) пуст "
+                                 f"или выходит за пределы [0, {self.size})!")
+            node_last = self.capacity
+        if last <= node_first or node_last <= first:
+            return float("-inf")
+        if first <= node_first and node_last <= last:
+            return self.tree[node]
+        middle = (node_first + node_last) // 2
+        return max(self.max(first, last, 2 * node, node_first, middle),
+                   self.max(first, last, 2 * node + 1, middle, node_last)) + self.lazy[node]
+
+    def __getitem__(self, index: int):
+        return self.max(index, index + 1)
+
+    def __len__(self):
+        return self.size
+
+
+class DailyCounter:
+    """
+    Суточный счетчик на каждую дату диапазона от start_date (включая)
+    до end_date (не включая). Значения хранятся в типизированном массиве,
+    индекс элемента массива - смещение в днях от start_date,
+    поэтому изменение значений в диапазоне дат выполняется
+    одним присваиванием среза массива.
+    Для совместимости поддерживает обращение вида counter[дата].
+    """
+
+    __slots__ = ("start_date", "end_date", "values")
+
+    def __init__(self,
+                 start_date: datetime.date,
+                 end_date: datetime.date):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.values = array("l", [0]) * (end_date - start_date).days
+
+    def index(self, date: datetime.date):
+        """
+        Возвращает индекс элемента массива для указанной даты.
+        """
+        return (date - self.start_date).days
+
+    def add(self, first: int, last: int, value: int):
+        """
+        Прибавляет value ко всем элементам с индексами от first до last
+        (индексы за пределами массива отбрасываются).
+        """
+        first, last = max(first, 0), min(last, len(self.values))
+        if first < last:
+            self.values[first:last] = array("l", map(value.__add__, self.values[first:last]))
+
+    def copy(self):
+        """
+        Возвращает копию счетчика.
+        """
+        counter = DailyCounter.__new__(DailyCounter)
+        counter.start_date, counter.end_date = self.start_date, self.end_date
+        counter.values = array("l", self.values)
+        return counter
+
+    def get(self, date: datetime.date, default=None):
+        index = self.index(date)
+        if 0 <= index < len(self.values):
+            return self.values[index]
+        return default
+
+    def items(self):
+        date = self.start_date
+        for value in self.values:
+            yield date, value
+            date += datetime.timedelta(days=1)
+
+    def __contains__(self, date: datetime.date):
+        return 0 <= self.index(date) < len(self.values)
+
+    def __getitem__(self, date: datetime.date):
+        index = self.index(date)
+        if not 0 <= index < len(self.values):
+            raise KeyError(date)
+        return self.values[index]
+
+    def __setitem__(self, date: datetime.date, value: int):
+        index = self.index(date)
+        if not 0 <= index < len(self.values):
+            raise KeyError(date)
+        self.values[index] = value
+
+    def __len__(self):
+        return len(self.values)
+
+
+class DateIntervals:
+    """
+    Упорядоченное множество дат, хранящееся в виде непересекающихся
+    диапазонов порядковых номеров дат [начало, конец) (конец не включается).
+    Проверка вхождения даты - двоичным поиском по началам диапазонов.
+    Используется для периодов возможных дат постановки вагонов в ТОиР
+    (service_wagons[номер_вагона]["periods"]).
+    """
+
+    __slots__ = ("starts", "ends", "count")
+
+    def __init__(self, dates=()):
+        self.starts = []
+        self.ends = []
+        self.count = 0
+        for date in sorted(set(dates)):
+            self.add(date)
+
+    @classmethod
+    def from_range(cls,
+                   start_date: datetime.date,
+                   end_date: datetime.date):
+        """
+        Создает множество дат от start_date (включая) до end_date (не включая).
+        """
+        res = cls()
+        if start_date < end_date:
+            res.starts.append(start_date.toordinal())
+            res.ends.append(end_date.toordinal())
+            res.count = (end_date - start_date).days
+        return res
+
+    @classmethod
+    def from_ordinals(cls,
+                      starts: list,
+                      ends: list):
+        """
+        Создает множество дат по упорядоченным непересекающимся диапазонам
+        порядковых номеров дат.
+        """
+        res = cls()
+        res.starts = starts
+        res.ends = ends
+        res.count = sum(end - start for start, end in zip(starts, ends))
+        return res
+
+    def copy(self):
+        return DateIntervals.from_ordinals(self.starts[:], self.ends[:])
+
+    def intervals(self):
+        """
+        Генерирует диапазоны дат вида (начальная_дата, конечная_дата)
+        (конечная дата не включается).
+        """
+        for start, end in zip(self.starts, self.ends):
+            yield (datetime.date.fromordinal(start),
+                   datetime.date.fromordinal(end))
+
+    def add(self, date: datetime.date):
+        """
+        Добавляет дату в множество.
+        """
+        ordinal = date.toordinal()
+        starts, ends = self.starts, self.ends
+        if not starts or ordinal > ends[-1]:
+            starts.append(ordinal)
+            ends.append(ordinal + 1)
+        elif ordinal == ends[-1]:
+            ends[-1] += 1
+        else:
+            index = bisect_right(starts, ordinal) - 1
+            if index >= 0 and ordinal < ends[index]:
+                return
+            joins_previous = index >= 0 and ends[index] == ordinal
+            joins_next = starts[index + 1] == ordinal + 1
+            if joins_previous and joins_next:
+                ends[index] = ends.pop(index + 1)
+                del starts[index + 1]
+            elif joins_previous:
+                ends[index] += 1
+            elif joins_next:
+                starts[index + 1] -= 1
+            else:
+                starts.insert(index + 1, ordinal)
+                ends.insert(index + 1, ordinal + 1)
+        self.count += 1
+
+    def discard(self, date: datetime.date):
+        """
+        Удаляет дату из множества, если она в нем есть.
+        """
+        ordinal = date.toordinal()
+        starts, ends = self.starts, self.ends
+        index = bisect_right(starts, ordinal) - 1
+        if index < 0 or ordinal >= ends[index]:
+            return
+        if starts[index] == ordinal and ends[index] == ordinal + 1:
+            del starts[index]
+            del ends[index]
+        elif starts[index] == ordinal:
+            starts[index] += 1
+        elif ends[index] == ordinal + 1:
+            ends[index] -= 1
+        else:
+            starts.insert(index + 1, ordinal + 1)
+            ends.insert(index, ordinal)
+        self.count -= 1
+
+    def remove(self, date: datetime.date):
+        """
+        Удаляет дату из множества. Если даты в нем нет - KeyError.
+        """
+        if date not in self:
+            raise KeyError(date)
+        self.discard(date)
+
+    def __and__(self, other):
+        if not isinstance(other, DateIntervals):
+            return NotImplemented
+        starts, ends = [], []
+        index, other_index = 0, 0
+        while index < len(self.starts) and other_index < len(other.starts):
+            start = max(self.starts[index], other.starts[other_index])
+            end = min(self.ends[index], other.ends[other_index])
+            if start < end:
+                starts.append(start)
+                ends.append(end)
+            if self.ends[index] < other.ends[other_index]:
+                index += 1
+            else:
+                other_index += 1
+        return DateIntervals.from_ordinals(starts, ends)
+
+    def __or__(self, other):
+        if not isinstance(other, DateIntervals):
+            return NotImplemented
+        starts, ends = [], []
+        for start, end in sorted(zip(self.starts + other.starts,
+                                     self.ends + other.ends)):
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        return DateIntervals.from_ordinals(starts, ends)
+
+    def __contains__(self, date: datetime.date):
+        ordinal = date.toordinal()
+        index = bisect_right(self.starts, ordinal) - 1
+        return index >= 0 and ordinal < self.ends[index]
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("Индекс даты вне диапазона!")
+        if index == self.count - 1:
+            return datetime.date.fromordinal(self.ends[-1] - 1)
+        for start, end in zip(self.starts, self.ends):
+            if index < end - start:
+                return datetime.date.fromordinal(start + index)
+            index -= end - start
+
+    def __iter__(self):
+        for start, end in zip(self.starts, self.ends):
+            for ordinal in range(start, end):
+                yield datetime.date.fromordinal(ordinal)
+
+    def __reversed__(self):
+        for start, end in zip(reversed(self.starts), reversed(self.ends)):
+            for ordinal in reversed(range(start, end)):
+                yield datetime.date.fromordinal(ordinal)
+
+    def __len__(self):
+        return self.count
+
+    def __eq__(self, other):
+        if not isinstance(other, DateIntervals):
+            return NotImplemented
+        return self.starts == other.starts and self.ends == other.ends
+
+    def __repr__(self):
+        return f"DateIntervals({[(str(start), str(end)) for start, end in self.intervals()]})"
+
+
+class WorkCalendar:
+    """
+    Календарь рабочих и выходных дней периода расчета.
+    Строится один раз по словарю с парностями (Registry.transportation_values)
+    и содержит признак выходного дня и количество рабочих дней,
+    предшествующих каждой дате, что позволяет находить дату через N рабочих дней
+    и количество рабочих дней в диапазоне без перебора дат.
+    """
+
+    def __init__(self, transportation_values: dict):
+        self.transportation_values = transportation_values
+        self.start_date = min(transportation_values)
+        self.start_ordinal = self.start_date.toordinal()
+        self.size = (max(transportation_values) - self.start_date).days + 1
+        self.end_date = self.date(self.size)
+        # признак выходного дня на каждую дату (1 - выходной)
+        self.holidays = bytearray(self.size)
+        # количество рабочих дней, предшествующих каждой дате
+        # (элемент с индексом size - общее количество рабочих дней)
+        self.workdays_before = array("l", [0]) * (self.size + 1)
+        # индексы рабочих дней в порядке возрастания
+        self.workdays = array("l")
+        workdays_count = 0
+        for index in range(self.size):
+            date_values = transportation_values.get(self.date(index))
+            if date_values is None:
+                raise ValueError(f"В календаре отсутствует дата {self.date(index)}!")
+            if date_values["holiday"]:
+                self.holidays[index] = 1
+            else:
+                self.workdays.append(index)
+                workdays_count += 1
+            self.workdays_before[index + 1] = workdays_count
+
+    def index(self, date: datetime.date):
+        """
+        Возвращает смещение в днях указанной даты от начальной даты календаря.
+        """
+        return date.toordinal() - self.start_ordinal
+
+    def date(self, index: int):
+        """
+        Возвращает дату, соответствующую указанному смещению от начальной даты календаря.
+        """
+        return datetime.date.fromordinal(self.start_ordinal + index)
+
+    def is_holiday(self, date: datetime.date):
+        """
+        Проверяет, является ли указанная дата выходным днем.
+        Возвращает bool.
+        """
+        index = self.index(date)
+        if not 0 <= index < self.size:
+            raise KeyError(date)
+        return bool(self.holidays[index])
+
+    def count_workdays(self,
+                       start_date: datetime.date,
+                       end_date: datetime.date):
+        """
+        Возвращает количество рабочих дней в диапазоне
+        от start_date (включая) до end_date (не включая).
+        """
+        start_index = min(max(self.index(start_date), 0), self.size)
+        end_index = min(max(self.index(end_date), 0), self.size)
+        if end_index <= start_index:
+            return 0
+        return self.workdays_before[end_index] - self.workdays_before[start_index]
+
+    def workdate(self,
+                 start_date: datetime.date,
+                 days: int):
+        """
+        Возвращает дату, следующую за days-ым рабочим днем, считая от start_date (включая),
+        или None, если такая дата выходит за пределы календаря.
+        """
+        index = self.index(start_date)
+        if not 0 <= index < self.size:
+            return None
+        workday_number = self.workdays_before[index] + days - 1
+        if workday_number >= len(self.workdays):
+            return None
+        return self.date(self.workdays[workday_number] + 1)
+
+    def workdays_range(self,
+                       start_date: datetime.date,
+                       end_date: datetime.date,
+                       step: int = 1):
+        """
+        Возвращает список индексов каждого step-го рабочего дня
+        из диапазона от start_date (включая) до end_date (не включая).
+        При отрицательном step диапазон перебирается в обратном порядке
+        (start_date > end_date).
+        """
+        start_index = self.index(start_date)
+        end_index = self.index(end_date)
+        if step > 0:
+            first_index, last_index = start_index, end_index
+        else:
+            first_index, last_index = end_index + 1, start_index + 1
+        if first_index >= last_index:
+            return []
+        for index in (first_index, last_index - 1):
+            if not 0 <= index < self.size:
+                raise KeyError(self.date(index))
+        workdays = self.workdays[self.workdays_before[first_index]:
+                                 self.workdays_before[last_index]]
+        if step > 0:
+            return workdays[::step]
+        return workdays[::-1][::-step]
 
 
 class Train:
@@ -138,7 +1223,10 @@ class Train:
         train_number: int,
         # словарь вагонов, входящих в этот сцеп (вида {номер_вагона: объект_вагона})
         wagons: dict,
+        # сессия расчета (объект PlanningSession, по умолчанию - Registry)
+        session: PlanningSession = None,
     ):
+        self.session = Registry if session is None else session
         # формирование поезда (какие модели могут быть)
         train_forming = (("81-556", "81-557", "81-558"),
                          ("81-556.1", "81-557.1", "81-558.1"),
@@ -246,6 +1334,22 @@ class Train:
                   f"{reasons}", sep="")
         for wagon_object in none_reason_wagons:
             wagon_object.change_idle_reason(date, new_reason, verbose=verbose)
+
+    def change_idle_reason_range(self,
+                                 start_date: datetime.date,
+                                 end_date: datetime.date,
+                                 new_idle_reason: Union[str, None],
+                                 verbose=False):
+        """
+        Изменяет для всех вагонов сцепа во всех датах диапазона
+        от start_date (включая) до end_date (не включая) значение причины простоя
+        (см. Wagon.change_idle_reason_range).
+        """
+        for wagon_object in self.wagons.values():
+            wagon_object.change_idle_reason_range(start_date,
+                                                  end_date,
+                                                  new_idle_reason,
+                                                  verbose=verbose)
     # Состав
     # (свои:
     # - вагонная формула формирования сцепа,
@@ -274,7 +1378,9 @@ class Wagon:
         mileage_tr1_0: int,            # пробег от ТР-1 на дату начала расчета
         # заранее запланированные ТОиР (тип - list, вида [{вид_ТОиР: (дата_начала, дата конца)}])
         # preplanned_services=[],
+        session: PlanningSession = None,  # сессия расчета (по умолчанию - Registry)
     ):
+        self.session = Registry if session is None else session
         if usage_start_date < usage_end_date:
             self.default_start_date = usage_start_date
             self.default_end_date = usage_end_date
@@ -286,6 +1392,7 @@ class Wagon:
         self.wagon_number = wagon_number
         self.production_date = production_date
         self.wagon_model = wagon_model
+        self.resolve_standards()
         self.usage_start_date = usage_start_date
         self.usage_end_date = usage_end_date
         # self.preplanned_services вида {вид_ТОиР: [(дата_начала, дата_конца), ...]}
@@ -297,39 +1404,47 @@ class Wagon:
         # "idle_reason" может быть:
         #   None - если ежесуточный пробег равен None или int > 0,
         #   str ("kr", "sr", "tr3", "tr2", "tr1", "o") - если ежесуточный пробег равен 0
-        self.mileage = {usage_start_date: {"preplanned_service": None,
-                                           "allowed_service": None,
-                                           "idle_reason": None,
-                                           "daily": None,
-                                           "ne": mileage_ne_0,
-                                           "kr_sr": mileage_kr_sr_0,
-                                           "tr3": mileage_tr3_0,
-                                           "tr2": mileage_tr2_0,
-                                           "tr1": mileage_tr1_0,
-                                           "to3": None,
-                                           "to2": None,
-                                           "to1": None
-                                           }
-                        }
-        self.fill_period_mileage()
-
-    def fill_period_mileage(self):
-        from utility import daterange
-        usage_second_date = self.usage_start_date + datetime.timedelta(days=1)
-        for date in daterange(usage_second_date, self.usage_end_date):
-            self.mileage[date] = {"preplanned_service": None,
-                                  "allowed_service": None,
-                                  "idle_reason": None,
-                                  "daily": None,
-                                  "ne": None,
-                                  "kr_sr": None,
-                                  "tr3": None,
-                                  "tr2": None,
-                                  "tr1": None,
-                                  "to3": None,
-                                  "to2": None,
-                                  "to1": None,
-                                  }
+        # Значения хранятся в MileageTable, обращение вида self.mileage[дата][поле]
+        self.mileage = MileageTable(usage_start_date, usage_end_date)
+        self.fill_period_mileage(mileage_ne_0=mileage_ne_0,
+                                 mileage_kr_sr_0=mileage_kr_sr_0,
+                                 mileage_tr3_0=mileage_tr3_0,
+                                 mileage_tr2_0=mileage_tr2_0,
+                                 mileage_tr1_0=mileage_tr1_0)
+
+    def resolve_standards(self):
+        """
+        Определяет по модели вагона нормы межремонтных пробегов и нормы простоя
+        в ТОиР (из Registry.models_mileage_standards и Registry.models_duration_standards)
+        и сохраняет ссылки на них в атрибутах mileage_standards и duration_standards.
+        Для неизвестной модели вагона - KeyError.
+        """
+        if (self.session.models_mileage_standards is None or
+                self.session.models_duration_standards is None):
+            raise ValueError("Нормы межремонтных пробегов и нормы простоя в ТОиР не загружены!")
+        try:
+            self.mileage_standards = self.session.models_mileage_standards[self.wagon_model]
+            self.duration_standards = self.session.models_duration_standards[self.wagon_model]
+        except KeyError:
+            raise KeyError(f"Для вагона № {self.wagon_number} модели {self.wagon_model} "
+                           "не заданы нормы межремонтных пробегов или нормы простоя в ТОиР!") from None
+
+    def fill_period_mileage(self, *,
+                            mileage_ne_0: int,
+                            mileage_kr_sr_0: int,
+                            mileage_tr3_0: int,
+                            mileage_tr2_0: int,
+                            mileage_tr1_0: int):
+        """
+        Заносит в таблицу пробегов значения пробегов на дату начала эксплуатации.
+        Остальные даты периода эксплуатации уже заполнены значениями None.
+        """
+        first_date_mileage = self.mileage[self.usage_start_date]
+        first_date_mileage["ne"] = mileage_ne_0
+        first_date_mileage["kr_sr"] = mileage_kr_sr_0
+        first_date_mileage["tr3"] = mileage_tr3_0
+        first_date_mileage["tr2"] = mileage_tr2_0
+        first_date_mileage["tr1"] = mileage_tr1_0
 
     def set_usage_start_date(self, new_date):
         if len(self.mileage) > 1:
@@ -341,7 +1456,11 @@ class Wagon:
         else:
             old_date = self.usage_start_date
             self.usage_start_date = new_date
-            self.mileage[new_date] = self.mileage.pop(old_date)
+            old_date_mileage = self.mileage[old_date]
+            new_date_mileage = self.mileage[new_date]
+            for field in MileageTable.fields:
+                new_date_mileage[field] = old_date_mileage[field]
+                old_date_mileage[field] = None
             print(
                 f"Установлено новое значение usage_start_date = {self.usage_start_date}")
 
@@ -378,6 +1497,9 @@ class Wagon:
             if new_idle_reason is None:
                 service["idle_reason"] = None
                 service["daily"] = None
+                self.count_idle_reason_change(date,
+                                              old_idle_reason,
+                                              new_idle_reason)
                 if verbose:
                     print(f"Для вагона №{self.wagon_number} на {date} ",
                           f"снята отметка о нахождении в {'отстое' if old_idle_reason == 'o' else old_idle_reason}.", sep="")
@@ -385,6 +1507,9 @@ class Wagon:
                 if old_idle_reason is None:
                     service["idle_reason"] = new_idle_reason
                     service["daily"] = 0
+                    self.count_idle_reason_change(date,
+                                                  old_idle_reason,
+                                                  new_idle_reason)
                     for idle_reason in service_types:
                         service_type = ("kr_sr"
                                         if idle_reason in ("sr", "kr") else
@@ -403,6 +1528,9 @@ class Wagon:
                 if old_idle_reason is None:
                     service["idle_reason"] = "o"
                     service["daily"] = 0
+                    self.count_idle_reason_change(date,
+                                                  old_idle_reason,
+                                                  new_idle_reason)
                     if verbose:
                         print(f"Для вагона №{self.wagon_number} на {date} ",
                               f"установлена отметка о постановке в отстой.", sep="")
@@ -414,6 +1542,143 @@ class Wagon:
                 print(
                     f"Для вагона №{self.wagon_number} на {date} уже стоит отметка {new_idle_reason}")
 
+    def change_idle_reason_range(self,
+                                 start_date: datetime.date,
+                                 end_date: datetime.date,
+                                 new_idle_reason: Union[str, None],
+                                 verbose=False):
+        """
+        Изменяет для указанного вагона во всех датах диапазона
+        от start_date (включая) до end_date (не включая) значение причины простоя,
+        суточного пробега, а при установке отметки о нахождении в ТОиР - обнуляет пробеги
+        для этого и меньших видов ТОиР.
+        Результат тот же, что при вызове change_idle_reason для каждой даты,
+        но столбцы таблицы пробегов изменяются сразу для каждого участка дат
+        с одинаковой прежней причиной простоя (о счетчиках см. count_idle_reason_range_change).
+        """
+        service_types = ("to1", "to2",  # "to3",
+                         "tr1", "tr2", "tr3",
+                         "sr", "kr")
+        mileage = self.mileage
+        first_index = mileage.index(start_date)
+        last_index = mileage.index(end_date)
+        if first_index >= last_index:
+            return
+        if first_index < 0 or last_index > len(mileage):
+            raise KeyError(f"Диапазон дат {start_date} - {end_date} находится вне диапазона "
+                           f"{mileage.start_date} - {mileage.end_date}!")
+        columns = mileage.columns
+        idle_reasons = columns["idle_reason"]
+        new_code = MileageTable.codes[new_idle_reason]
+        # участки дат с одинаковой прежней причиной простоя
+        last = first_index
+        for code, run in groupby(idle_reasons[first_index:last_index]):
+            first = last
+            last = first + len(tuple(run))
+            old_idle_reason = MileageTable.reasons[code]
+            if old_idle_reason == new_idle_reason:
+                if verbose:
+                    for index in range(first, last):
+                        print(
+                            f"Для вагона №{self.wagon_number} на {mileage.date(index)} уже стоит отметка {new_idle_reason}")
+                continue
+            if new_idle_reason is None:
+                daily = MileageTable.NONE
+            elif (new_idle_reason in service_types or
+                  new_idle_reason == "o"):
+                if old_idle_reason is not None:
+                    if (new_idle_reason != "o" or
+                            old_idle_reason in service_types):
+                        for index in range(first, last):
+                            if new_idle_reason == "o":
+                                print(
+                                    f"Попытка постановки в отстой вагона, находящегося на {old_idle_reason}!")
+                            else:
+                                print(f"Попытка установки для вагона {self.wagon_number} на {mileage.date(index)} ",
+                                      f"отметки {new_idle_reason} взамен {old_idle_reason}!", sep="")
+                    continue
+                daily = 0
+            else:
+                continue
+            size = last - first
+            idle_reasons[first:last] = array("b", [new_code]) * size
+            columns["daily"][first:last] = array("q", [daily]) * size
+            if new_idle_reason in service_types:
+                for idle_reason in service_types:
+                    service_type = ("kr_sr"
+                                    if idle_reason in ("sr", "kr") else
+                                    idle_reason)
+                    columns[service_type][first:last] = array("q", [0]) * size
+                    if idle_reason == new_idle_reason:
+                        break
+            mileage.invalidate(first)
+            self.count_idle_reason_range_change(mileage.date(first),
+                                                mileage.date(last),
+                                                old_idle_reason,
+                                                new_idle_reason)
+            if verbose:
+                for index in range(first, last):
+                    date = mileage.date(index)
+                    if new_idle_reason is None:
+                        print(f"Для вагона №{self.wagon_number} на {date} ",
+                              f"снята отметка о нахождении в {'отстое' if old_idle_reason == 'o' else old_idle_reason}.", sep="")
+                    elif new_idle_reason == "o":
+                        print(f"Для вагона №{self.wagon_number} на {date} ",
+                              f"установлена отметка о постановке в отстой.", sep="")
+                    else:
+                        print(f"Для вагона №{self.wagon_number} на {date} ",
+                              f"установлена отметка о нахождении в {new_idle_reason} ",
+                              f"взамен {old_idle_reason}.", sep="")
+
+    def count_idle_reason_change(self,
+                                 date: datetime.date,
+                                 old_idle_reason: Union[str, None],
+                                 new_idle_reason: Union[str, None]):
+        """
+        Вносит изменение причины простоя вагона в указанную дату
+        в суточные счетчики Registry.wagons_in_motion, Registry.idle_wagons
+        и Registry.idle_wagons_index (если счетчики уже сформированы
+        и вагон учитывается в них, т.е. находится в сцепе).
+        """
+        self.count_idle_reason_range_change(date,
+                                            date + datetime.timedelta(days=1),
+                                            old_idle_reason,
+                                            new_idle_reason)
+
+    def count_idle_reason_range_change(self,
+                                       start_date: datetime.date,
+                                       end_date: datetime.date,
+                                       old_idle_reason: Union[str, None],
+                                       new_idle_reason: Union[str, None]):
+        """
+        Вносит изменение причины простоя вагона во всех датах диапазона
+        от start_date (включая) до end_date (не включая) в суточные счетчики
+        Registry.wagons_in_motion, Registry.idle_wagons и Registry.idle_wagons_index
+        (если счетчики уже сформированы и вагон учитывается в них, т.е. находится в сцепе;
+        даты за пределами периода счетчиков не учитываются).
+        В каждый счетчик изменение вносится одной операцией над диапазоном индексов.
+        """
+        if not self.in_train:
+            return
+        wagons_in_motion = self.session.wagons_in_motion
+        idle_wagons = self.session.idle_wagons
+        if wagons_in_motion is None or not idle_wagons:
+            return
+        first_index = max(wagons_in_motion.index(start_date), 0)
+        last_index = min(wagons_in_motion.index(end_date), len(wagons_in_motion))
+        if first_index >= last_index:
+            return
+        for idle_reason, value in ((old_idle_reason, -1), (new_idle_reason, 1)):
+            if idle_reason is None:
+                wagons_in_motion.add(first_index, last_index, value)
+                continue
+            idle_wagons_counter = idle_wagons.get(idle_reason)
+            if idle_wagons_counter is not None:
+                idle_wagons_counter.add(first_index, last_index, value)
+            idle_wagons_index = self.session.idle_wagons_index.get(idle_reason)
+            if idle_wagons_index is not None:
+                idle_wagons_index.add(first_index, last_index, value)
+
     def define_nearly_service_startdate(self,
                                         service_wagons: dict,
                                         periods_startdates: list):
@@ -462,10 +1727,7 @@ class Wagon:
         Определяет и возвращает норму простоя на этом виде ТОиР
         в формате datetime.timedelta(days=X)
         """
-        for wagon_models, duration in Registry.duration_standards.items():
-            if self.wagon_model in wagon_models:
-                service_duration = duration[service_type]
-        return service_duration
+        return self.duration_standards[service_type]
 
     def define_wagon_mileage_stardards(self):
         """
@@ -473,10 +1735,7 @@ class Wagon:
         Определяет и возвращает норму простоя на этом виде ТОиР
         в формате datetime.timedelta(days=X)
         """
-        for wagon_models, standards in Registry.mileage_standards.items():
-            if self.wagon_model in wagon_models:
-                mileage_standards = standards
-        return mileage_standards
+        return self.mileage_standards
 
     def verify_allowed_service_date(self,
                                     date: datetime.date,
@@ -490,9 +1749,7 @@ class Wagon:
         # debug
         # from selection import select_debug_data_path
 
-        for wagon_models, standards in Registry.mileage_standards.items():
-            if self.wagon_model in wagon_models:
-                mileage_standards = standards
+        mileage_standards = self.mileage_standards
         preplanned_services = self.preplanned_services
         if (preplanned_services is not None and
                 service_type in preplanned_services.keys()
@@ -541,6 +1798,74 @@ class Wagon:
             else:
                 return False
 
+    def define_allowed_service_indexes(self,
+                                       service_type: str):
+        """
+        Определяет по пробегам диапазоны индексов таблицы пробегов (дат),
+        в которые указанному вагону возможно выполнение указанного вида ТОиР
+        (т.е. в которые verify_allowed_service_date возвращает True).
+        Между датами выполнения ТОиР пробеги только растут, поэтому границы
+        каждого диапазона находятся двоичным поиском по пробегам.
+        Пробеги должны быть предварительно пересчитаны.
+        Возвращает список вида [(начальный_индекс, конечный_индекс), ...]
+        (конечный индекс не включается).
+        """
+        mileage_standards = self.mileage_standards
+        preplanned_services = self.preplanned_services
+        if (preplanned_services is not None and
+                service_type in preplanned_services.keys()):
+            min_mileage = mileage_standards[service_type]["min"]
+            max_mileage = mileage_standards[service_type]["max"]
+        else:
+            min_mileage = mileage_standards[service_type]["standing_min"]
+            max_mileage = mileage_standards[service_type]["standing_max"]
+        size = len(self.mileage)
+        mileage_ne = self.mileage.columns["ne"]
+        res = []
+        if service_type == "kr":
+            first_index = bisect_left(mileage_ne, min_mileage, 0, size)
+            last_index = bisect_right(mileage_ne, max_mileage, 0, size)
+            for sr_first_index, sr_last_index in self.define_allowed_service_indexes("sr"):
+                first = max(first_index, sr_first_index)
+                last = min(last_index, sr_last_index)
+                if first < last:
+                    res.append((first, last))
+            return res
+        if service_type not in ("to1", "to2", "to3", "tr1", "tr2", "tr3", "sr"):
+            return res
+        mileage_service = self.mileage.columns["kr_sr"
+                                               if service_type == "sr" else
+                                               service_type]
+        # Диапазоны монотонного роста пробега: до первой даты ТОиР
+        # (если пробег от ТОиР неизвестен - по пробегу от н.э.)
+        # и от каждой даты ТОиР до следующей
+        index = 0
+        while index < size:
+            try:
+                service_index = mileage_service.index(0, index + 1, size)
+            except ValueError:
+                service_index = size
+            mileage = (mileage_ne
+                       if mileage_service[index] == MileageTable.NONE else
+                       mileage_service)
+            first_index = bisect_left(mileage, min_mileage, index, service_index)
+            last_index = bisect_right(mileage, max_mileage, index, service_index)
+            if first_index < last_index:
+                res.append((first_index, last_index))
+            index = service_index
+        return res
+
+    def define_allowed_service_periods(self,
+                                       service_type: str):
+        """
+        Определяет по пробегам диапазоны дат, в которые указанному вагону
+        возможно выполнение указанного вида ТОиР (см. define_allowed_service_indexes).
+        Возвращает список вида [(начальная_дата, конечная_дата), ...]
+        (конечная дата не включается).
+        """
+        return [(self.mileage.date(first_index), self.mileage.date(last_index))
+                for first_index, last_index in self.define_allowed_service_indexes(service_type)]
+
     def verify_allowed_service_period(self,
                                       service_type: str,
                                       start_date: datetime.date = None,
@@ -552,15 +1877,14 @@ class Wagon:
         за указанный период (по умолчанию - за период использования вагона).
         Возвращает bool
         """
-        from utility import check_input_dates_usage
+        from .utility import check_input_dates_usage
 
         start_date, end_date = check_input_dates_usage(self.wagon_number,
                                                        start_date,
-                                                       end_date)
+                                                       end_date,
+                                                       session=self.session)
         date_delta = datetime.timedelta(days=1)
-        for wagon_models, standards in Registry.mileage_standards.items():
-            if self.wagon_model in wagon_models:
-                mileage_standards = standards
+        mileage_standards = self.mileage_standards
         # min_mileage = mileage_standards[service_type]["min"]
         min_mileage = mileage_standards[service_type]["standing_min"]
         if start_date == self.usage_end_date:
@@ -595,7 +1919,7 @@ class Wagon:
         в один из диапазонов дат начала предзапланированного вида указанного ТОиР 
         Возвращает bool
         """
-        from utility import daterange
+        from .utility import daterange
 
         if self.preplanned_services is None:
             return False
@@ -609,7 +1933,7 @@ class Wagon:
                 return False
 
     def __repr__(self):
-        from utility import daterange
+        from .utility import daterange
 
         formatted_start_date = datetime.date.strftime(
             self.usage_start_date, "%d.%m.%Y")
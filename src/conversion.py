@@ -6,14 +6,17 @@
 # **************************
 
 __all__ = [
+    "EXTRA_DATA_COLUMNS",
+    "MAIN_DATA_COLUMNS",
     "convert_confirmed_trains",
+    "convert_extra_wagons_attrs",
     "convert_preplanned_services",
     "convert_wagons_attrs",
 ]
 
 import datetime
-from classes import Registry
-from utility import daterange
+from .classes import Registry
+from .utility import daterange
 
 
 #       in_train    train_number    -           wagon_number    production_date     wagon_model     mileage_ne_0    mileage_kr_sr_0 mileage_tr3_0   -           -       -               -           mileage_tr1_0   mileage_tr2_0   -       -
@@ -21,13 +24,20 @@ from utility import daterange
 # 0: [  '-',        '\xa0',         'ТЧ-5/3',   '0205',         '05.04.2014',       '81-714.5П',    '490277',       '\xa0',         '0',            'ТР-3',     '0',    '08.01.2018',   '\xa0',     '0',            '0',            '0',    'Октябpьский вагоноремонтный', 'завод']
 
 
+# Индексы столбцов основного файла html, используемых convert_wagons_attrs
+MAIN_DATA_COLUMNS = (0, 1, 3, 4, 5, 6, 7, 8, 13, 14)
+# Индексы столбцов дополнительного файла html, используемых convert_extra_wagons_attrs
+EXTRA_DATA_COLUMNS = (2, 3, 5, 6, 8, 11, 14)
+
+
 def convert_wagons_attrs(raw_attrs: dict):
     """ 
-    Получает словарь со списками необработанных атрибутов после парсинга основного файла html.
+    Получает словарь со списками необработанных атрибутов после парсинга основного файла html
+    (или последовательность пар (номер_строки, атрибуты), например StreamingTableParser.iter_rows).
     Возвращает список со словарями обработанных атрибутов для создания экземпляров класса Wagon()
     """
     wagon_attrs = []
-    for i, attrs in raw_attrs.items():
+    for i, attrs in (raw_attrs.items() if isinstance(raw_attrs, dict) else raw_attrs):
         attrs_dict = {}
         # train_number
         if attrs[1] == "\xa0":
@@ -134,16 +144,74 @@ def convert_wagons_attrs(raw_attrs: dict):
     return wagon_attrs
 
 
-def convert_confirmed_trains(confirmed_trains: list):
+def convert_extra_wagons_attrs(raw_attrs: dict):
+    """
+    Получает словарь со списками необработанных атрибутов после парсинга дополнительного файла html
+    (или последовательность пар (номер_строки, атрибуты), например StreamingTableParser.iter_rows).
+    Возвращает список со словарями обработанных атрибутов для changing.update_wagons_attrs вида
+    {"wagon_number": номер_вагона,
+     "mileage_tr2_0": пробег_от_ТР-2 (None - нет данных),
+     "mileage_tr1_0": пробег_от_ТР-1 (None - нет данных),
+     "services_mileage_0": [(вид_ТО, пробег_от_ТО), ...] - в порядке столбцов выгрузки}
+    Строки с некорректными номером вагона или пробегом от ТР-2 или ТР-1 пропускаются.
+    """
+    wagon_attrs = []
+    for i, attrs in (raw_attrs.items() if isinstance(raw_attrs, dict) else raw_attrs):
+        attrs_dict = {"services_mileage_0": []}
+        # wagon_number
+        try:
+            attrs_dict["wagon_number"] = int(attrs[2])
+        except ValueError:
+            print(f"Лог функции convert_extra_wagons_attrs.\
+                  Для {i} ключа некорректное значение номера вагона {attrs[2]}.")
+            continue
+        # mileage_tr2_0
+        if attrs[14] == "\xa0":
+            attrs_dict["mileage_tr2_0"] = None
+        else:
+            try:
+                attrs_dict["mileage_tr2_0"] = int(attrs[14])
+            except ValueError:
+                print(f"Лог функции convert_extra_wagons_attrs.\
+                      Для {i} ключа некорректное значение пробега от ТР-2 {attrs[14]}")
+                continue
+        # mileage_tr1_0
+        if attrs[11] == "\xa0":
+            attrs_dict["mileage_tr1_0"] = None
+        else:
+            try:
+                attrs_dict["mileage_tr1_0"] = int(attrs[11])
+            except ValueError:
+                print(f"Лог функции convert_extra_wagons_attrs.\
+                      Для {i} ключа некорректное значение пробега от ТР-1 {attrs[11]}")
+                continue
+        # ТО-3 (ТО-2 для АТП), затем ТО-2 (ТО-1 для АТП)
+        for type_index, mileage_index, service_types in ((6, 8, {"ТО-3": "to3", "ТО-2": "to2"}),
+                                                         (3, 5, {"ТО-2": "to2", "ТО-1": "to1"})):
+            service_type = service_types.get(attrs[type_index])
+            if service_type is None or attrs[mileage_index] == "\xa0":
+                continue
+            try:
+                attrs_dict["services_mileage_0"].append((service_type, int(attrs[mileage_index])))
+            except ValueError:
+                print(f"Лог функции convert_extra_wagons_attrs.\
+                      Для {i} ключа некорректное значение пробега от {attrs[type_index]} {attrs[mileage_index]}")
+        wagon_attrs.append(attrs_dict)
+    return wagon_attrs
+
+
+def convert_confirmed_trains(confirmed_trains: list, session=None):
     """
     Получает список подтвержденных возможных составов вида [[номера_вагонов], [номера_вагонов]]
     Возвращает словарь вида {номер_сцепа: {номер_вагона: объект_вагона}}
     """
+    if session is None:
+        session = Registry
     if not confirmed_trains is None:
         count = len(confirmed_trains)
         new_train_numbers = []
         for train_number in range(901, 930):
-            if Registry.trains.get(train_number) is None:
+            if session.trains.get(train_number) is None:
                 new_train_numbers.append(train_number)
                 if len(new_train_numbers) == count:
                     break
@@ -152,17 +220,19 @@ def convert_confirmed_trains(confirmed_trains: list):
             train_number = new_train_numbers.pop()
             trains_for_creation[train_number] = {}
             for wagon_number in train_wagons:
-                trains_for_creation[train_number][wagon_number] = Registry.wagons[wagon_number]
+                trains_for_creation[train_number][wagon_number] = session.wagons[wagon_number]
         return trains_for_creation
 
 
-def convert_preplanned_services(preplanned_services: list):
+def convert_preplanned_services(preplanned_services: list, session=None):
     """
     Преобразует список предварительно запланированных ТОиР,
     заданный пользователем (вида [[номер_вагона, "вид_ТОиР", "месяц.год"], ...]), 
     к формату для внесения в расчет вида {номер_вагона: {вид_ТОиР: [(дата_начала, дата_конца), ...]}},
     где дата_начала и дата_конца - границы периода возможной постановки (!) вагона в ТОиР.
     """
+    if session is None:
+        session = Registry
     service_types = {"КР": "kr", "СР": "sr",
                      "ТР-3": "tr3", "ТР-2": "tr2",
                      "ТР-1": "tr1", "ТО-3": "to3",
@@ -184,9 +254,7 @@ def convert_preplanned_services(preplanned_services: list):
             end_date = datetime.datetime.strptime(
                 ".".join([str(month_number + 1),
                           str(year_number)]), "%m.%Y").date()
-        for wagon_models, durations in Registry.duration_standards.items():
-            if Registry.wagons[wagon_number].wagon_model in wagon_models:
-                date_delta = durations[service_types[raw_service_type]]
+        date_delta = session.wagons[wagon_number].define_wagon_service_duration(service_type)
         begin_service_end = (end_date -
                              date_delta +
                              datetime.timedelta(days=1))
@@ -6,18 +6,26 @@
 # **************************
 
 __all__ = [
+    "create_columnar_file_output",
     "create_debug_file_output",
+    "create_planning_session",
+    "create_sqlite_file_output",
     "create_trains",
     "create_wagons",
 ]
 
 import datetime
-from changing import change_unhitched_wagons
-from classes import Registry, Train, Wagon
-from utility import daterange
+import json
+import os
+import sqlite3
+import sys
+from .changing import change_unhitched_wagons
+from .classes import MileageTable, PlanningSession, Registry, Train, Wagon
+from .utility import daterange
 
 
-def create_wagons(wagons_attrs: list, start_date: datetime.date, end_date: datetime.date):
+def create_wagons(wagons_attrs: list, start_date: datetime.date, end_date: datetime.date,
+                  session=None):
     """ 
     Получает значение интервала планирования и список со словарями вагонных атрибутов
     Возвращает словарь с экземплярами класса Wagon() вида {номер_вагона: объект_вагона}
@@ -25,11 +33,11 @@ def create_wagons(wagons_attrs: list, start_date: datetime.date, end_date: datet
     res = {}
     for wagon in wagons_attrs:
         res[wagon["wagon_number"]] = Wagon(
-            usage_start_date=start_date, usage_end_date=end_date, **wagon)
+            usage_start_date=start_date, usage_end_date=end_date, session=session, **wagon)
     return res
 
 
-def create_trains(train_lenght: int, hitched_wagons: dict, verbose=False):
+def create_trains(train_lenght: int, hitched_wagons: dict, verbose=False, session=None):
     """ 
     Получает словарь вида {номер_сцепа: {номер_вагона: объект_вагона}}.
     Формирует словарь с экземплярами класса Train() вида {номер_сцепа: объект_сцепа}
@@ -38,7 +46,8 @@ def create_trains(train_lenght: int, hitched_wagons: dict, verbose=False):
         res = {}
         for train_number, wagons in hitched_wagons.items():
             res[train_number] = Train(
-                train_lenght=train_lenght, train_number=train_number, wagons=wagons)
+                train_lenght=train_lenght, train_number=train_number, wagons=wagons,
+                session=session)
             if verbose:
                 print(
                     f"Создан сцеп № {train_number} из вагонов {[wag_num for wag_num in wagons.keys()]}")
@@ -47,7 +56,7 @@ def create_trains(train_lenght: int, hitched_wagons: dict, verbose=False):
                     wagon_object.in_train = True
                     wagon_object.train_number = train_number
                     change_unhitched_wagons(
-                        wagon_number=wagon_number, add=False)
+                        wagon_number=wagon_number, add=False, session=session)
                     if verbose:
                         print(
                             f'Вагону № {wagon_number} установлено значение "В сцепе": {True}')
@@ -58,24 +67,26 @@ def create_trains(train_lenght: int, hitched_wagons: dict, verbose=False):
         return res
 
 
-def create_debug_file_output(write_path):
+def create_debug_file_output(write_path, session=None):
     """
     Для всех вагонов всех сцепов выгружает содержимое атрибута mileage
     в файл Data/test_planning.txt
     """
-    dur = (Registry.planning_end_date - Registry.planning_start_date).days
+    if session is None:
+        session = Registry
+    dur = (session.planning_end_date - session.planning_start_date).days
     with open(write_path, mode="wt", encoding="utf-8") as debug_file:
         print("%12s" % "Сут.пр. |", end="", file=debug_file)
-        for date in daterange(Registry.planning_start_date, Registry.planning_end_date):
-            res = Registry.wagon_daily_mileage[date]
+        for date in daterange(session.planning_start_date, session.planning_end_date):
+            res = session.wagon_daily_mileage[date]
             print(f"{res:10}|", end="", file=debug_file)
         print("\n", "%11s" % "Ваг.дв. |", end="", file=debug_file)
-        for date in daterange(Registry.planning_start_date, Registry.planning_end_date):
-            res = Registry.wagons_in_motion[date]
+        for date in daterange(session.planning_start_date, session.planning_end_date):
+            res = session.wagons_in_motion[date]
             print(f"{res:10}|", end="", file=debug_file)
-        for train_num, train_obj in sorted(Registry.trains.items()):
+        for train_num, train_obj in sorted(session.trains.items()):
             print("\n", "%-10s" % "Дата", *[date for date in daterange(
-                Registry.planning_start_date, Registry.planning_end_date)], end="", file=debug_file)
+                session.planning_start_date, session.planning_end_date)], end="", file=debug_file)
             print("\n", f"Сцеп №{train_num:3d} |**********|**********|**********|" *
                   (int(dur/4)), end="", file=debug_file)
             for wag_num, wag_obj in sorted(train_obj.wagons.items()):
@@ -103,7 +114,279 @@ def create_debug_file_output(write_path):
                 ):
                     print("\n", "%11s" %
                           resolver[element], end="", file=debug_file)
-                    for date in daterange(Registry.planning_start_date, Registry.planning_end_date):
-                        result = wag_obj.mileage[date][element]
+                    for result in wag_obj.mileage.values(element,
+                                                         session.planning_start_date,
+                                                         session.planning_end_date):
                         res = ' ' if result is None else result
                         print(f"{res:10}|", end="", file=debug_file)
+
+
+def create_columnar_file_output(write_path,
+                                fields=None,
+                                session=None):
+    """
+    Для всех вагонов всех сцепов выгружает поля атрибута mileage
+    (по умолчанию - все поля MileageTable.fields) в двоичный поколоночный файл:
+    8 байт - длина заголовка (целое без знака, little-endian),
+    заголовок - JSON в кодировке utf-8, дополненный пробелами до кратности 8 байтам,
+    далее - массивы значений полей (MileageTable.columns) без преобразования,
+    каждый с выравниванием на 8 байт.
+    Заголовок содержит даты расчета, порядок байт, коды причин простоя (MileageTable.reasons),
+    значение пробега для None (MileageTable.NONE) и для каждого вагона - номер сцепа,
+    начальную дату и количество дат таблицы, а для каждого поля - код типа array,
+    смещение массива от начала данных и его длину в байтах.
+    Массив одного поля одного вагона можно отобразить в память,
+    не читая остальные данные (см. parsing.read_columnar_file_output).
+    """
+    if session is None:
+        session = Registry
+    if fields is None:
+        fields = MileageTable.fields
+    alignment = 8
+    wagons = []
+    arrays = []
+    offset = 0
+    for train_number, train_object in sorted(session.trains.items()):
+        for wagon_number, wagon_object in sorted(train_object.wagons.items()):
+            mileage = wagon_object.mileage
+            wagon_columns = {}
+            for field in fields:
+                column = mileage.columns[field]
+                size = len(column) * column.itemsize
+                wagon_columns[field] = {"typecode": column.typecode,
+                                        "offset": offset,
+                                        "size": size}
+                arrays.append(column)
+                offset += size + (-size) % alignment
+            wagons.append({"wagon_number": wagon_number,
+                           "train_number": train_number,
+                           "start_date": mileage.start_date.isoformat(),
+                           "length": mileage.size,
+                           "columns": wagon_columns})
+    header = json.dumps({"planning_start_date": session.planning_start_date.isoformat(),
+                         "planning_end_date": session.planning_end_date.isoformat(),
+                         "byteorder": sys.byteorder,
+                         "reasons": list(MileageTable.reasons),
+                         "none": MileageTable.NONE,
+                         "wagons": wagons},
+                        ensure_ascii=False).encode("utf-8")
+    header += b" " * ((-len(header)) % alignment)
+    with open(write_path, mode="wb") as columnar_file:
+        columnar_file.write(len(header).to_bytes(8, "little"))
+        columnar_file.write(header)
+        for column in arrays:
+            columnar_file.write(column)
+            columnar_file.write(bytes((-len(column) * column.itemsize) % alignment))
+
+
+def create_planning_session(planning_inputs: dict,
+                            standing_min_percentage: float = 0.6,
+                            transportation_values: dict = None,
+                            confirm_trains=None,
+                            current_idle_end=None,
+                            session: PlanningSession = None):
+    """
+    Получает исходные данные расчета (см. selection.select_planning_inputs).
+    Заполняет сессию расчета (по умолчанию - Registry) перед планированием ТОиР:
+    нормативы, вагоны, сцепы, парности, суточный пробег линии,
+    причины простоя на дату начала расчета и предзапланированные ТОиР.
+    standing_min_percentage - процент от диапазона ТОиР (см. mileage_frequency_standards),
+    transportation_values - парности вместо заданных в planning_inputs,
+    confirm_trains - функция, получающая словарь возможных сцепов
+    (см. select_possible_trains) и возвращающая подтвержденные сцепы
+    (по умолчанию - confirm_possible_trains с запросом у пользователя),
+    current_idle_end - функция, получающая вагоны в простое на дату начала расчета
+    (см. select_idle_wagons) и сессию и возвращающая ТОиР, выполняемые на эту дату
+    (по умолчанию - select_current_idle_end).
+    Возвращает сессию расчета.
+    """
+    from .calculation import (
+        calculate_line_daily_mileage,
+        calculate_train_lenght,
+        calculate_transportation_values
+    )
+    from .changing import update_wagons_attrs
+    from .classes import WorkCalendar
+    from .confirmation import confirm_possible_trains
+    from .conversion import (
+        convert_confirmed_trains,
+        convert_preplanned_services
+    )
+    from .normatives import (
+        mileage_frequency_standards,
+        models_standards,
+        service_duration_standards
+    )
+    from .parsing import convert_start_date
+    from .profiling import profile_stage
+    from .selection import (
+        select_current_idle_end,
+        select_hitched_wagons,
+        select_idle_wagons,
+        select_possible_trains,
+        select_unhitched_wagons
+    )
+
+    if session is None:
+        session = Registry
+    if confirm_trains is None:
+        confirm_trains = confirm_possible_trains
+    if current_idle_end is None:
+        current_idle_end = select_current_idle_end
+    if transportation_values is None:
+        transportation_values = planning_inputs["transportation_values"]
+
+    session.planning_start_date = convert_start_date(planning_inputs["raw_start_date"])
+    session.planning_end_date = planning_inputs["planning_end_date"]
+
+    session.mileage_standards = mileage_frequency_standards(standing_min_percentage)
+    session.duration_standards = service_duration_standards()
+    session.models_mileage_standards = models_standards(session.mileage_standards)
+    session.models_duration_standards = models_standards(session.duration_standards)
+    with profile_stage("create_wagons", session=session):
+        session.wagons = create_wagons(planning_inputs["wagons_attrs"],
+                                       start_date=session.planning_start_date,
+                                       end_date=session.planning_end_date,
+                                       session=session)
+
+    update_wagons_attrs(planning_inputs["extra_wagons_attrs"], session=session)
+
+    hitched_wagons = select_hitched_wagons(session=session)
+    session.train_lenght = calculate_train_lenght(hitched_wagons)
+    session.unhitched_wagons = select_unhitched_wagons(session=session)
+    confirmed_trains = confirm_trains(select_possible_trains(session=session))
+    with profile_stage("create_trains", session=session):
+        session.trains = create_trains(
+            session.train_lenght, hitched_wagons, verbose=False, session=session)
+        if not confirmed_trains is None:
+            session.trains.update(create_trains(
+                session.train_lenght, convert_confirmed_trains(confirmed_trains, session=session),
+                session=session))
+
+    session.transportation_values = calculate_transportation_values(
+        start_date=session.planning_start_date,
+        end_date=session.planning_end_date,
+        basic_values=transportation_values,
+        line_motion_time=planning_inputs["line_motion_time"])
+    session.calendar = WorkCalendar(session.transportation_values)
+
+    calculate_line_daily_mileage(session=session)
+
+    for wagon_object in session.wagons.values():
+        serv_date = wagon_object.usage_start_date
+        wagon_object.change_idle_reason(serv_date,
+                                        wagon_object.define_service_type(
+                                            serv_date),
+                                        verbose=False)
+
+    for train_object in session.trains.values():
+        if not train_object.verify_wagons_idle_reasons(session.planning_start_date,
+                                                       verbose=False):
+            train_object.unify_train_service_type(session.planning_start_date,
+                                                  verbose=False)
+
+    # Проставляем на начало расчета отстой сцепу №904 (56009-56010) по ремонту редукторов
+    # ТОЛЬКО ДЛЯ РАСЧЕТА ОТ 31.03.2022!!!
+    # (в синтетических данных benchmark сцепа №904 нет)
+    for wagon_object in (session.trains[904].wagons.values() if 904 in session.trains else ()):
+        wagon_object.change_idle_reason(session.planning_start_date,
+                                        "o",
+                                        verbose=False)
+
+    session.result_services = current_idle_end(
+        select_idle_wagons(session.planning_start_date, session=session),
+        session=session)
+
+    # Вносим в расчет информацию о выходе из ТОиР вагонов,
+    # находящихся в ТОиР на дату начала расчета
+    for service_type, periods in session.result_services.items():
+        for (start_date, end_date), rolling_stock_data in periods.items():
+            first_date = start_date + datetime.timedelta(days=1)
+            for rolling_stock_type, objects in rolling_stock_data.items():
+                for rolling_stock_object in objects:
+                    if rolling_stock_type in ("trains", "single_wagons"):
+                        rolling_stock_object.change_idle_reason_range(first_date,
+                                                                      end_date,
+                                                                      service_type,
+                                                                      verbose=False)
+
+    converted_preplanned_services = convert_preplanned_services(
+        planning_inputs["preplanned_services"], session=session)
+    # Вносим в расчет информацию о предзапланированных ТОиР
+    for wagon_number, services in converted_preplanned_services.items():
+        session.wagons[wagon_number].preplanned_services = services
+    return session
+
+
+def create_sqlite_file_output(write_path, session=None):
+    """
+    Выгружает результаты планирования в базу данных SQLite (файл пересоздается):
+    таблица services - запланированные ТОиР (result_services), по строке на вагон:
+    вид ТОиР, первая и последняя даты ТОиР, номер сцепа (для посоставного ТОиР сцепа,
+    иначе NULL), номер вагона;
+    таблица fleet_days - суточные показатели парка на каждую дату периода планирования:
+    количество вагонов в движении (wagons_in_motion), суточный пробег вагона в движении
+    (wagon_daily_mileage) и суммарный суточный пробег линии (line_daily_mileage);
+    таблица idle_wagons - количество вагонов в простое на каждую дату по причинам простоя.
+    Даты хранятся в формате ГГГГ-ММ-ДД, таблицы индексированы по датам, сцепам и вагонам.
+    Таблицы создаются до начала транзакции, все данные и индексы записываются
+    в одной транзакции (executescript перед выполнением фиксирует открытую транзакцию,
+    поэтому после создания таблиц используются только execute и executemany).
+    """
+    if session is None:
+        session = Registry
+    delta = datetime.timedelta(days=1)
+    services_rows = []
+    for service_type, service_data in (session.result_services or {}).items():
+        for (start_date, end_date), period_data in service_data.items():
+            first_date, last_date = start_date.isoformat(), (end_date - delta).isoformat()
+            for train_object in period_data.get("trains", ()):
+                for wagon_number in sorted(train_object.wagons):
+                    services_rows.append((service_type, first_date, last_date,
+                                          train_object.train_number, wagon_number))
+            for wagon_object in period_data.get("single_wagons", ()):
+                services_rows.append((service_type, first_date, last_date,
+                                      None, wagon_object.wagon_number))
+    fleet_days_rows = []
+    idle_wagons_rows = []
+    for date in daterange(session.planning_start_date, session.planning_end_date):
+        fleet_days_rows.append((date.isoformat(),
+                                session.wagons_in_motion.get(date),
+                                session.wagon_daily_mileage.get(date),
+                                session.line_daily_mileage.get(date)))
+        for idle_reason, idle_wagons in session.idle_wagons.items():
+            idle_wagons_rows.append((date.isoformat(), idle_reason, idle_wagons.get(date)))
+
+    if os.path.exists(write_path):
+        os.remove(write_path)
+    connection = sqlite3.connect(write_path)
+    try:
+        connection.executescript("""
+            CREATE TABLE services (
+                service_type TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                train_number INTEGER,
+                wagon_number INTEGER NOT NULL);
+            CREATE TABLE fleet_days (
+                date TEXT PRIMARY KEY,
+                wagons_in_motion INTEGER,
+                wagon_daily_mileage REAL,
+                line_daily_mileage REAL);
+            CREATE TABLE idle_wagons (
+                date TEXT NOT NULL,
+                idle_reason TEXT NOT NULL,
+                wagons_count INTEGER NOT NULL,
+                PRIMARY KEY (date, idle_reason));
+            """)
+        with connection:
+            connection.executemany("INSERT INTO services VALUES (?, ?, ?, ?, ?)", services_rows)
+            connection.executemany("INSERT INTO fleet_days VALUES (?, ?, ?, ?)", fleet_days_rows)
+            connection.executemany("INSERT INTO idle_wagons VALUES (?, ?, ?)", idle_wagons_rows)
+            for index_sql in ("CREATE INDEX services_dates ON services (start_date, end_date)",
+                              "CREATE INDEX services_type_dates ON services (service_type, start_date)",
+                              "CREATE INDEX services_train ON services (train_number)",
+                              "CREATE INDEX services_wagon ON services (wagon_number)"):
+                connection.execute(index_sql)
+    finally:
+        connection.close()
@@ -7,11 +7,15 @@
 
 __all__ = [
     "define_periods_startdates",
+    "define_periods_trains_queues",
+    "define_startdates_service_wagons",
     "define_wagons_outside_service_periods"
 ]
 
 import datetime
-from classes import Registry
+from bisect import bisect_left
+from heapq import heapify
+from .classes import Registry
 
 
 def define_periods_startdates(standing_dates: dict):
@@ -30,18 +34,93 @@ def define_periods_startdates(standing_dates: dict):
     return res
 
 
+def define_periods_trains_queues(service_type: str,
+                                 priorities: dict):
+    """
+    Для всех периодов всех приоритетов одной нормы простоя в standing_dates
+    формирует очереди сцепов на постановку в ТОиР:
+    список сцепов, вагонам которых предзапланирован вид ТОиР с датой начала периода
+    (в порядке period_data["trains"]), и кучу остальных сцепов по убыванию доли пробега.
+    Возвращает кортеж из двух словарей:
+    periods_queues = {
+        приоритет: [
+            (период, данные_периода, [список_предзапланированных_сцепов],
+             [куча_кортежей_(-доля_пробега, -номер_сцепа, объект_сцепа)]),
+            ...] - по возрастанию периодов
+                     }
+    trains_periods = {
+        объект_сцепа: [(период, данные_периода), ...] - периоды всех приоритетов,
+                                                        в которых есть сцеп
+                     }
+    Сцепы, удаленные из period_data["trains"], из куч не удаляются
+    и должны пропускаться при выборке.
+    """
+    periods_queues = {}
+    trains_periods = {}
+    for priority, priority_data in priorities.items():
+        periods_queues[priority] = []
+        for period, period_data in sorted(priority_data["periods"].items()):
+            start_date, end_date = period
+            preplanned_trains = []
+            trains_heap = []
+            for train_object, percentage in period_data["trains"].items():
+                if any(wagon_object.verify_preplanned_service_date(service_type, start_date)
+                       for wagon_object in train_object.wagons.values()):
+                    preplanned_trains.append(train_object)
+                trains_heap.append((-percentage,
+                                    -train_object.train_number,
+                                    train_object))
+                trains_periods.setdefault(train_object, []).append((period,
+                                                                    period_data))
+            heapify(trains_heap)
+            periods_queues[priority].append((period, period_data,
+                                             preplanned_trains, trains_heap))
+    return periods_queues, trains_periods
+
+
+def define_startdates_service_wagons(service_wagons: dict,
+                                     standing_dates: dict):
+    """
+    Определяет для каждой даты начала периода в standing_dates вагоны
+    из service_wagons с той же нормой простоя, в диапазоны возможных дат
+    постановки в ТОиР которых эта дата попадает.
+    Возвращает словарь вида
+    {норма_простоя_на_ТОиР: {дата_начала_периода_ТОиР: [список_номеров_вагонов]}}.
+    Номера вагонов в списках следуют в порядке service_wagons.
+    """
+    periods_startdates = define_periods_startdates(standing_dates)
+    res = {delta: {} for delta in periods_startdates.keys()}
+    for wagon_number, periods_deltas in service_wagons.items():
+        delta = periods_deltas["delta"]
+        if delta not in res:
+            continue
+        startdates = periods_startdates[delta]
+        wagon_startdates = set()
+        for dates in periods_deltas["periods"]:
+            for start_date, end_date in dates.intervals():
+                wagon_startdates.update(startdates[bisect_left(startdates, start_date):
+                                                   bisect_left(startdates, end_date)])
+        for startdate in wagon_startdates:
+            res[delta].setdefault(startdate, []).append(wagon_number)
+    return res
+
+
 def define_wagons_outside_service_periods(service_wagons: dict,
                                           standing_dates: dict,
-                                          service_type: str):
+                                          service_type: str,
+                                          session=None):
     """
     Определяет в service_wagons вагоны, не попадающие
     ни в один из периодов в standing_dates.
     Изменяет периоды возможных дат постановки в ТОиР для таких вагонов,
     проставляет отстой до ближайшей возможной даты постановки вагона в ТОиР.
     """
-    from calculation import calculate_wagon_mileage_ne, calculate_wagon_service_mileage
-    from changing import change_idle_reason
-    from utility import daterange
+    from .calculation import calculate_wagon_mileage_ne, calculate_wagon_service_mileage
+    from .changing import change_idle_reason
+    from .utility import daterange
+
+    if session is None:
+        session = Registry
 
     for wagon_number in service_wagons.keys():
         delta = service_wagons[wagon_number]["delta"]
@@ -51,11 +130,11 @@ def define_wagons_outside_service_periods(service_wagons: dict,
             for startdate in periods_startdates:
                 if startdate in period:
                     break
-                nearly_startdate = Registry.wagons[wagon_number].define_nearly_service_startdate(service_wagons,
-                                                                                                 periods_startdates)
+                nearly_startdate = session.wagons[wagon_number].define_nearly_service_startdate(service_wagons,
+                                                                                                periods_startdates)
                 if nearly_startdate is not None:
                     for date in daterange(period[-1], nearly_startdate):
                         change_idle_reason(wagon_number, date, "o")
-                    period.append(nearly_startdate)
-        calculate_wagon_mileage_ne(wagon_number)
-        calculate_wagon_service_mileage(wagon_number, service_type)
+                    period.add(nearly_startdate)
+        calculate_wagon_mileage_ne(wagon_number, session=session)
+        calculate_wagon_service_mileage(wagon_number, service_type, session=session)
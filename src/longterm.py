@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# **************************
+# src/longterm.py
+# **************************
+
+__all__ = [
+    "calculate_monthly_values",
+    "extend_transportation_values",
+    "format_long_term_services",
+    "plan_long_term_services",
+    "seed_preplanned_services",
+]
+
+import datetime
+from bisect import bisect_right
+from .calculation import calculate_reserve_wagons, calculate_transportation_values
+from .classes import Registry
+from .profiling import profiled
+
+
+def extend_transportation_values(basic_values: dict,
+                                 end_date: datetime.date):
+    """
+    Получает парности вида {дата_начала_периода: парности} (см. select_transportation_values).
+    Возвращает новый словарь, в котором периоды последнего года
+    (начинающиеся не ранее чем за год до последнего периода) повторяются
+    в каждом следующем году до end_date (не включая).
+    """
+    res = dict(basic_values)
+    last_date = max(basic_values)
+    year_dates = sorted(date for date in basic_values
+                        if date > last_date.replace(year=last_date.year - 1))
+    years = 1
+    while True:
+        for date in year_dates:
+            new_date = date.replace(year=date.year + years)
+            if new_date >= end_date:
+                return res
+            res[new_date] = dict(basic_values[date])
+        years += 1
+
+
+def calculate_monthly_values(start_date: datetime.date,
+                             end_date: datetime.date,
+                             basic_values: dict,
+                             line_motion_time: float,
+                             session=None):
+    """
+    Получает даты начала и конца расчета и парности (см. calculate_transportation_values).
+    Делит период на календарные месяцы (первый и последний могут быть неполными)
+    и возвращает список словарей вида:
+    [{"start_date": дата_начала_месяца,
+      "end_date": дата_начала_следующего_месяца,
+      "days": количество_суток,
+      "line_mileage": суммарный_пробег_по_линии_за_месяц,
+      "trains_count_max": максимальная_часовая_парность_за_месяц
+      }, ...]
+    Длина линии и количество вагонов в составе берутся из сессии (по умолчанию - Registry).
+    """
+    if session is None:
+        session = Registry
+    PAIR = 2
+    transportation_values = calculate_transportation_values(start_date=start_date,
+                                                            end_date=end_date,
+                                                            basic_values=basic_values,
+                                                            line_motion_time=line_motion_time)
+    res = []
+    month_start_date = start_date
+    while month_start_date < end_date:
+        month_end_date = min(end_date,
+                             datetime.date(month_start_date.year + month_start_date.month // 12,
+                                           month_start_date.month % 12 + 1,
+                                           1))
+        values = [transportation_values[month_start_date + datetime.timedelta(days=days)]
+                  for days in range((month_end_date - month_start_date).days)]
+        res.append({"start_date": month_start_date,
+                    "end_date": month_end_date,
+                    "days": len(values),
+                    "line_mileage": sum(value["pairs_count_sum"] for value in values) *
+                    session.line_lenght * PAIR * session.train_lenght,
+                    "trains_count_max": max(value["trains_count_max"] for value in values)})
+        month_start_date = month_end_date
+    return res
+
+
+@profiled
+def plan_long_term_services(planning_inputs: dict,
+                            end_date: datetime.date,
+                            usage_ratio: float = 0.8,
+                            transportation_values: dict = None,
+                            session=None):
+    """
+    Укрупненное планирование СР и КР сцепов по месяцам на длительный период
+    (10 - 30 лет) от даты начала расчета сессии до end_date (не включая).
+    Сессия (по умолчанию - Registry) должна быть подготовлена create_planning_session,
+    planning_inputs - исходные данные, по которым она подготовлена
+    (см. select_planning_inputs), transportation_values - парности
+    вместо заданных в planning_inputs. Парности последнего года повторяются
+    до end_date (см. extend_transportation_values).
+    Правила те же, что при планировании по суткам (service_planning):
+    - сцеп ставится в СР, начиная с месяца, на начало которого пробег от КР/СР
+      (при отсутствии данных - от н.э.) хотя бы одного вагона достиг нормы standing_min,
+      а в КР - если при этом пробег от н.э. в диапазоне нормы КР
+      (см. Wagon.verify_allowed_service_date);
+    - в первую очередь ставятся сцепы с максимальным процентом пробега от нормы standing_max;
+    - постановка возможна, если во все месяцы ТОиР количество вагонов сверх
+      максимальной парности (см. calculate_periods_surplus_wagons) не меньше длины сцепа;
+      в движении считаются вагоны, не простаивающие ни одних суток месяца;
+    - суточный пробег вагона в движении - доля usage_ratio пробега линии,
+      деленная на количество вагонов в движении (см. calculate_wagon_daily_mileage),
+      но в среднем за месяц.
+    ТОиР начинается в первую дату месяца. Простои на дату начала расчета
+    (session.result_services) учитываются, остальные ТОиР и отстой - нет.
+    Возвращает словарь вида:
+    {"services": {вид_ТОиР: {(дата_начала, дата_окончания): [объект_сцепа, ...]}},
+     "overrun_trains": [(объект_сцепа, дата_начала_месяца_с_перепробегом), ...],
+     "reserve_wagons": {дата_начала_месяца: минимальный_резерв_вагонов_сверх_максимальной_парности}
+     }
+    (дата окончания ТОиР - первая дата после ТОиР).
+    """
+    if session is None:
+        session = Registry
+    if transportation_values is None:
+        transportation_values = planning_inputs["transportation_values"]
+    months = calculate_monthly_values(session.planning_start_date,
+                                      end_date,
+                                      extend_transportation_values(transportation_values, end_date),
+                                      planning_inputs["line_motion_time"],
+                                      session=session)
+    months_start_dates = [month["start_date"] for month in months]
+    trains = [session.trains[train_number] for train_number in sorted(session.trains)]
+    fleet_wagons_count = sum(len(train_object.wagons) for train_object in trains)
+    # по месяцам: вагоно-сутки простоя и количество вагонов, простаивающих хотя бы одни сутки
+    idle_wagon_days = [0] * len(months)
+    idle_wagons = [0] * len(months)
+    # состояние сцепов вида {объект_сцепа: {"kr_sr": [пробеги_вагонов_от_КР/СР],
+    #                                       "ne": [пробеги_вагонов_от_н.э.],
+    #                                       "idles": [(дата_начала, дата_окончания), ...],
+    #                                       "idle_days": [суток_простоя_сцепа_по_месяцам],
+    #                                       "overrun": флаг_учтенного_перепробега}}
+    # (пробеги - на начало текущего месяца, None - нет данных)
+    trains_states = {}
+    for train_object in trains:
+        records = [wagon_object.mileage[wagon_object.usage_start_date]
+                   for wagon_object in train_object.wagons.values()]
+        trains_states[train_object] = {"kr_sr": [record["kr_sr"] for record in records],
+                                       "ne": [record["ne"] for record in records],
+                                       "idles": [],
+                                       "idle_days": [0] * len(months),
+                                       "overrun": False}
+
+    def add_idle(train_object, start_date: datetime.date, end_date: datetime.date):
+        """
+        Добавляет простой сцепа с start_date (включая) до end_date (не включая).
+        """
+        train_state = trains_states[train_object]
+        train_state["idles"].append((start_date, end_date))
+        wagons_count = len(train_object.wagons)
+        index = max(bisect_right(months_start_dates, start_date) - 1, 0)
+        while index < len(months) and months[index]["start_date"] < end_date:
+            days = (min(end_date, months[index]["end_date"]) -
+                    max(start_date, months[index]["start_date"])).days
+            if days > 0:
+                idle_wagon_days[index] += wagons_count * days
+                idle_wagons[index] += wagons_count
+                train_state["idle_days"][index] += days
+            index += 1
+
+    # Простои на дату начала расчета (см. create_planning_session)
+    for service_type, periods in session.result_services.items():
+        for (start_date, end_date), rolling_stock_data in periods.items():
+            for train_object in rolling_stock_data.get("trains", ()):
+                add_idle(train_object, start_date + datetime.timedelta(days=1), end_date)
+                if service_type in ("sr", "kr"):
+                    trains_states[train_object]["kr_sr"] = [0] * len(train_object.wagons)
+
+    services = {"sr": {}, "kr": {}}
+    overrun_trains = []
+    reserve_wagons = {}
+    for index, month in enumerate(months):
+        month_start_date = month["start_date"]
+        # Сцепы, у которых на начало месяца открылся диапазон постановки в СР/КР,
+        # вида [(процент_пробега, номер_сцепа, объект_сцепа), ...]
+        candidates = []
+        for train_object, train_state in trains_states.items():
+            if any(end_date > month_start_date for start_date, end_date in train_state["idles"]):
+                continue
+            percentage = 0
+            allowed_flag = False
+            for wagon_object, mileage_kr_sr, mileage_ne in zip(train_object.wagons.values(),
+                                                               train_state["kr_sr"],
+                                                               train_state["ne"]):
+                standards = wagon_object.mileage_standards["sr"]
+                mileage = mileage_ne if mileage_kr_sr is None else mileage_kr_sr
+                if mileage >= standards["standing_min"]:
+                    allowed_flag = True
+                percentage = max(percentage, mileage / standards["standing_max"])
+            if allowed_flag:
+                candidates.append((percentage, train_object.train_number, train_object))
+                if percentage > 1 and not train_state["overrun"]:
+                    train_state["overrun"] = True
+                    overrun_trains.append((train_object, month_start_date))
+        for percentage, train_number, train_object in sorted(candidates, key=lambda candidate: (-candidate[0],
+                                                                                                candidate[1])):
+            train_state = trains_states[train_object]
+            service_type = "sr"
+            for wagon_object, mileage_ne in zip(train_object.wagons.values(), train_state["ne"]):
+                standards = wagon_object.mileage_standards["kr"]
+                if standards["min"] <= mileage_ne <= standards["max"]:
+                    service_type = "kr"
+            service_end_date = month_start_date + max(wagon_object.define_wagon_service_duration(service_type)
+                                                      for wagon_object in train_object.wagons.values())
+            last_index = bisect_right(months_start_dates, service_end_date - datetime.timedelta(days=1))
+            if any(calculate_reserve_wagons(fleet_wagons_count - idle_wagons[month_index] - len(train_object.wagons),
+                                            months[month_index]["trains_count_max"],
+                                            session=session) < 0
+                   for month_index in range(index, last_index)):
+                continue
+            add_idle(train_object, month_start_date, service_end_date)
+            services[service_type].setdefault((month_start_date, service_end_date), []).append(train_object)
+            train_state["kr_sr"] = [0] * len(train_object.wagons)
+            train_state["overrun"] = False
+        reserve_wagons[month_start_date] = calculate_reserve_wagons(fleet_wagons_count - idle_wagons[index],
+                                                                    month["trains_count_max"],
+                                                                    session=session)
+        # Пробеги на начало следующего месяца
+        moving_wagon_days = fleet_wagons_count * month["days"] - idle_wagon_days[index]
+        if not moving_wagon_days:
+            continue
+        wagon_daily_mileage = int(month["line_mileage"] * usage_ratio // moving_wagon_days)
+        for train_object, train_state in trains_states.items():
+            mileage = wagon_daily_mileage * (month["days"] - train_state["idle_days"][index])
+            train_state["kr_sr"] = [None if mileage_kr_sr is None else mileage_kr_sr + mileage
+                                    for mileage_kr_sr in train_state["kr_sr"]]
+            train_state["ne"] = [mileage_ne + mileage for mileage_ne in train_state["ne"]]
+    return {"services": services,
+            "overrun_trains": overrun_trains,
+            "reserve_wagons": reserve_wagons}
+
+
+def seed_preplanned_services(long_term_services: dict,
+                             end_date: datetime.date):
+    """
+    Получает результаты укрупненного планирования (см. plan_long_term_services).
+    Возвращает СР и КР, заканчивающиеся до end_date (не включая), в формате
+    предзапланированных ТОиР (см. select_preplanned_services) - для дополнения
+    исходных данных детального расчета по суткам на ближайший период.
+    """
+    raw_service_types = {"sr": "СР", "kr": "КР"}
+    res = []
+    for service_type, periods in long_term_services["services"].items():
+        for (start_date, service_end_date), trains in sorted(periods.items()):
+            if service_end_date > end_date:
+                continue
+            service_end = (service_end_date - datetime.timedelta(days=1)).strftime("%m.%Y")
+            for train_object in trains:
+                for wagon_number in train_object.wagons:
+                    res.append([wagon_number, raw_service_types[service_type], service_end])
+    return res
+
+
+def format_long_term_services(long_term_services: dict):
+    """
+    Получает результаты укрупненного планирования (см. plan_long_term_services).
+    Возвращает текстовую таблицу по годам: количество сцепов, поставленных в СР и КР,
+    минимальный резерв вагонов и сцепы с перепробегом, а также перечень ТОиР по месяцам.
+    """
+    years = {}
+    for month_start_date, reserve_wagons in long_term_services["reserve_wagons"].items():
+        year_data = years.setdefault(month_start_date.year, {"sr": 0, "kr": 0,
+                                                             "reserve_wagons": reserve_wagons,
+                                                             "overrun_trains": []})
+        year_data["reserve_wagons"] = min(year_data["reserve_wagons"], reserve_wagons)
+    for service_type, periods in long_term_services["services"].items():
+        for (start_date, end_date), trains in periods.items():
+            years[start_date.year][service_type] += len(trains)
+    for train_object, month_start_date in long_term_services["overrun_trains"]:
+        years[month_start_date.year]["overrun_trains"].append(train_object.train_number)
+    titles = ("Год", "СР", "КР", "Мин. резерв вагонов", "Перепробег СР/КР")
+    rows = [(f"{year}", f"{year_data['sr']}", f"{year_data['kr']}", f"{year_data['reserve_wagons']}",
+             " ".join(f"{train_number}" for train_number in year_data["overrun_trains"]))
+            for year, year_data in sorted(years.items())]
+    widths = [max(len(title), *(len(row[index]) for row in rows))
+              for index, title in enumerate(titles)]
+    lines = [" | ".join(f"{title:<{width}}" for title, width in zip(titles, widths))]
+    lines.append("-+-".join("-" * width for width in widths))
+    for row in rows:
+        lines.append(" | ".join(f"{value:<{width}}" for value, width in zip(row, widths)))
+    lines.append("")
+    for (start_date, end_date), service_type, trains in sorted(
+            (period, service_type, trains)
+            for service_type, periods in long_term_services["services"].items()
+            for period, trains in periods.items()):
+        lines.append(f"{start_date} - {end_date - datetime.timedelta(days=1)} {service_type}: "
+                     f"сцепы {[train_object.train_number for train_object in trains]}")
+    return "\n".join(lines)
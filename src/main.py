@@ -5,153 +5,24 @@
 # src/main.py
 # **************************
 
+import argparse
 import datetime
-
-from calculation import (
-    calculate_line_daily_mileage,
-    calculate_train_lenght,
-    calculate_transportation_values
-)
-from changing import (
-    update_wagons_attrs,
-)
-from classes import (
-    Normatives,
-    Registry
-)
-from confirmation import (
-    confirm_possible_trains
-)
-from conversion import (
-    convert_confirmed_trains,
-    convert_preplanned_services,
-    convert_wagons_attrs
-)
-from creation import (
-    create_debug_file_output,
-    create_trains,
-    create_wagons
-)
-from normatives import (
-    mileage_frequency_standards,
-    service_duration_standards
-)
-from parsing import (
-    convert_start_date,
-    pars_wagons_data
-)
-from planning import (
-    service_planning
-)
-from selection import (
-    select_current_idle_end,
-    select_extra_wagon_data_path,
-    select_hitched_wagons,
-    select_idle_wagons,
-    select_line_motion_time,
-    select_main_wagon_data_path,
-    select_output_data_path,
-    select_planning_end_date,
-    select_possible_trains,
-    select_preplanned_services,
-    select_text_result_data_path,
-    select_transportation_values,
-    select_unhitched_wagons
-)
-from utility import (
-    daterange,
-    print_result_services_to_file
-)
-from verification import (
-    verify_planning_results,
-)
-
-raw_start_date, raw_main_wagons_attrs = pars_wagons_data(
-    select_main_wagon_data_path())
-
-Registry.planning_start_date = convert_start_date(raw_start_date)
-
-Registry.planning_end_date = select_planning_end_date()
-
-Registry.mileage_standards = mileage_frequency_standards()
-Registry.duration_standards = service_duration_standards()
-wagons_attrs = convert_wagons_attrs(raw_main_wagons_attrs)
-
-Registry.wagons = create_wagons(wagons_attrs,
-                                start_date=Registry.planning_start_date,
-                                end_date=Registry.planning_end_date)
-
-update_wagons_attrs(pars_wagons_data(select_extra_wagon_data_path()))
-
-hitched_wagons = select_hitched_wagons()
-Registry.train_lenght = calculate_train_lenght(hitched_wagons)
-Registry.unhitched_wagons = select_unhitched_wagons()
-possible_trains = select_possible_trains()
-confirmed_trains = confirm_possible_trains(possible_trains)
-Registry.trains = create_trains(
-    Registry.train_lenght, hitched_wagons, verbose=False)
-if not confirmed_trains is None:
-    Registry.trains.update(create_trains(
-        Registry.train_lenght, convert_confirmed_trains(confirmed_trains)))
-
-Registry.transportation_values = calculate_transportation_values(
-    start_date=Registry.planning_start_date,
-    end_date=Registry.planning_end_date,
-    basic_values=select_transportation_values(),
-    line_motion_time=select_line_motion_time())
-
-calculate_line_daily_mileage()
-
-for wagon_number, wagon_object in Registry.wagons.items():
-    serv_date = Registry.wagons[wagon_number].usage_start_date
-    wagon_object.change_idle_reason(serv_date,
-                                    wagon_object.define_service_type(
-                                        serv_date),
-                                    verbose=False)
-
-for train_object in Registry.trains.values():
-    if not train_object.verify_wagons_idle_reasons(Registry.planning_start_date,
-                                                   verbose=False):
-        train_object.unify_train_service_type(Registry.planning_start_date,
-                                              verbose=False)
-
-# Проставляем на начало расчета отстой сцепу №904 (56009-56010) по ремонту редукторов
-# ТОЛЬКО ДЛЯ РАСЧЕТА ОТ 31.03.2022!!!
-for wagon_object in Registry.trains[904].wagons.values():
-    wagon_object.change_idle_reason(Registry.planning_start_date,
-                                    "o",
-                                    verbose=False)
-
-Registry.result_services = select_current_idle_end(
-    select_idle_wagons(Registry.planning_start_date))
-
-# Вносим в расчет информацию о выходе из ТОиР вагонов,
-# находящихся в ТОиР на дату начала расчета
-for service_type, periods in Registry.result_services.items():
-    for (start_date, end_date), rolling_stock_data in periods.items():
-        first_date = start_date + datetime.timedelta(days=1)
-        for rolling_stock_type, objects in rolling_stock_data.items():
-            for rolling_stock_object in objects:
-                if rolling_stock_type == "trains":
-                    for wagon_object in rolling_stock_object.wagons.values():
-                        for date in daterange(first_date, end_date):
-                            wagon_object.change_idle_reason(date,
-                                                            service_type,
-                                                            verbose=False)
-                if rolling_stock_type == "single_wagons":
-                    for date in daterange(first_date, end_date):
-                        rolling_stock_object.change_idle_reason(date,
-                                                                service_type,
-                                                                verbose=False)
-
-converted_preplanned_services = convert_preplanned_services(
-    select_preplanned_services())
-# print(converted_preplanned_services)  # debug
-# Вносим в расчет информацию о предзапланированных ТОиР
-for wagon_number, services in converted_preplanned_services.items():
-    Registry.wagons[wagon_number].preplanned_services = services
-
-service_types = (  # "sr",
+import sys
+
+if __name__ == "__main__" and not __package__:
+    # Запуск файлом (python main.py): модули загружаются как пакет src
+    from os.path import abspath, basename, dirname
+    sys.path.insert(0, dirname(dirname(abspath(__file__))))
+    __package__ = basename(dirname(abspath(__file__)))
+
+__all__ = [
+    "SERVICE_TYPES",
+    "main",
+    "parse_arguments",
+    "run_planning",
+]
+
+SERVICE_TYPES = (  # "sr",
     "tr3",
     "tr2",
     "tr1",
@@ -159,12 +30,213 @@ service_types = (  # "sr",
     # "to1"
 )
 
-service_planning(service_types)
-verify_planning_results(service_types)
-
-create_debug_file_output(select_output_data_path())
-print_result_services_to_file(select_text_result_data_path())
 
-print("END")
+def parse_arguments(argv=None):
+    """
+    Разбирает аргументы командной строки argv (по умолчанию - sys.argv[1:]).
+    Возвращает argparse.Namespace с атрибутами main_data, extra_data, end_date,
+    long_term_end_date, service_types, replan и query (None - значение не задано).
+    """
+    def convert_date(value: str):
+        """
+        Преобразует дату из формата ДД.ММ.ГГГГ в datetime.date.
+        """
+        try:
+            return datetime.datetime.strptime(value, "%d.%m.%Y").date()
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                f"Дата {value!r} должна быть в формате ДД.ММ.ГГГГ!") from None
+
+    parser = argparse.ArgumentParser(
+        prog="service_planning",
+        description="Планирование ТОиР вагонов по выгрузкам АСУ Депо.")
+    parser.add_argument("--main-data", metavar="HTML",
+                        help='выгрузка "Пробеги вагонов" (ТР-1 - КР)')
+    parser.add_argument("--extra-data", metavar="HTML",
+                        help='выгрузка "Техническое обслуживание вагонов" (ТО-1 - ТР-2)')
+    parser.add_argument("--end-date", metavar="ДД.ММ.ГГГГ", type=convert_date,
+                        help="дата окончания расчета (первая дата, не входящая в расчет)")
+    parser.add_argument("--long-term-end-date", metavar="ДД.ММ.ГГГГ", type=convert_date,
+                        help="дата окончания укрупненного планирования СР и КР по месяцам, "
+                             "выполняемого перед расчетом (СР и КР, заканчивающиеся до даты "
+                             "окончания расчета, добавляются к предзапланированным ТОиР)")
+    parser.add_argument("--service-types", metavar="ВИД", nargs="+",
+                        choices=("sr", "tr3", "tr2", "tr1", "to2", "to1"), default=SERVICE_TYPES,
+                        help=f"виды ТОиР для планирования (по умолчанию - {' '.join(SERVICE_TYPES)})")
+    parser.add_argument("--replan", action="store_true",
+                        help="инкрементный расчет по новой выгрузке: сохранить допустимые ТОиР "
+                             "последнего расчета и перепланировать только сцепы с отклонением "
+                             "пробега или недопустимыми ТОиР (см. replan_services)")
+    parser.add_argument("--query", metavar="SQL",
+                        help="выполнить запрос к результатам последнего расчета "
+                             "(см. create_sqlite_file_output) без нового расчета")
+    return parser.parse_args(argv)
+
+
+def run_planning(planning_inputs: dict = None,
+                 service_types=SERVICE_TYPES,
+                 usage_ratio: float = 0.8,
+                 confirm_trains=None,
+                 session=None):
+    """
+    Выполняет расчет: подготовку сессии (по умолчанию - Registry) по исходным данным
+    (по умолчанию - select_planning_inputs), планирование видов ТОиР service_types
+    и проверку результатов. Для повторных расчетов в одном процессе
+    передается новая сессия (PlanningSession()).
+    confirm_trains - см. create_planning_session.
+    Возвращает сессию расчета.
+    """
+    from .creation import create_planning_session
+    from .planning import service_planning
+    from .profiling import profile_stage
+    from .selection import select_planning_inputs
+    from .verification import verify_planning_results
+
+    if planning_inputs is None:
+        with profile_stage("select_planning_inputs", session=session):
+            planning_inputs = select_planning_inputs()
+    with profile_stage("create_planning_session", session=session):
+        session = create_planning_session(planning_inputs,
+                                          confirm_trains=confirm_trains,
+                                          session=session)
+    with profile_stage("service_planning", session=session):
+        service_planning(service_types, usage_ratio=usage_ratio, session=session)
+    with profile_stage("verify_planning_results", session=session):
+        verify_planning_results(service_types, session=session)
+    return session
+
+
+def main(argv=None):
+    """
+    Точка входа командной строки (аргументы - см. parse_arguments).
+    Выполняет расчет и выводит его результаты в файлы папки Data
+    (при указании --long-term-end-date - предварительно выполняет
+    укрупненное планирование СР и КР и выводит его результаты,
+    при указании --replan - вместо полного расчета выполняет инкрементный
+    по результатам последнего расчета),
+    а при указании --query - только выводит строки результата запроса
+    к базе данных последнего расчета.
+    Модули расчета загружаются только при необходимости.
+    Возвращает код завершения.
+    """
+    args = parse_arguments(argv)
+    import os
+
+    if args.query is not None:
+        import sqlite3
+        from .selection import select_sqlite_output_data_path
+
+        database_path = select_sqlite_output_data_path()
+        if not os.path.exists(database_path):
+            print(f"База данных {database_path} не найдена, выполните расчет без --query.",
+                  file=sys.stderr)
+            return 1
+        connection = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+        try:
+            for row in connection.execute(args.query):
+                print(*row, sep="\t")
+        finally:
+            connection.close()
+        return 0
+
+    from .classes import DebugLog, PlanningSession, Registry
+    from .confirmation import confirm_possible_trains
+    from .creation import (
+        create_columnar_file_output,
+        create_debug_file_output,
+        create_planning_session,
+        create_sqlite_file_output
+    )
+    from .longterm import (
+        format_long_term_services,
+        plan_long_term_services,
+        seed_preplanned_services
+    )
+    from .profiling import Profiler, profile_stage
+    from .replanning import replan_services
+    from .selection import (
+        select_columnar_output_data_path,
+        select_debug_data_path,
+        select_debug_level,
+        select_long_term_end_date,
+        select_mileage_tolerance,
+        select_output_data_path,
+        select_planning_inputs,
+        select_profiling_data_path,
+        select_profiling_mode,
+        select_sqlite_output_data_path,
+        select_text_result_data_path
+    )
+    from .utility import print_result_services_to_file
+
+    if args.replan:
+        for previous_path in (select_sqlite_output_data_path(), select_columnar_output_data_path()):
+            if not os.path.exists(previous_path):
+                print(f"Результаты последнего расчета {previous_path} не найдены, "
+                      "выполните расчет без --replan.", file=sys.stderr)
+                return 1
+
+    Registry.debug_log = DebugLog(select_debug_data_path(), select_debug_level())
+    profiling_mode = select_profiling_mode()
+    if profiling_mode is not None:
+        Registry.profiler = Profiler(memory=profiling_mode == "memory")
+    with profile_stage("select_planning_inputs"):
+        planning_inputs = select_planning_inputs(main_data_path=args.main_data,
+                                                 extra_data_path=args.extra_data,
+                                                 planning_end_date=args.end_date)
+    long_term_end_date = args.long_term_end_date
+    if long_term_end_date is None:
+        long_term_end_date = select_long_term_end_date()
+    confirm_trains = None
+    if long_term_end_date is not None:
+        confirmed_trains = []
+
+        def confirm_trains(possible_trains: dict):
+            """
+            Запрашивает подтверждение сцепов один раз для обоих расчетов.
+            """
+            if not confirmed_trains:
+                confirmed_trains.append(confirm_possible_trains(possible_trains))
+            return confirmed_trains[0]
+
+        with profile_stage("plan_long_term_services"):
+            long_term_session = create_planning_session(planning_inputs,
+                                                        confirm_trains=confirm_trains,
+                                                        session=PlanningSession())
+            long_term_services = plan_long_term_services(planning_inputs,
+                                                         long_term_end_date,
+                                                         session=long_term_session)
+        print(format_long_term_services(long_term_services))
+        planning_inputs = dict(planning_inputs,
+                               preplanned_services=(planning_inputs["preplanned_services"] +
+                                                    seed_preplanned_services(long_term_services,
+                                                                             planning_inputs["planning_end_date"])))
+    if args.replan:
+        replan_services(planning_inputs,
+                        select_sqlite_output_data_path(),
+                        select_columnar_output_data_path(),
+                        tuple(args.service_types),
+                        mileage_tolerance=select_mileage_tolerance(),
+                        confirm_trains=confirm_trains)
+    else:
+        run_planning(planning_inputs, tuple(args.service_types), confirm_trains=confirm_trains)
+    Registry.debug_log.close()
+
+    with profile_stage("output"):
+        create_debug_file_output(select_output_data_path())
+        create_columnar_file_output(select_columnar_output_data_path())
+        create_sqlite_file_output(select_sqlite_output_data_path())
+        print_result_services_to_file(select_text_result_data_path())
+
+    if Registry.profiler is not None:
+        print(Registry.profiler.report())
+        Registry.profiler.save(select_profiling_data_path())
+
+    print("END")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
 
 # Откорректировать метод verify_wagons_idle_reasons для Train
@@ -7,6 +7,7 @@
 
 __all__ = [
     "mileage_frequency_standards",
+    "models_standards",
     "service_duration_standards",
 ]
 
@@ -88,3 +89,16 @@ def service_duration_standards():
              }
     }
     return standards
+
+
+def models_standards(standards: dict):
+    """
+    Получает словарь с нормативами вида {(модель_вагона, ...): нормативы}
+    (см. mileage_frequency_standards, service_duration_standards).
+    Возвращает словарь вида {модель_вагона: нормативы} (нормативы - те же объекты).
+    """
+    res = {}
+    for wagon_models, normatives in standards.items():
+        for wagon_model in wagon_models:
+            res[wagon_model] = normatives
+    return res
@@ -6,13 +6,37 @@
 # **************************
 
 __all__ = [
+    "PARSER_VERSION",
+    "StreamingTableParser",
     "convert_start_date",
-    "pars_wagons_data"
+    "pars_wagons_data",
+    "pars_wagons_data_cached",
+    "pars_wagons_data_streaming",
+    "read_columnar_file_header",
+    "read_columnar_file_output",
+    "read_columnar_file_outputs",
+    "read_sqlite_planned_services"
 ]
 
+import codecs
+import contextlib
 import datetime
+import hashlib
+import io
+import json
+import mmap
+import os
+import pickle
+import re
+import sqlite3
 from html.parser import HTMLParser
 
+# Версия парсера (увеличивается при любом изменении результата парсинга
+# или преобразования атрибутов, чтобы ранее сохраненные в кэше результаты не использовались)
+PARSER_VERSION = 2
+# Размер блока чтения html-файла в байтах (для StreamingTableParser)
+CHUNK_SIZE = 1 << 16
+
 
 class TableDataParser(HTMLParser):
     def __init__(self):
@@ -57,12 +81,102 @@ class TableDataParser(HTMLParser):
             self.wagon_attrs[self.row_count].append(data)
 
 
+class StreamingTableParser(HTMLParser):
+    """
+    Потоковый парсер таблицы html-файла выгрузки АСУ Депо.
+    В отличие от TableDataParser не накапливает таблицу целиком:
+    файл читается блоками по chunk_size байт с последовательным декодированием cp1251,
+    строки таблицы выдаются по одной по мере их завершения (см. iter_rows),
+    а из ячеек строки сохраняются только столбцы с индексами из columns
+    (None - все столбцы). Деление текста на ячейки такое же, как в TableDataParser
+    (html-файл подается парсеру построчно, без начальных и конечных пробелов).
+    """
+    line_separator = re.compile(r"\r\n|\r|\n")
+
+    def __init__(self, columns=None):
+        super().__init__()
+        self.columns = None if columns is None else frozenset(columns)
+        self.raw_start_date = None
+        self.row_count = 0
+        self.in_th = False  # Заголовок таблицы
+        self.in_tbody = False  # Таблица
+        self.in_tr = False  # Строка таблицы
+        self.in_td = False  # Ячейка строки таблицы
+        # Текущая строка таблицы вида {индекс_столбца: значение}
+        # (None - в строке еще не было данных)
+        self.row = None
+        self.cell_index = 0
+        # Завершенные строки таблицы, еще не выданные iter_rows
+        self.ready_rows = []
+
+    def handle_starttag(self, tag, attrs):
+        self.set_tag_flag(tag, True)
+
+    def handle_endtag(self, tag):
+        if tag == "tr" and self.in_tbody:
+            if self.row is not None:
+                self.ready_rows.append((self.row_count, self.row))
+                self.row = None
+                self.cell_index = 0
+            self.row_count += 1
+        self.set_tag_flag(tag, False)
+
+    def set_tag_flag(self, tag, value):
+        if tag == "td":
+            self.in_td = value
+        elif tag == "tr":
+            self.in_tr = value
+        elif tag == "th":
+            self.in_th = value
+        elif tag == "tbody":
+            self.in_tbody = value
+
+    def handle_data(self, data):
+        if self.in_th and self.raw_start_date is None and " по " in data:
+            self.raw_start_date = data[-10:]
+        if self.in_tbody and self.in_tr:
+            if self.row is None:
+                self.row = {}
+            if self.in_td:
+                if self.columns is None or self.cell_index in self.columns:
+                    self.row[self.cell_index] = data
+                self.cell_index += 1
+
+    def iter_rows(self, pars_path, chunk_size: int = CHUNK_SIZE):
+        """
+        Генератор: выполняет парсинг html-файла и выдает по одной строке таблицы
+        вида (номер_строки, {индекс_столбца: необработанное_значение}).
+        Дата из заголовка таблицы доступна в атрибуте raw_start_date
+        (заголовок находится перед строками таблицы).
+        """
+        decoder = codecs.getincrementaldecoder("cp1251")()
+        tail = ""
+        with open(pars_path, mode="rb") as html_file:
+            while True:
+                chunk = html_file.read(chunk_size)
+                lines = self.line_separator.split(
+                    tail + decoder.decode(chunk, final=not chunk))
+                tail = lines.pop() if chunk else ""
+                for line in lines:
+                    self.feed(line.strip())
+                if not chunk:
+                    break
+                yield from self.ready_rows
+                self.ready_rows.clear()
+        self.close()
+        if self.row is not None:
+            self.ready_rows.append((self.row_count, self.row))
+            self.row = None
+        yield from self.ready_rows
+        self.ready_rows.clear()
+
+
 def pars_wagons_data(pars_path):
     """ 
     Выполняет парсинг html-файла выгрузки из функции "Пробеги вагонов" (для ТР-1 - КР) или
     "Техническое обслуживание вагонов" (для ТО-2 (ТО-1 для АТП) - ТО-3 (ТО-2 для АТП)) АСУ Депо.
     Возвращает кортеж (дата, словарь) или только словарь со списками необработанных аргументов
-    для создания экземпляров класса Wagon()
+    для создания экземпляров класса Wagon().
     """
     with open(pars_path, mode='r', encoding='cp1251') as html_lines:
         parser = TableDataParser()
@@ -76,6 +190,150 @@ def pars_wagons_data(pars_path):
         return raw_start_date, raw_wagon_attrs
 
 
+def pars_wagons_data_streaming(pars_path, columns, convert):
+    """
+    Выполняет потоковый парсинг html-файла выгрузки АСУ Депо (см. StreamingTableParser)
+    с сохранением только столбцов с индексами из columns (None - все столбцы).
+    Строки таблицы передаются функции преобразования convert
+    (например, conversion.convert_wagons_attrs) по мере чтения файла,
+    поэтому таблица выгрузки целиком в памяти не хранится.
+    Возвращает кортеж (дата_из_заголовка (None - заголовка нет), результат_convert).
+    """
+    parser = StreamingTableParser(columns)
+    res = convert(parser.iter_rows(pars_path))
+    return parser.raw_start_date, res
+
+
+def pars_wagons_data_cached(pars_path, cache_dir, columns, convert):
+    """
+    То же, что pars_wagons_data_streaming, но с кэшированием преобразованных атрибутов
+    в двоичном файле (pickle) в папке cache_dir.
+    Ключ кэша - хэш SHA-256 содержимого html-файла, версия парсера (PARSER_VERSION),
+    индексы столбцов columns и имя функции convert, поэтому при изменении выгрузки, парсера
+    или набора столбцов файл парсится заново и кэш перезаписывается.
+    Сообщения convert о некорректных значениях сохраняются в кэше вместе с результатом
+    и выводятся при каждом вызове.
+    Имя файла кэша - имя html-файла и хэш его полного пути, поэтому выгрузки
+    с одинаковыми именами из разных папок не перезаписывают кэш друг друга.
+    Поврежденный или недоступный для записи кэш не мешает расчету.
+    """
+    content_hash = hashlib.sha256()
+    with open(pars_path, mode="rb") as html_file:
+        for chunk in iter(lambda: html_file.read(CHUNK_SIZE), b""):
+            content_hash.update(chunk)
+    key = (content_hash.hexdigest(), PARSER_VERSION,
+           None if columns is None else tuple(sorted(columns)),
+           f"{convert.__module__}.{convert.__qualname__}")
+    path_hash = hashlib.sha256(os.path.abspath(pars_path).encode("utf-8")).hexdigest()[:8]
+    cache_path = os.path.join(cache_dir,
+                              f"{os.path.splitext(os.path.basename(pars_path))[0]}-{path_hash}.pickle")
+    try:
+        with open(cache_path, mode="rb") as cache_file:
+            cached_key, messages, res = pickle.load(cache_file)
+        if cached_key == key:
+            print(messages, end="")
+            return res
+    except Exception:
+        # Любая ошибка чтения кэша (в т.ч. усеченный или несовместимый файл pickle)
+        # приводит к повторному парсингу
+        pass
+    with contextlib.redirect_stdout(io.StringIO()) as messages_file:
+        res = pars_wagons_data_streaming(pars_path, columns, convert)
+    messages = messages_file.getvalue()
+    print(messages, end="")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, mode="wb") as cache_file:
+            pickle.dump((key, messages, res), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass
+    return res
+
+
+def read_columnar_file_header(read_path):
+    """
+    Читает заголовок двоичного поколоночного файла с пробегами вагонов
+    (см. creation.create_columnar_file_output).
+    Возвращает словарь заголовка с дополнительным ключом "data_offset" -
+    смещением начала данных от начала файла.
+    """
+    with open(read_path, mode="rb") as columnar_file:
+        header_size = int.from_bytes(columnar_file.read(8), "little")
+        header = json.loads(columnar_file.read(header_size).decode("utf-8"))
+    header["data_offset"] = 8 + header_size
+    return header
+
+
+def read_columnar_file_output(read_path,
+                              wagon_number: int,
+                              fields=None,
+                              header: dict = None):
+    """
+    Отображает в память двоичный поколоночный файл с пробегами вагонов
+    (см. creation.create_columnar_file_output) и возвращает для указанного вагона
+    словарь вида {поле: memoryview} с массивами значений полей (по умолчанию - всех полей).
+    С диска читаются только страницы с запрошенными массивами.
+    header - ранее прочитанный заголовок файла (см. read_columnar_file_header).
+    """
+    res = read_columnar_file_outputs(read_path, fields, header=header).get(wagon_number)
+    if res is None:
+        raise KeyError(f"Вагон № {wagon_number} в файле {read_path} отсутствует!")
+    return res
+
+
+def read_columnar_file_outputs(read_path,
+                               fields=None,
+                               header: dict = None):
+    """
+    То же, что read_columnar_file_output, но для всех вагонов файла:
+    файл отображается в память один раз и возвращается словарь вида
+    {номер_вагона: {поле: memoryview}}.
+    """
+    if header is None:
+        header = read_columnar_file_header(read_path)
+    with open(read_path, mode="rb") as columnar_file:
+        data = memoryview(mmap.mmap(columnar_file.fileno(), 0, access=mmap.ACCESS_READ))
+    res = {}
+    for wagon in header["wagons"]:
+        wagon_data = res[wagon["wagon_number"]] = {}
+        for field, column in wagon["columns"].items():
+            if fields is None or field in fields:
+                start = header["data_offset"] + column["offset"]
+                wagon_data[field] = data[start:start + column["size"]].cast(column["typecode"])
+    return res
+
+
+def read_sqlite_planned_services(read_path):
+    """
+    Читает запланированные ТОиР из базы данных SQLite с результатами планирования
+    (см. creation.create_sqlite_file_output).
+    Возвращает словарь вида:
+    {вид_ТОиР: {(дата_начала, дата_окончания): {"trains": {номер_сцепа: [номер_вагона, ...]},
+                                                "single_wagons": [номер_вагона, ...]}}}
+    (дата окончания - первая дата после ТОиР, как в PlanningSession.result_services).
+    """
+    delta = datetime.timedelta(days=1)
+    res = {}
+    connection = sqlite3.connect(f"file:{read_path}?mode=ro", uri=True)
+    try:
+        for service_type, start_date, end_date, train_number, wagon_number in connection.execute(
+                "SELECT service_type, start_date, end_date, train_number, wagon_number "
+                "FROM services ORDER BY service_type, start_date, train_number, wagon_number"):
+            period = (datetime.date.fromisoformat(start_date),
+                      datetime.date.fromisoformat(end_date) + delta)
+            period_data = res.setdefault(service_type, {}).setdefault(period, {"trains": {},
+                                                                               "single_wagons": []})
+            if train_number is None:
+                period_data["single_wagons"].append(wagon_number)
+            else:
+                period_data["trains"].setdefault(train_number, []).append(wagon_number)
+    finally:
+        connection.close()
+    return res
+
+
 def convert_start_date(raw_start_date):
     """
     Преобразует дату из строкового формата в формат datetime.date
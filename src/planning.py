@@ -10,9 +10,11 @@ __all__ = [
 ]
 
 import datetime
+from heapq import heappop
 
-from calculation import (
-    calculate_period_idle_max_value,
+from .calculation import (
+    calculate_fleet_mileage,
+    calculate_periods_idle_max_values,
     calculate_periods_surplus_wagons,
     calculate_standing_dates,
     calculate_standing_trains_wagons,
@@ -22,24 +24,24 @@ from calculation import (
     count_idle_wagons,
     count_wagons_in_motion,
 )
-from changing import (
+from .changing import (
     adding_wagon_service_periods,
     change_trains_daily_mileage,
     update_wagon_service_period,
     unify_train_service_period,
 )
-from classes import (
+from .classes import (
+    DateIntervals,
+    DebugLog,
     Registry
 )
-from definition import (
+from .definition import (
     define_periods_startdates,
+    define_periods_trains_queues,
     define_wagons_outside_service_periods
 )
-from selection import (
-    select_debug_data_path,
-)
-from utility import (
-    daterange,
+from .profiling import profile_stage
+from .utility import (
     print_service_wagons_to_file,
     print_standing_dates_to_file,
     workdate,
@@ -47,180 +49,199 @@ from utility import (
 )
 
 
-def service_planning(service_types):
+def service_planning(service_types, usage_ratio: float = 0.8, trains=None, session=None):
     """
     Алгоритм распределения заданных видов ТОиР
-    для всех вагонов всех сцепов в периоде планирования
+    для всех вагонов всех сцепов в периоде планирования.
+    usage_ratio - доля суммарного пробега линии, приходящаяся на вагоны в движении
+    (см. calculate_wagon_daily_mileage).
+    trains - объекты сцепов, которым планируются ТОиР (по умолчанию - все сцепы сессии),
+    остальные сцепы учитываются только в количестве вагонов в движении и на ТОиР.
+    Подробные выгрузки промежуточных данных выводятся в session.debug_log
+    только при включенном уровне DebugLog.TRACE.
+    При заданном session.profiler расчет каждого вида ТОиР замеряется как отдельный этап.
     """
-    count_wagons_in_motion()
-    calculate_wagon_daily_mileage(usage_ratio=0.8)
-    change_trains_daily_mileage()
-    calculate_train_mileage_ne()
+    if session is None:
+        session = Registry
+    debug_log = session.debug_log
+    trace = debug_log is not None and debug_log.enabled(DebugLog.TRACE)
+    # Полный подсчет вагонов в движении и в простое выполняется один раз,
+    # далее счетчики изменяются методом Wagon.change_idle_reason
+    count_wagons_in_motion(session=session)
+    count_idle_wagons(session=session)
+    calculate_wagon_daily_mileage(usage_ratio=usage_ratio, session=session)
+    change_trains_daily_mileage(session=session)
+    calculate_train_mileage_ne(session=session)
 
     # Для каждого вагона каждого сцепа, которому возможно выполнение вида ТОиР,
     # определяем диапазоны дат постановки вагона на это ТОиР и формируем словарь
     for service_type in service_types:
-        print(f"************ РАСЧЕТ {service_type} ************")
-        """
-        service_wagons = {
-            номер_вагона: {
-                "periods":  [
-                    [список_дат_ТОиР],
-                    ...     ],
-                "delta": норма_простоя_на_ТОиР
-                          }
-                         }
-        """
-        service_wagons = {}
-        """
-        sim_service_trains = [
-        объект_сцепа,
-        ...              ]
+        with profile_stage(service_type, session=session):
+            print(f"************ РАСЧЕТ {service_type} ************")
+            """
+            service_wagons = {
+                номер_вагона: {
+                    "periods":  [
+                        множество_дат_ТОиР (DateIntervals),
+                        ...     ],
+                    "delta": норма_простоя_на_ТОиР
+                              }
+                             }
+            """
+            service_wagons = {}
+            """
+            sim_service_trains = [
+            объект_сцепа,
+            ...              ]
 
-        single_service_wagons = [
-            объект_вагона,
-            ...                 ]
-        """
-        sim_service_trains = []  # объекты сцепов для посоставного ремонта
-        single_service_wagons = []  # объекты вагонов для одиночного ремонта
-        for train_object in Registry.trains.values():
-            check_train_flag = True
-            for wagon_number, wagon_object in train_object.wagons.items():
-                if wagon_object.verify_allowed_service_period(service_type):
-                    calculate_wagon_service_mileage(wagon_number, service_type)
-                    # debug
-                    # if wagon_number in (56009, 56010, 57009, 57010, 58009, 58010):
-                    #     print(f"Вагон № {wagon_number}, пробег от ТР-3:",
-                    #           f"на 2022-09-17 - {Registry.wagons[wagon_number].mileage[datetime.date(2022, 9, 17)]['tr3']},",
-                    #           f"на 2022-09-21 - {Registry.wagons[wagon_number].mileage[datetime.date(2022, 9, 21)]['tr3']}.")
-                    for date in daterange(wagon_object.usage_start_date,
-                                          wagon_object.usage_end_date):
-                        if wagon_object.verify_allowed_service_date(date, service_type):
+            single_service_wagons = [
+                объект_вагона,
+                ...                 ]
+            """
+            sim_service_trains = []  # объекты сцепов для посоставного ремонта
+            single_service_wagons = []  # объекты вагонов для одиночного ремонта
+            for train_object in (session.trains.values() if trains is None else trains):
+                check_train_flag = True
+                for wagon_number, wagon_object in train_object.wagons.items():
+                    if wagon_object.verify_allowed_service_period(service_type):
+                        calculate_wagon_service_mileage(wagon_number, service_type, session=session)
+                        # debug
+                        # if wagon_number in (56009, 56010, 57009, 57010, 58009, 58010):
+                        #     print(f"Вагон № {wagon_number}, пробег от ТР-3:",
+                        #           f"на 2022-09-17 - {Registry.wagons[wagon_number].mileage[datetime.date(2022, 9, 17)]['tr3']},",
+                        #           f"на 2022-09-21 - {Registry.wagons[wagon_number].mileage[datetime.date(2022, 9, 21)]['tr3']}.")
+                        for start_date, end_date in wagon_object.define_allowed_service_periods(service_type):
                             adding_wagon_service_periods(wagon_number,
-                                                         date,
-                                                         service_wagons)
+                                                         start_date,
+                                                         end_date,
+                                                         service_wagons,
+                                                         session=session)
                             if check_train_flag:
                                 train_object.change_service_objects_lists(sim_service_trains,
                                                                           single_service_wagons)
                                 check_train_flag = False
-        # debug
-        print_service_wagons_to_file(service_wagons, service_type,
-                                     sim_service_trains, single_service_wagons,
-                                     select_debug_data_path())
-        if len(service_wagons):
-            Registry.result_services[service_type] = Registry.result_services.get(
-                service_type, {})
-
-        for wagon_number in service_wagons.keys():
-            update_wagon_service_period(wagon_number,
-                                        service_type,
-                                        service_wagons)
+            # debug
+            if trace:
+                print_service_wagons_to_file(service_wagons, service_type,
+                                             sim_service_trains, single_service_wagons,
+                                             debug_log.file)
+            if len(service_wagons):
+                session.result_services[service_type] = session.result_services.get(
+                    service_type, {})
 
-        unify_train_service_period(sim_service_trains,
-                                   service_wagons)
+            for wagon_number in service_wagons.keys():
+                update_wagon_service_period(wagon_number,
+                                            service_type,
+                                            service_wagons,
+                                            session=session)
 
-        # debug
-        print_service_wagons_to_file(service_wagons, service_type,
-                                     sim_service_trains, single_service_wagons,
-                                     select_debug_data_path())
+            unify_train_service_period(sim_service_trains,
+                                       service_wagons)
 
-        standing_dates = calculate_standing_dates(service_type,
-                                                  service_wagons)
+            # debug
+            if trace:
+                print_service_wagons_to_file(service_wagons, service_type,
+                                             sim_service_trains, single_service_wagons,
+                                             debug_log.file)
 
-        # Не работает! Требуется допиливание функции define_wagons_outside_service_periods
-        # define_wagons_outside_service_periods(service_wagons,
-        #                                       standing_dates,
-        #                                       service_type)
+            standing_dates = calculate_standing_dates(service_type,
+                                                      service_wagons,
+                                                      session=session)
 
-        # count_wagons_in_motion()
+            # Не работает! Требуется допиливание функции define_wagons_outside_service_periods
+            # define_wagons_outside_service_periods(service_wagons,
+            #                                       standing_dates,
+            #                                       service_type)
 
-        # print_service_wagons_to_file(service_wagons, service_type,
-        #                              sim_service_trains, single_service_wagons,
-        #                              select_debug_data_path())
+            # count_wagons_in_motion()
 
-        calculate_periods_surplus_wagons(standing_dates,
-                                         verbose=False)
-        calculate_standing_trains_wagons(service_type,
-                                         service_wagons,
-                                         standing_dates,
-                                         sim_service_trains,
-                                         single_service_wagons)
-        # Определяем общее количество вагонов, которые должны вставать на ТОиР посоставно,
-        # и количество вагонов, которые могут вставать на ТОиР отдельно.
-        # ТРЕБУЕТСЯ ТОЛЬКО ДЛЯ ОТЛАДКИ!!!
-        sim_service_wagons_count = len(
-            sim_service_trains) * Registry.train_lenght
-        single_service_wagons_count = len(single_service_wagons)
-        # debug
-        print(f"Для постановки в {service_type}: ",
-              f"{sim_service_wagons_count} вагонов - партиями по {Registry.train_lenght} шт., ",
-              f"{single_service_wagons_count} вагонов - поштучно.", sep="")
+            # print_service_wagons_to_file(service_wagons, service_type,
+            #                              sim_service_trains, single_service_wagons,
+            #                              select_debug_data_path())
 
-        count_idle_wagons(service_type)
+            calculate_periods_surplus_wagons(standing_dates,
+                                             verbose=False,
+                                             session=session)
+            calculate_standing_trains_wagons(service_type,
+                                             service_wagons,
+                                             standing_dates,
+                                             sim_service_trains,
+                                             single_service_wagons,
+                                             session=session)
+            # Определяем общее количество вагонов, которые должны вставать на ТОиР посоставно,
+            # и количество вагонов, которые могут вставать на ТОиР отдельно.
+            # ТРЕБУЕТСЯ ТОЛЬКО ДЛЯ ОТЛАДКИ!!!
+            sim_service_wagons_count = len(
+                sim_service_trains) * session.train_lenght
+            single_service_wagons_count = len(single_service_wagons)
+            # debug
+            print(f"Для постановки в {service_type}: ",
+                  f"{sim_service_wagons_count} вагонов - партиями по {session.train_lenght} шт., ",
+                  f"{single_service_wagons_count} вагонов - поштучно.", sep="")
 
-        # ПЛАНИРОВАНИЕ
-        confirmed_trains = []
-        while True:
-            for delta, priorities in sorted(standing_dates.items(), reverse=True):
-                # Для посоставного ремонта вагонов
-                for priority, priority_data in sorted(priorities.items(), reverse=True):
-                    while True:
-                        # debug
-                        print_service_wagons_to_file(service_wagons, service_type,
-                                                     sim_service_trains, single_service_wagons,
-                                                     select_debug_data_path())
-                        print_standing_dates_to_file(standing_dates, select_debug_data_path(),
-                                                     #  delta, priority, priority_data
-                                                     )
-                        confirmed_trains_current_iteration = []
-                        for period, period_data in sorted(priority_data["periods"].items()):
-                            start_date, end_date = period
+            # ПЛАНИРОВАНИЕ
+            confirmed_trains = []
+            # при отсутствии периодов постановки (в т.ч. без сцепов для планирования) планировать нечего
+            while len(standing_dates):
+                for delta, priorities in sorted(standing_dates.items(), reverse=True):
+                    # Очереди сцепов по периодам и периоды, в которых есть каждый сцеп
+                    periods_queues, trains_periods = define_periods_trains_queues(service_type,
+                                                                                  priorities)
+                    # Для посоставного ремонта вагонов
+                    for priority, priority_data in sorted(priorities.items(), reverse=True):
+                        while True:
                             # debug
-                            # print(f"Период: {period}")
-                            if len(period_data["trains"]):
-                                if period_data["surplus_wagons_count"] >= Registry.train_lenght:
-                                    # Определяем максимальное количество вагонов на этом виде ТОиР
-                                    # из всех периодов обоих приоритетов, кроме текущего периода
-                                    current_period_max_idle_count = calculate_period_idle_max_value(start_date,
-                                                                                                    end_date,
-                                                                                                    service_type)
-                                    other_periods_max_idle_count = 0
-                                    for dates_period, dates_period_data in priority_data["periods"].items():
-                                        startdate, enddate = dates_period
-                                        if dates_period != period:
-                                            other_periods_max_idle_count = max(other_periods_max_idle_count,
-                                                                               calculate_period_idle_max_value(startdate,
-                                                                                                               enddate,
-                                                                                                               service_type))
-                                    # Проверяем, что в этом периоде количество вагонов на этом виде ТОиР
-                                    # меньше или равно максимальному количеству вагонов на этом виде ТОиР
-                                    # в других периодах обоих приоритетов
-                                    if current_period_max_idle_count <= other_periods_max_idle_count:
-                                        sorted_trains = []
-                                        # Определяем, есть ли в текущем периоде сцепы, которым предзапланировано ТОиР
-                                        for train_object, percentage in period_data["trains"].items():
-                                            for wagon_object in train_object.wagons.values():
-                                                for subperiod in service_wagons[wagon_number]["periods"]:
-                                                    if (start_date in subperiod and
-                                                            wagon_object.verify_preplanned_service_date(service_type,
-                                                                                                        start_date)):
-                                                        preplanned_train_data = (percentage,
-                                                                                 train_object)
-                                                        if preplanned_train_data not in sorted_trains:
-                                                            sorted_trains.append(
-                                                                preplanned_train_data)
-                                        # Добавляем все остальные сцепы текущего периода, кроме предзапланированного,
-                                        # отсортированные по убыванию процента пробега
-                                        sorted_trains.extend(sorted([(percentage, train_object)
-                                                                    for train_object, percentage in period_data["trains"].items()
-                                                                    if (percentage, train_object) not in sorted_trains],
-                                                                    reverse=True))
-                                        for train_mileage_percentage, train_object in sorted_trains:
+                            if trace:
+                                print_service_wagons_to_file(service_wagons, service_type,
+                                                             sim_service_trains, single_service_wagons,
+                                                             debug_log.file)
+                                print_standing_dates_to_file(standing_dates, debug_log.file,
+                                                             #  delta, priority, priority_data
+                                                             session=session)
+                            confirmed_trains_current_iteration = []
+                            # Отметки о ТОиР для подтвержденных сцепов проставляются
+                            # после обработки всех периодов, чтобы в пределах одного прохода
+                            # количество вагонов на ТОиР сравнивалось по состоянию на начало прохода
+                            confirmed_services_current_iteration = []
+                            # Максимальное количество вагонов на этом виде ТОиР в каждом периоде
+                            # и в остальных периодах (в пределах прохода не изменяется)
+                            periods_max_idle_counts = calculate_periods_idle_max_values(priority_data["periods"].keys(),
+                                                                                        service_type,
+                                                                                        session=session)
+                            for period, period_data, preplanned_trains, trains_heap in periods_queues[priority]:
+                                start_date, end_date = period
+                                # debug
+                                # print(f"Период: {period}")
+                                if len(period_data["trains"]):
+                                    if period_data["surplus_wagons_count"] >= session.train_lenght:
+                                        # Определяем максимальное количество вагонов на этом виде ТОиР
+                                        # из всех периодов обоих приоритетов, кроме текущего периода
+                                        (current_period_max_idle_count,
+                                         other_periods_max_idle_count) = periods_max_idle_counts[period]
+                                        # Проверяем, что в этом периоде количество вагонов на этом виде ТОиР
+                                        # меньше или равно максимальному количеству вагонов на этом виде ТОиР
+                                        # в других периодах обоих приоритетов
+                                        if current_period_max_idle_count <= other_periods_max_idle_count:
+                                            # Из каждого периода берем только по одному сцепу
+                                            train_object = None
+                                            # Определяем, есть ли в текущем периоде сцепы, которым предзапланировано ТОиР
+                                            # (диапазоны дат проверяются по вагону wagon_number)
+                                            if any(start_date in subperiod
+                                                   for subperiod in service_wagons[wagon_number]["periods"]):
+                                                for preplanned_train in preplanned_trains:
+                                                    if preplanned_train in period_data["trains"]:
+                                                        train_object = preplanned_train
+                                                        break
+                                            # Иначе берем сцеп текущего периода с максимальным процентом пробега
+                                            if train_object is None:
+                                                while trains_heap[0][2] not in period_data["trains"]:
+                                                    heappop(trains_heap)
+                                                train_object = trains_heap[0][2]
                                             confirmed_trains_current_iteration.append(
                                                 train_object)
-                                            Registry.result_services[service_type][period] = Registry.result_services[service_type].get(period, {
+                                            session.result_services[service_type][period] = session.result_services[service_type].get(period, {
                                                 "trains": []})
-                                            Registry.result_services[service_type][period]["trains"].append(
+                                            session.result_services[service_type][period]["trains"].append(
                                                 train_object)
                                             # debug
                                             # if train_object == Registry.trains[6]:
@@ -237,12 +258,10 @@ def service_planning(service_types):
                                             #               f"на 2027-06-26 - {Registry.wagons[56017].mileage[datetime.date(2027, 6, 26)]['tr3']},",
                                             #               f"на 2027-07-05 - {Registry.wagons[56017].mileage[datetime.date(2027, 7, 5)]['tr3']}.",
                                             #               file=debug_file)
+                                            confirmed_services_current_iteration.append((train_object,
+                                                                                         start_date,
+                                                                                         end_date))
                                             for wagon_number, wagon_object in train_object.wagons.items():
-                                                # В портянке проставляем отметки выполнения вида ТОиР
-                                                for date in daterange(start_date, end_date):
-                                                    wagon_object.change_idle_reason(date,
-                                                                                    service_type,
-                                                                                    verbose=False)
                                                 # В service_wagons для этого вагона убираем диапазон дат постановки в ТОиР,
                                                 # из которого дата постановки выбрана
                                                 for index in reversed(range(len(service_wagons[wagon_number]["periods"]))):
@@ -251,106 +270,105 @@ def service_planning(service_types):
                                                             index)
                                                         if not len(service_wagons[wagon_number]["periods"]):
                                                             service_wagons[wagon_number]["periods"].append(
-                                                                [])
+                                                                DateIntervals())
                                                         # debug
                                                         # print(f"Для вагона {wagon_number} удален список дат ",
                                                         #       f"{[str(date) for date in startdates_for_train_deleting]}, "
                                                         #       f"содержащий {str(start_date)}", sep="")
                                             # Удаляем объект сцепа, вагонам которого проставлена отметка о ТОиР,
                                             # из всех периодов, в которых он мог встать на ТОиР, включая итоговый принятый.
-                                            for prior, prior_data in sorted(priorities.items(), reverse=True):
-                                                for dates_period, dates_period_data in prior_data["periods"].items():
-                                                    startdat, enddat = dates_period
-                                                    if startdat in startdates_for_train_deleting:
-                                                        dates_period_data["trains"].pop(
-                                                            train_object, None)
-                                                        # debug
-                                                        # print(f"В {prior} из периода {[str(date) for date in dates_period]} ",
-                                                        #       f"удален сцеп {train_object.train_number}", sep="")
-                                            # Из каждого периода берем только по одному сцепу с максимальным пробегом
-                                            break
-                                    # debug
-                                    # else:
-                                    #     print(f"Для периода {[str(start_date), str(end_date)]}",
-                                    #           f"{current_period_max_idle_count=}",
-                                    #           f"{other_periods_max_idle_count=}")
-                        count_wagons_in_motion()
-                        calculate_periods_surplus_wagons(standing_dates)
-                        count_idle_wagons(service_type)
+                                            for dates_period, dates_period_data in trains_periods[train_object]:
+                                                startdat, enddat = dates_period
+                                                if startdat in startdates_for_train_deleting:
+                                                    dates_period_data["trains"].pop(
+                                                        train_object, None)
+                                                    # debug
+                                                    # print(f"Из периода {[str(date) for date in dates_period]} ",
+                                                    #       f"удален сцеп {train_object.train_number}", sep="")
+                                        # debug
+                                        # else:
+                                        #     print(f"Для периода {[str(start_date), str(end_date)]}",
+                                        #           f"{current_period_max_idle_count=}",
+                                        #           f"{other_periods_max_idle_count=}")
+                            for train_object, start_date, end_date in confirmed_services_current_iteration:
+                                # В портянке проставляем отметки выполнения вида ТОиР
+                                train_object.change_idle_reason_range(start_date,
+                                                                      end_date,
+                                                                      service_type,
+                                                                      verbose=False)
+                            calculate_periods_surplus_wagons(standing_dates, session=session)
 
-                        # calculate_wagon_daily_mileage()
-                        # change_trains_daily_mileage()
-                        calculate_train_mileage_ne()
-                        for tra_obje in Registry.trains.values():
-                            for wago_nu in tra_obje.wagons.keys():
-                                calculate_wagon_service_mileage(wago_nu,
-                                                                service_type)
+                            # calculate_wagon_daily_mileage()
+                            # change_trains_daily_mileage()
+                            calculate_fleet_mileage(service_type, session=session)
 
-                        confirmed_trains.extend(
-                            confirmed_trains_current_iteration)
-                        if len(confirmed_trains_current_iteration):
-                            stop_repeating_flag = False
-                        else:
-                            stop_repeating_flag = True
-                        if stop_repeating_flag:
-                            break
-            for priority, priority_data in sorted(priorities.items(), reverse=True):
-                for (startdate, enddate), dates_period_data in priority_data["periods"].items():
-                    if len(dates_period_data["trains"]):
-                        print(f"В периоде {[str(startdate), str(enddate)]}",
-                              f"невозможно выполнение {service_type}",
-                              f"сцепу {[unconf_train.train_number for unconf_train in dates_period_data['trains'].keys()]}. ",
-                              f"Количество возможных ТОиР - {dates_period_data['surplus_wagons_count']}")
-            stop_repeating_flag = True
-            for tr_o in sim_service_trains:
-                for wagon_numb, wagon_obj in tr_o.wagons.items():
-                    periods_list = service_wagons[wagon_numb]["periods"]
-                    wagon_periods_before = ([[]] if periods_list == [[]] else
-                                            [[dat for dat in perd] for perd in periods_list])
-                    for date in daterange(wagon_obj.usage_start_date,
-                                          wagon_obj.usage_end_date):
-                        if wagon_obj.verify_allowed_service_date(date, service_type):
+                            confirmed_trains.extend(
+                                confirmed_trains_current_iteration)
+                            if len(confirmed_trains_current_iteration):
+                                stop_repeating_flag = False
+                            else:
+                                stop_repeating_flag = True
+                            if stop_repeating_flag:
+                                break
+                for priority, priority_data in sorted(priorities.items(), reverse=True):
+                    for (startdate, enddate), dates_period_data in priority_data["periods"].items():
+                        if len(dates_period_data["trains"]):
+                            print(f"В периоде {[str(startdate), str(enddate)]}",
+                                  f"невозможно выполнение {service_type}",
+                                  f"сцепу {[unconf_train.train_number for unconf_train in dates_period_data['trains'].keys()]}. ",
+                                  f"Количество возможных ТОиР - {dates_period_data['surplus_wagons_count']}")
+                stop_repeating_flag = True
+                for tr_o in sim_service_trains:
+                    for wagon_numb, wagon_obj in tr_o.wagons.items():
+                        periods_list = service_wagons[wagon_numb]["periods"]
+                        wagon_periods_before = [perd.copy() for perd in periods_list]
+                        for start_date, end_date in wagon_obj.define_allowed_service_periods(service_type):
                             adding_wagon_service_periods(wagon_numb,
-                                                         date,
-                                                         service_wagons)
-                    wagon_periods_after = periods_list
-                    # debug
-                    with open(select_debug_data_path(), mode="at", encoding="utf-8") as debug_file:
-                        print(f"Вагон {wagon_numb}. Периоды до добавления: {wagon_periods_before},",
-                              f"Периоды после добавления: {wagon_periods_after}",
-                              f"сам список: {service_wagons[wagon_numb]['periods']}", file=debug_file)
-                    if (wagon_periods_after != wagon_periods_before):
-                        stop_repeating_flag = False
-            # debug
-            # if service_type == "to1":
-            print_service_wagons_to_file(service_wagons, service_type,
-                                         sim_service_trains, single_service_wagons,
-                                         select_debug_data_path())
-            if stop_repeating_flag:
-                break
-            for tra_o in sim_service_trains:
-                for wagon_numbe in tra_o.wagons.keys():
-                    update_wagon_service_period(wagon_numbe,
-                                                service_type,
-                                                service_wagons)
-            unify_train_service_period(sim_service_trains,
-                                       service_wagons)
-            calculate_standing_trains_wagons(service_type,
-                                             service_wagons,
-                                             standing_dates,
-                                             sim_service_trains,
-                                             single_service_wagons)
-            # Для ремонта одиночных вагонов
-            # confirmed_wagons = []
-            # for priority, priority_data in sorted(priorities.items(), reverse=True):
-            #     for period, period_data in sorted(priority_data["periods"].items()):
-            #         pass
+                                                         start_date,
+                                                         end_date,
+                                                         service_wagons,
+                                                         session=session)
+                        wagon_periods_after = periods_list
+                        # debug
+                        if trace:
+                            print(f"Вагон {wagon_numb}. Периоды до добавления: {[list(perd) for perd in wagon_periods_before]},",
+                                  f"Периоды после добавления: {[list(perd) for perd in wagon_periods_after]}",
+                                  f"сам список: {[list(perd) for perd in service_wagons[wagon_numb]['periods']]}", file=debug_log.file)
+                        if (wagon_periods_after != wagon_periods_before):
+                            stop_repeating_flag = False
+                # debug
+                # if service_type == "to1":
+                if trace:
+                    print_service_wagons_to_file(service_wagons, service_type,
+                                                 sim_service_trains, single_service_wagons,
+                                                 debug_log.file)
+                if stop_repeating_flag:
+                    break
+                for tra_o in sim_service_trains:
+                    for wagon_numbe in tra_o.wagons.keys():
+                        update_wagon_service_period(wagon_numbe,
+                                                    service_type,
+                                                    service_wagons,
+                                                    session=session)
+                unify_train_service_period(sim_service_trains,
+                                           service_wagons)
+                calculate_standing_trains_wagons(service_type,
+                                                 service_wagons,
+                                                 standing_dates,
+                                                 sim_service_trains,
+                                                 single_service_wagons,
+                                                 session=session)
+                # Для ремонта одиночных вагонов
+                # confirmed_wagons = []
+                # for priority, priority_data in sorted(priorities.items(), reverse=True):
+                #     for period, period_data in sorted(priority_data["periods"].items()):
+                #         pass
 
-        # debug
-        print(f"Сцепы для подтверждения: {sorted([tr.train_number for tr in sim_service_trains])},"
-              f"всего: {len(sim_service_trains)}")
-        print(f"Подтвержденные сцепы: {sorted([tr.train_number for tr in confirmed_trains])},",
-              f"всего: {len(confirmed_trains)}")
+            # debug
+            print(f"Сцепы для подтверждения: {sorted([tr.train_number for tr in sim_service_trains])},"
+                  f"всего: {len(sim_service_trains)}")
+            print(f"Подтвержденные сцепы: {sorted([tr.train_number for tr in confirmed_trains])},",
+                  f"всего: {len(confirmed_trains)}")
 
 # Разобраться с 107 и 108 строками в verification!!!
 # С ними 904 сцепу назначается два периода ТР-3 - предзапланированный и начинающийся со standing_min
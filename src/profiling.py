@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# **************************
+# src/profiling.py
+# **************************
+
+__all__ = [
+    "Profiler",
+    "profile_stage",
+    "profiled",
+]
+
+import contextlib
+import functools
+import inspect
+import json
+import time
+import tracemalloc
+from .classes import Registry
+
+
+class Profiler:
+    """
+    Замеры этапов расчета: время, количество вызовов и (при memory=True)
+    пиковый прирост памяти по данным tracemalloc.
+    Этапы могут быть вложенными, замеры накапливаются по пути этапа
+    вида "service_planning/tr3/calculate_standing_dates".
+    Профилировщик сессии задается в PlanningSession.profiler
+    (None - замеры отключены, см. profile_stage и profiled).
+    """
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        # замеры вида {путь_этапа: {"calls": количество_вызовов,
+        #                           "time": суммарное_время_с,
+        #                           "peak_memory": максимальный_прирост_памяти_байт}}
+        self.records = {}
+        # стек начатых этапов: [путь_этапа, время_начала, память_на_начало, пиковая_память]
+        self.stack = []
+        self.started_tracemalloc = False
+
+    def start(self, name: str):
+        """
+        Начинает этап name (вложенный в текущий этап).
+        """
+        path = f"{self.stack[-1][0]}/{name}" if self.stack else name
+        if path not in self.records:
+            self.records[path] = {"calls": 0, "time": 0.0, "peak_memory": None}
+        current_memory = peak_memory = None
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracemalloc = True
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1][3] = max(self.stack[-1][3], peak_memory)
+            tracemalloc.reset_peak()
+            peak_memory = current_memory
+        self.stack.append([path, time.perf_counter(), current_memory, peak_memory])
+
+    def stop(self):
+        """
+        Завершает текущий этап и добавляет его замеры в records.
+        """
+        end_time = time.perf_counter()
+        path, start_time, start_memory, peak_memory = self.stack.pop()
+        record = self.records[path]
+        record["calls"] += 1
+        record["time"] += end_time - start_time
+        if self.memory:
+            peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+            if self.stack:
+                self.stack[-1][3] = max(self.stack[-1][3], peak_memory)
+            record["peak_memory"] = max(record["peak_memory"] or 0, peak_memory - start_memory)
+            if not self.stack and self.started_tracemalloc:
+                tracemalloc.stop()
+                self.started_tracemalloc = False
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """
+        Контекстный менеджер для замера этапа name.
+        """
+        self.start(name)
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    def report(self):
+        """
+        Возвращает текстовую таблицу замеров в порядке начала этапов:
+        этап (с отступом по вложенности), количество вызовов, время,
+        доля от времени этапов верхнего уровня и пиковый прирост памяти.
+        """
+        total_time = sum(record["time"] for path, record in self.records.items()
+                         if "/" not in path) or 1.0
+        rows = []
+        for path, record in self.records.items():
+            level = path.count("/")
+            peak_memory = record["peak_memory"]
+            rows.append((f"{'  ' * level}{path.rsplit('/', 1)[-1]}",
+                         f"{record['calls']}",
+                         f"{record['time']:.3f}",
+                         f"{record['time'] / total_time:.1%}",
+                         "-" if peak_memory is None else f"{peak_memory / 2 ** 20:.1f}"))
+        titles = ("Этап", "Вызовов", "Время, с", "Доля", "Память, МБ")
+        widths = [max(len(title), *(len(row[index]) for row in rows))
+                  for index, title in enumerate(titles)]
+        lines = [" | ".join([f"{titles[0]:<{widths[0]}}"] +
+                            [f"{title:>{width}}" for title, width in zip(titles[1:], widths[1:])])]
+        lines.append("-+-".join("-" * width for width in widths))
+        for row in rows:
+            lines.append(" | ".join([f"{row[0]:<{widths[0]}}"] +
+                                    [f"{value:>{width}}" for value, width in zip(row[1:], widths[1:])]))
+        return "\n".join(lines)
+
+    def save(self, write_path):
+        """
+        Сохраняет замеры (records) в JSON-файл write_path.
+        """
+        with open(write_path, mode="wt", encoding="utf-8") as json_file:
+            json.dump(self.records, json_file, ensure_ascii=False, indent=2)
+
+
+def profile_stage(name: str, session=None):
+    """
+    Возвращает контекстный менеджер для замера этапа name профилировщиком сессии
+    (по умолчанию - Registry), а при отключенных замерах - пустой контекстный менеджер.
+    """
+    profiler = (Registry if session is None else session).profiler
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.stage(name)
+
+
+def profiled(function):
+    """
+    Декоратор: замеряет вызовы функции как этап с ее именем профилировщиком сессии
+    из аргумента session (именованного или позиционного, по умолчанию - Registry).
+    При отключенных замерах функция вызывается сразу.
+    """
+    name = function.__name__
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        session = kwargs.get("session")
+        if session is None and args and "session" in signature.parameters:
+            session = signature.bind_partial(*args, **kwargs).arguments.get("session")
+        profiler = (session or Registry).profiler
+        if profiler is None:
+            return function(*args, **kwargs)
+        profiler.start(name)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.stop()
+    return wrapper
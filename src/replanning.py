@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# **************************
+# src/replanning.py
+# **************************
+
+__all__ = [
+    "define_drifted_trains",
+    "define_kept_services",
+    "replan_services",
+]
+
+import datetime
+from .classes import FleetMileage, Registry, WagonTimeline
+from .profiling import profile_stage
+
+
+def define_drifted_trains(previous_mileage_path,
+                          mileage_tolerance: int,
+                          session=None):
+    """
+    Сравнивает пробеги от н.э. вагонов сессии (по умолчанию - Registry) на дату начала расчета
+    (по новой выгрузке) с пробегами на эту дату по предыдущему расчету
+    из двоичного поколоночного файла previous_mileage_path (см. create_columnar_file_output).
+    Возвращает множество объектов сцепов, у которых пробег хотя бы одного вагона
+    отличается больше чем на mileage_tolerance, либо вагоны которых отсутствуют
+    в предыдущем расчете, входили в другой сцеп или не имеют пробега на эту дату.
+    """
+    from .parsing import read_columnar_file_header, read_columnar_file_outputs
+
+    if session is None:
+        session = Registry
+    header = read_columnar_file_header(previous_mileage_path)
+    previous_wagons = {wagon["wagon_number"]: wagon for wagon in header["wagons"]}
+    # файл отображается в память один раз для всех вагонов
+    previous_mileages = read_columnar_file_outputs(previous_mileage_path, ("ne",), header=header)
+    res = set()
+    for train_number, train_object in session.trains.items():
+        for wagon_number, wagon_object in train_object.wagons.items():
+            previous_wagon = previous_wagons.get(wagon_number)
+            if previous_wagon is None or previous_wagon["train_number"] != train_number:
+                res.add(train_object)
+                break
+            index = (session.planning_start_date -
+                     datetime.date.fromisoformat(previous_wagon["start_date"])).days
+            if not 0 <= index < previous_wagon["length"]:
+                res.add(train_object)
+                break
+            previous_mileage_ne = previous_mileages[wagon_number]["ne"][index]
+            mileage_ne = wagon_object.mileage[session.planning_start_date]["ne"]
+            if (previous_mileage_ne == header["none"] or mileage_ne is None or
+                    abs(mileage_ne - previous_mileage_ne) > mileage_tolerance):
+                res.add(train_object)
+                break
+    return res
+
+
+def define_kept_services(previous_services: dict,
+                         service_types,
+                         replanned_trains: set,
+                         session=None):
+    """
+    Получает ТОиР предыдущего расчета (см. parsing.read_sqlite_planned_services).
+    Для каждого сцепа сессии (по умолчанию - Registry), не входящего в replanned_trains,
+    проверяет, что все его ТОиР видов service_types, начинающиеся после даты начала расчета,
+    остаются допустимыми по новой выгрузке: находятся в периоде эксплуатации,
+    не пересекаются с простоями на дату начала расчета и друг с другом,
+    и на дату начала каждого ТОиР пробеги всех вагонов находятся в пределах норм min - max
+    (с учетом предыдущих сохраняемых ТОиР, по событийной модели пробегов WagonTimeline).
+    Суточные пробеги вагонов в движении (session.wagon_daily_mileage) должны быть вычислены.
+    Состав сцепа должен совпадать с составом в предыдущем расчете.
+    ТОиР отдельных вагонов (period_data["single_wagons"]) не сохраняются, так как
+    service_planning планирует ТОиР посоставно, - сцепы таких вагонов перепланируются.
+    Сцепы, у которых хотя бы один ТОиР недопустим, добавляются в replanned_trains.
+    Возвращает словарь сохраняемых ТОиР вида {объект_сцепа: [(вид_ТОиР, дата_начала, дата_окончания), ...]}.
+    """
+    if session is None:
+        session = Registry
+    trains_services = {}
+    for service_type in service_types:
+        for (start_date, end_date), period_data in previous_services.get(service_type, {}).items():
+            if start_date <= session.planning_start_date:
+                continue
+            for train_number, wagons_numbers in period_data["trains"].items():
+                train_object = session.trains.get(train_number)
+                if train_object is None:
+                    continue
+                if sorted(train_object.wagons) != sorted(wagons_numbers):
+                    replanned_trains.add(train_object)
+                    continue
+                trains_services.setdefault(train_object, []).append((service_type, start_date, end_date))
+            for wagon_number in period_data["single_wagons"]:
+                wagon_object = session.wagons.get(wagon_number)
+                if wagon_object is None:
+                    continue
+                train_object = session.trains.get(wagon_object.train_number)
+                if train_object is not None:
+                    replanned_trains.add(train_object)
+    fleet_mileage = FleetMileage.from_session(session)
+    res = {}
+    for train_object, services in trains_services.items():
+        if train_object in replanned_trains:
+            continue
+        services.sort(key=lambda service: service[1])
+        valid_flag = True
+        for wagon_object in train_object.wagons.values():
+            timeline = WagonTimeline.from_wagon(wagon_object, fleet_mileage)
+            for service_type, start_date, end_date in services:
+                if not wagon_object.usage_start_date < start_date < end_date <= wagon_object.usage_end_date:
+                    valid_flag = False
+                    break
+                mileage_standards = wagon_object.mileage_standards[service_type]
+                mileage = timeline.mileage("kr_sr" if service_type in ("sr", "kr") else service_type,
+                                           start_date)
+                if mileage is None:
+                    mileage = timeline.mileage("ne", start_date)
+                if not mileage_standards["min"] <= mileage <= mileage_standards["max"]:
+                    valid_flag = False
+                    break
+                try:
+                    timeline.add_idle(service_type, start_date, end_date)
+                except ValueError:
+                    valid_flag = False
+                    break
+            if not valid_flag:
+                break
+        if valid_flag:
+            res[train_object] = services
+        else:
+            replanned_trains.add(train_object)
+    return res
+
+
+def replan_services(planning_inputs: dict,
+                    previous_services_path,
+                    previous_mileage_path,
+                    service_types,
+                    mileage_tolerance: int = 5_000,
+                    usage_ratio: float = 0.8,
+                    confirm_trains=None,
+                    session=None):
+    """
+    Инкрементный расчет по новой выгрузке: вместо планирования всех сцепов заново
+    сохраняет ТОиР предыдущего расчета, которые остаются допустимыми,
+    и планирует ТОиР только остальным сцепам.
+    planning_inputs - исходные данные по новой выгрузке (см. select_planning_inputs),
+    previous_services_path - база данных SQLite предыдущего расчета (см. create_sqlite_file_output),
+    previous_mileage_path - двоичный поколоночный файл предыдущего расчета
+    (см. create_columnar_file_output).
+    Перепланируются сцепы, у которых пробег на дату новой выгрузки отклонился от пробега
+    по предыдущему расчету больше чем на mileage_tolerance (см. define_drifted_trains)
+    или хотя бы один ТОиР стал недопустимым (см. define_kept_services),
+    а если период расчета выходит за период предыдущего расчета - все сцепы.
+    Сохраняемые ТОиР вносятся в таблицы пробегов и session.result_services
+    до планирования, поэтому учитываются в количестве вагонов в движении и на ТОиР.
+    Возвращает сессию расчета (по умолчанию - Registry).
+    """
+    from .calculation import (
+        calculate_fleet_mileage,
+        calculate_wagon_daily_mileage,
+        count_wagons_in_motion
+    )
+    from .creation import create_planning_session
+    from .parsing import read_columnar_file_header, read_sqlite_planned_services
+    from .planning import service_planning
+    from .verification import verify_planning_results
+
+    with profile_stage("create_planning_session", session=session):
+        session = create_planning_session(planning_inputs,
+                                          confirm_trains=confirm_trains,
+                                          session=session)
+    with profile_stage("define_kept_services", session=session):
+        previous_end_date = datetime.date.fromisoformat(
+            read_columnar_file_header(previous_mileage_path)["planning_end_date"])
+        if session.planning_end_date > previous_end_date:
+            replanned_trains = set(session.trains.values())
+        else:
+            replanned_trains = define_drifted_trains(previous_mileage_path,
+                                                     mileage_tolerance,
+                                                     session=session)
+        count_wagons_in_motion(session=session)
+        calculate_wagon_daily_mileage(usage_ratio=usage_ratio, session=session)
+        kept_services = define_kept_services(read_sqlite_planned_services(previous_services_path),
+                                             service_types,
+                                             replanned_trains,
+                                             session=session)
+        for train_object, services in kept_services.items():
+            for service_type, start_date, end_date in services:
+                train_object.change_idle_reason_range(start_date,
+                                                      end_date,
+                                                      service_type,
+                                                      verbose=False)
+                session.result_services.setdefault(service_type, {}).setdefault(
+                    (start_date, end_date), {"trains": []})["trains"].append(train_object)
+    print(f"Сохранены ТОиР {len(kept_services)} сцепов, ",
+          f"перепланируются сцепы: {sorted(train_object.train_number for train_object in replanned_trains)}",
+          sep="")
+    with profile_stage("service_planning", session=session):
+        service_planning(service_types,
+                         usage_ratio=usage_ratio,
+                         trains=[session.trains[train_number] for train_number in sorted(session.trains)
+                                 if session.trains[train_number] in replanned_trains],
+                         session=session)
+    # Пробеги от ТОиР вагонов сцепов с сохраненными ТОиР пересчитываются так же,
+    # как после каждого прохода планирования в service_planning
+    for service_type in service_types:
+        calculate_fleet_mileage(service_type, session=session)
+    with profile_stage("verify_planning_results", session=session):
+        verify_planning_results(service_types, session=session)
+    return session
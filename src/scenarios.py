@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# **************************
+# src/scenarios.py
+# **************************
+
+__all__ = [
+    "calculate_scenario_results",
+    "format_scenarios_results",
+    "init_scenario_worker",
+    "run_scenario",
+    "run_scenarios",
+]
+
+import contextlib
+import datetime
+import os
+import sys
+
+if __name__ == "__main__" and not __package__:
+    # Запуск файлом (python scenarios.py): модули загружаются как пакет src
+    from os.path import abspath, basename, dirname
+    sys.path.insert(0, dirname(dirname(abspath(__file__))))
+    __package__ = basename(dirname(abspath(__file__)))
+
+from .classes import FleetMileage, PlanningSession, WagonTimeline
+from concurrent.futures import ProcessPoolExecutor
+from .calculation import calculate_reserve_wagons
+from .creation import create_planning_session
+from .planning import service_planning
+from .utility import daterange
+
+# Исходные данные, общие для всех вариантов расчета в процессе-исполнителе
+# (заполняется один раз при запуске процесса в init_scenario_worker)
+worker_data = {}
+
+
+def init_scenario_worker(planning_inputs: dict,
+                         service_types,
+                         confirmed_trains=None,
+                         quiet: bool = True):
+    """
+    Инициализирует процесс-исполнитель вариантов расчета: сохраняет исходные данные
+    (см. selection.select_planning_inputs), виды ТОиР для планирования и подтвержденные сцепы,
+    чтобы они передавались в процесс один раз, а не с каждым вариантом.
+    При quiet=True вывод расчетов процесса в консоль отключается (см. run_scenario).
+    """
+    worker_data["planning_inputs"] = planning_inputs
+    worker_data["service_types"] = service_types
+    worker_data["confirmed_trains"] = confirmed_trains
+    worker_data["quiet"] = quiet
+
+
+def run_scenario(scenario: dict):
+    """
+    Получает вариант расчета (см. selection.select_scenarios).
+    В отдельной сессии выполняет расчет по исходным данным процесса-исполнителя
+    (см. init_scenario_worker) и возвращает его показатели (см. calculate_scenario_results).
+    """
+    confirmed_trains = worker_data["confirmed_trains"]
+    service_types = worker_data["service_types"]
+    with (open(os.devnull, mode="wt", encoding="utf-8") if worker_data["quiet"] else
+          contextlib.nullcontext(sys.stdout)) as output, contextlib.redirect_stdout(output):
+        session = create_planning_session(worker_data["planning_inputs"],
+                                          standing_min_percentage=scenario["standing_min_percentage"],
+                                          transportation_values=scenario.get("transportation_values"),
+                                          confirm_trains=lambda possible_trains: confirmed_trains,
+                                          session=PlanningSession())
+        service_planning(service_types,
+                         usage_ratio=scenario["usage_ratio"],
+                         session=session)
+        return calculate_scenario_results(scenario, service_types, session)
+
+
+def run_scenarios(scenarios: list,
+                  planning_inputs: dict,
+                  service_types=("tr3", "tr2", "tr1"),
+                  confirmed_trains=None,
+                  max_workers: int = None):
+    """
+    Получает список вариантов расчета (см. selection.select_scenarios)
+    и исходные данные (см. selection.select_planning_inputs), полученные один раз.
+    Выполняет варианты параллельно в max_workers процессах (по умолчанию - по числу ядер),
+    исходные данные передаются в каждый процесс один раз при его запуске.
+    confirmed_trains - сцепы, подтвержденные пользователем (см. confirm_possible_trains),
+    в вариантах расчета подтверждение не запрашивается.
+    Возвращает список показателей вариантов (см. calculate_scenario_results) в порядке scenarios.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=init_scenario_worker,
+                             initargs=(planning_inputs,
+                                       service_types,
+                                       confirmed_trains)) as executor:
+        return list(executor.map(run_scenario, scenarios))
+
+
+def calculate_scenario_results(scenario: dict,
+                               service_types,
+                               session: PlanningSession):
+    """
+    По результатам планирования в сессии определяет показатели варианта расчета.
+    Возвращает словарь вида:
+    {"name": название_варианта,
+     "overrun_wagons": количество_пар_вагон-вид_ТОиР_с_перепробегом,
+     "overrun_days": количество_вагоно-суток_с_перепробегом,
+     "min_reserve_wagons": минимальный_резерв_вагонов_сверх_максимальной_парности,
+     "min_reserve_date": дата_минимального_резерва,
+     "services": {вид_ТОиР: {"ГГГГ-ММ": количество_вагонов_поставленных_в_ТОиР}}
+     }
+    """
+    overrun_wagons = overrun_days = 0
+    # перепробеги считаются по событийной модели пробегов (по участкам между ТОиР),
+    # а не перебором пробегов на каждую дату
+    fleet_mileage = FleetMileage.from_session(session)
+    for train_object in session.trains.values():
+        for wagon_object in train_object.wagons.values():
+            timeline = WagonTimeline.from_wagon(wagon_object, fleet_mileage)
+            for service_type in service_types:
+                max_mileage = wagon_object.mileage_standards[service_type]["max"]
+                wagon_overrun_days = timeline.count_overrun_days(
+                    "kr_sr" if service_type in ("kr", "sr") else service_type, max_mileage)
+                if wagon_overrun_days:
+                    overrun_wagons += 1
+                    overrun_days += wagon_overrun_days
+
+    min_reserve_wagons = min_reserve_date = None
+    for date in daterange(session.planning_start_date, session.planning_end_date):
+        reserve_wagons = calculate_reserve_wagons(session.wagons_in_motion[date],
+                                                  session.transportation_values[date]["trains_count_max"],
+                                                  session=session)
+        if min_reserve_wagons is None or reserve_wagons < min_reserve_wagons:
+            min_reserve_wagons, min_reserve_date = reserve_wagons, date
+
+    services = {}
+    for service_type in service_types:
+        services[service_type] = {}
+        for (start_date, end_date), rolling_stock_data in sorted(session.result_services.get(service_type, {}).items()):
+            month = f"{start_date.year}-{start_date.month:02d}"
+            wagons_count = (sum(len(train_object.wagons) for train_object in rolling_stock_data.get("trains", ())) +
+                            len(rolling_stock_data.get("single_wagons", ())))
+            services[service_type][month] = services[service_type].get(month, 0) + wagons_count
+    return {"name": scenario["name"],
+            "overrun_wagons": overrun_wagons,
+            "overrun_days": overrun_days,
+            "min_reserve_wagons": min_reserve_wagons,
+            "min_reserve_date": min_reserve_date,
+            "services": services}
+
+
+def format_scenarios_results(results: list):
+    """
+    Получает список показателей вариантов расчета (см. calculate_scenario_results).
+    Возвращает текстовую таблицу для сравнения вариантов:
+    по столбцам - варианты, по строкам - перепробеги, минимальный резерв вагонов
+    и количество вагонов, поставленных в каждый вид ТОиР, по месяцам.
+    """
+    rows = [("Перепробеги, вагон-ТОиР", [res["overrun_wagons"] for res in results]),
+            ("Перепробеги, вагоно-сут.", [res["overrun_days"] for res in results]),
+            ("Мин. резерв вагонов", [res["min_reserve_wagons"] for res in results]),
+            ("Дата мин. резерва", [str(res["min_reserve_date"]) for res in results])]
+    service_types = []
+    for res in results:
+        for service_type in res["services"]:
+            if service_type not in service_types:
+                service_types.append(service_type)
+    for service_type in service_types:
+        months = sorted({month for res in results
+                         for month in res["services"].get(service_type, {})})
+        for month in months:
+            rows.append((f"{service_type} {month}",
+                         [res["services"].get(service_type, {}).get(month, 0) for res in results]))
+    first_width = max(len(title) for title, values in rows)
+    widths = [max(10, len(res["name"])) for res in results]
+    lines = [" | ".join([f"{'Вариант':<{first_width}}"] +
+                        [f"{res['name']:>{width}}" for res, width in zip(results, widths)])]
+    lines.append("-+-".join(["-" * first_width] + ["-" * width for width in widths]))
+    for title, values in rows:
+        lines.append(" | ".join([f"{title:<{first_width}}"] +
+                                [f"{str(value):>{width}}" for value, width in zip(values, widths)]))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from .confirmation import confirm_possible_trains
+    from .selection import select_planning_inputs, select_scenarios
+
+    start_time = datetime.datetime.now()
+    scenarios = select_scenarios()
+    planning_inputs = select_planning_inputs()
+    # Подтверждение сцепов запрашивается у пользователя один раз (как в main.py)
+    # при подготовке сессии и передается во все варианты расчета
+    confirmed_trains = []
+
+    def confirm_trains(possible_trains: dict):
+        confirmed_trains.append(confirm_possible_trains(possible_trains))
+        return confirmed_trains[0]
+
+    create_planning_session(planning_inputs,
+                            confirm_trains=confirm_trains,
+                            session=PlanningSession())
+    scenarios_results = run_scenarios(scenarios,
+                                      planning_inputs,
+                                      confirmed_trains=confirmed_trains[0])
+    print(format_scenarios_results(scenarios_results))
+    print(f"Время расчета: {datetime.datetime.now() - start_time}")
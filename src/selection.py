@@ -6,17 +6,28 @@
 # **************************
 
 __all__ = [
+    "select_benchmark_data_path",
+    "select_cache_data_path",
+    "select_columnar_output_data_path",
     "select_current_idle_end",
     "select_debug_data_path",
+    "select_debug_level",
     "select_extra_wagon_data_path",
     "select_hitched_wagons",
     "select_idle_wagons",
     "select_line_motion_time",
+    "select_long_term_end_date",
     "select_main_wagon_data_path",
+    "select_mileage_tolerance",
     "select_output_data_path",
     "select_planning_end_date",
+    "select_planning_inputs",
     "select_possible_trains",
     "select_preplanned_services",
+    "select_profiling_data_path",
+    "select_profiling_mode",
+    "select_scenarios",
+    "select_sqlite_output_data_path",
     "select_text_result_data_path",
     "select_transportation_values",
     "select_unhitched_wagons",
@@ -24,9 +35,9 @@ __all__ = [
 
 
 import datetime
-from classes import Registry
+from .classes import Registry
 from os.path import abspath, dirname, join
-from utility import daterange
+from .utility import daterange
 
 
 def select_main_wagon_data_path():
@@ -63,6 +74,17 @@ def select_output_data_path():
     return data_path
 
 
+def select_columnar_output_data_path():
+    """
+    Возвращает абсолютный путь до двоичного поколоночного файла
+    с пробегами вагонов (см. create_columnar_file_output).
+    """
+    current_dir = dirname(__file__)
+    data_path = abspath(
+        join(current_dir, "..", "Data", "test_planning.bin"))
+    return data_path
+
+
 def select_debug_data_path():
     """
     Возвращает абсолютный путь до отладочного txt-файла.
@@ -73,6 +95,68 @@ def select_debug_data_path():
     return data_path
 
 
+def select_benchmark_data_path():
+    """
+    Возвращает абсолютный путь до JSON-файла
+    с результатами замеров времени расчета (см. benchmark.run_benchmarks).
+    """
+    current_dir = dirname(__file__)
+    data_path = abspath(
+        join(current_dir, "..", "Data", "benchmark.json"))
+    return data_path
+
+
+def select_cache_data_path():
+    """
+    Возвращает абсолютный путь до папки с кэшем результатов парсинга выгрузок.
+    """
+    current_dir = dirname(__file__)
+    data_path = abspath(
+        join(current_dir, "..", "Data", "cache"))
+    return data_path
+
+
+def select_profiling_mode():
+    """
+    Запрашивает у пользователя режим замеров этапов расчета (см. profiling.Profiler):
+    None - замеры отключены, "time" - время и количество вызовов,
+    "memory" - также пиковый прирост памяти (tracemalloc, заметно замедляет расчет).
+    """
+    return None
+
+
+def select_profiling_data_path():
+    """
+    Возвращает абсолютный путь до JSON-файла с замерами этапов расчета.
+    """
+    current_dir = dirname(__file__)
+    data_path = abspath(
+        join(current_dir, "..", "Data", "profiling.json"))
+    return data_path
+
+
+def select_debug_level():
+    """
+    Запрашивает у пользователя уровень детализации отладочного вывода.
+    Возвращает DebugLog.INFO (только замечания по расчету)
+    или DebugLog.TRACE (с подробными выгрузками промежуточных данных планирования).
+    """
+    from .classes import DebugLog
+
+    return DebugLog.INFO
+
+
+def select_sqlite_output_data_path():
+    """
+    Возвращает абсолютный путь до базы данных SQLite
+    с результатами планирования (см. create_sqlite_file_output).
+    """
+    current_dir = dirname(__file__)
+    data_path = abspath(
+        join(current_dir, "..", "Data", "test_planning.sqlite"))
+    return data_path
+
+
 def select_text_result_data_path():
     """
     Возвращает абсолютный путь до txt-файла с результатами расчета.
@@ -94,14 +178,36 @@ def select_planning_end_date():
     return end_date
 
 
-def select_hitched_wagons():
+def select_long_term_end_date():
+    """
+    Запрашивает у пользователя дату окончания укрупненного планирования СР и КР
+    по месяцам (см. longterm.plan_long_term_services), выполняемого перед расчетом.
+    Возвращает дату (первая дата, которая не входит в расчет)
+    или None - укрупненное планирование не выполняется.
+    """
+    return None
+
+
+def select_mileage_tolerance():
+    """
+    Запрашивает у пользователя допустимое отклонение пробега вагона от н.э.
+    по новой выгрузке от пробега по предыдущему расчету, при котором
+    ТОиР сцепа сохраняются при инкрементном расчете (см. replanning.replan_services).
+    Возвращает отклонение в км.
+    """
+    return 5_000
+
+
+def select_hitched_wagons(session=None):
     """
     Получает словарь вагонов вида {номер_вагона: объект_вагона}.
     Собирает все вагоны, имеющие метку о нахождении в сцепе, в словарь вида
     {номер_сцепа: {номер_вагона: объект_вагона}} и возвращает его
     """
+    if session is None:
+        session = Registry
     hitched_wagons = {}
-    for wagon_object in Registry.wagons.values():
+    for wagon_object in session.wagons.values():
         tn = wagon_object.train_number
         if wagon_object.in_train:
             hitched_wagons[tn] = hitched_wagons.get(tn, {})
@@ -109,29 +215,33 @@ def select_hitched_wagons():
     return hitched_wagons
 
 
-def select_unhitched_wagons():
+def select_unhitched_wagons(session=None):
     """
     Обрабатывает словарь вагонов (вида {номер_вагона: объект_вагона}) из реестра.
     Собирает все вагоны, не имеющие метки о нахождении в сцепе, в словарь вида
     {номер_вагона: объект_вагона} и возвращает его
     """
+    if session is None:
+        session = Registry
     unhitched_wagons = {}
-    for wagon_number, wagon_object in Registry.wagons.items():
+    for wagon_number, wagon_object in session.wagons.items():
         if wagon_object.train_number is None:
             unhitched_wagons[wagon_number] = wagon_object
     return unhitched_wagons
 
 
-def select_possible_trains():
+def select_possible_trains(session=None):
     """
     Обрабатывает словарь невцепленных вагонов (вида {номер_вагона: объект_вагона}) из реестра.
     Возвращает словарь списков вагонов (вида {порядковый_номер: [вагон1, вагон2...]}),
     которые возможно ездят в одном сцепе, для последующего одобрения пользователем.
     """
+    if session is None:
+        session = Registry
     # tmp_dict вида {дата_изготовления: {счетчик: количество, вагоны: {номер_вагона: объект_вагона}},
     #                   пробег_от_н.э.: {счетчик: количество, вагоны: {номер_вагона: объект_вагона}}}
     tmp_dict = {}
-    for wagon_number, wagon_object in Registry.unhitched_wagons.items():
+    for wagon_number, wagon_object in session.unhitched_wagons.items():
         pd = wagon_object.production_date
         ne = wagon_object.mileage[wagon_object.usage_start_date]["ne"]
         # группируем вагоны по дате изготовления
@@ -146,7 +256,7 @@ def select_possible_trains():
         tmp_dict[ne]["wagons"][wagon_number] = wagon_object
     possible_trains_list = []
     for wagons_values in tmp_dict.values():
-        if wagons_values["count"] == Registry.train_lenght:
+        if wagons_values["count"] == session.train_lenght:
             tmp_list = sorted(
                 [wagon_number for wagon_number in wagons_values["wagons"].keys()])
             if tmp_list not in possible_trains_list:
@@ -193,6 +303,87 @@ def select_line_motion_time():
     return 41.48333333333333
 
 
+def select_planning_inputs(main_data_path=None,
+                           extra_data_path=None,
+                           planning_end_date: datetime.date = None):
+    """
+    Собирает исходные данные расчета: результаты парсинга выгрузок АСУ Депо
+    и данные, задаваемые пользователем.
+    main_data_path, extra_data_path - html-файлы выгрузок (по умолчанию -
+    select_main_wagon_data_path и select_extra_wagon_data_path),
+    planning_end_date - дата окончания расчета (по умолчанию - select_planning_end_date).
+    Возвращает словарь вида:
+    {"raw_start_date": дата_начала_расчета_из_выгрузки,
+     "wagons_attrs": обработанные_атрибуты_вагонов (ТР-1 - КР, см. convert_wagons_attrs),
+     "extra_wagons_attrs": обработанные_атрибуты_вагонов (ТО-1 - ТР-2,
+                                                          см. convert_extra_wagons_attrs),
+     "planning_end_date": дата_окончания_расчета,
+     "transportation_values": парности (см. select_transportation_values),
+     "line_motion_time": время_движения_и_оборота,
+     "preplanned_services": предзапланированные_ТОиР (см. select_preplanned_services)
+     }
+    Словарь не содержит объектов расчета, поэтому один раз полученные исходные данные
+    можно использовать для нескольких расчетов (в т.ч. в других процессах).
+    Выгрузки парсятся потоково с преобразованием атрибутов по мере чтения строк,
+    из выгрузок используются только нужные для расчета столбцы,
+    преобразованные атрибуты кэшируются в папке Data/cache (см. pars_wagons_data_cached).
+    """
+    from .conversion import (
+        EXTRA_DATA_COLUMNS,
+        MAIN_DATA_COLUMNS,
+        convert_extra_wagons_attrs,
+        convert_wagons_attrs
+    )
+    from .parsing import pars_wagons_data_cached
+    from .profiling import profile_stage
+
+    if main_data_path is None:
+        main_data_path = select_main_wagon_data_path()
+    if extra_data_path is None:
+        extra_data_path = select_extra_wagon_data_path()
+    if planning_end_date is None:
+        planning_end_date = select_planning_end_date()
+
+    with profile_stage("pars_main_wagons_data"):
+        raw_start_date, wagons_attrs = pars_wagons_data_cached(main_data_path,
+                                                               select_cache_data_path(),
+                                                               MAIN_DATA_COLUMNS,
+                                                               convert_wagons_attrs)
+    with profile_stage("pars_extra_wagons_data"):
+        _, extra_wagons_attrs = pars_wagons_data_cached(extra_data_path,
+                                                        select_cache_data_path(),
+                                                        EXTRA_DATA_COLUMNS,
+                                                        convert_extra_wagons_attrs)
+    return {"raw_start_date": raw_start_date,
+            "wagons_attrs": wagons_attrs,
+            "extra_wagons_attrs": extra_wagons_attrs,
+            "planning_end_date": planning_end_date,
+            "transportation_values": select_transportation_values(),
+            "line_motion_time": select_line_motion_time(),
+            "preplanned_services": select_preplanned_services()
+            }
+
+
+def select_scenarios():
+    """
+    Запрашивает у пользователя варианты расчета для сравнения.
+    Возвращает список словарей вида:
+    [{"name": название_варианта,
+      "standing_min_percentage": процент_от_диапазона_ТОиР (см. mileage_frequency_standards),
+      "usage_ratio": доля_пробега_линии (см. calculate_wagon_daily_mileage),
+      "transportation_values": парности (None - см. select_transportation_values)
+      }, ...]
+    """
+    scenarios = []
+    for standing_min_percentage in (0.5, 0.6, 0.7, 0.8):
+        for usage_ratio in (0.8, 1.0):
+            scenarios.append({"name": f"{standing_min_percentage:.0%} / {usage_ratio:.0%}",
+                              "standing_min_percentage": standing_min_percentage,
+                              "usage_ratio": usage_ratio,
+                              "transportation_values": None})
+    return scenarios
+
+
 def select_preplanned_services():
     """
     Запрашивает у пользователя информацию о заранее запланированных ТОиР:
@@ -311,14 +502,16 @@ def select_preplanned_services():
     return services
 
 
-def select_idle_wagons(date: datetime.date):
+def select_idle_wagons(date: datetime.date, session=None):
     """
     Выбирает из общего списка вагоны всех сцепов, не находящиеся в движении
     (то есть находящиеся на ТОиР или в отстое) в указанную дату
     Возвращает словарь вида {дата: {номер_сцепа: {номер_вагона: причина_простоя}}}
     """
+    if session is None:
+        session = Registry
     res = {}
-    for train in Registry.trains.values():
+    for train in session.trains.values():
         train_number = train.train_number
         for wagon in train.wagons.values():
             wagon_number = wagon.wagon_number
@@ -332,7 +525,7 @@ def select_idle_wagons(date: datetime.date):
     return res
 
 
-def select_current_idle_end(idle_wagons: dict):
+def select_current_idle_end(idle_wagons: dict, session=None):
     """
     Получает словарь вагонов, не находящихся в движении
     (то есть находящиеся на ТОиР или в отстое)
@@ -340,6 +533,8 @@ def select_current_idle_end(idle_wagons: dict):
     Запрашивает у пользователя для каждого вагона ввод даты начала движения
     Возвращает список словарей вида [{номер_вагона: {причина_простоя: (дата_начала, дата_конца)}}]
     """
+    if session is None:
+        session = Registry
     # def ask_date(usage_start_date: datetime.date,
     #              usage_end_date: datetime.date):
     #     """
@@ -425,32 +620,32 @@ def select_current_idle_end(idle_wagons: dict):
             (datetime.date(2022, 3, 31),
              datetime.date(2022, 5, 26)): {
                  'trains': [
-                     Registry.trains[906]
+                     session.trains[906]
                  ]
             },
             (datetime.date(2022, 3, 31),
              datetime.date(2022, 4, 11)): {
                 'trains': [
-                    Registry.trains[907],
-                    Registry.trains[910]
+                    session.trains[907],
+                    session.trains[910]
                 ]
             },
             (datetime.date(2022, 3, 31),
              datetime.date(2022, 4, 29)): {
                 'trains': [
-                    Registry.trains[901]
+                    session.trains[901]
                 ]
             },
             (datetime.date(2022, 3, 31),
              datetime.date(2022, 4, 22)): {
                 'trains': [
-                    Registry.trains[909]
+                    session.trains[909]
                 ]
             },
             (datetime.date(2022, 3, 31),
                 datetime.date(2022, 4, 1)): {
                 'trains': [
-                    Registry.trains[32]
+                    session.trains[32]
                 ]
             }
         },
@@ -458,19 +653,19 @@ def select_current_idle_end(idle_wagons: dict):
             (datetime.date(2022, 3, 31),
              datetime.date(2022, 7, 15)): {
                  'trains': [
-                     Registry.trains[904]
+                     session.trains[904]
                  ]
             },
             (datetime.date(2022, 7, 18),
              datetime.date(2022, 8, 18)): {
                  'trains': [
-                     Registry.trains[21]
+                     session.trains[21]
                  ]
             },
             (datetime.date(2022, 9, 1),
              datetime.date(2022, 10, 15)): {
                  'trains': [
-                     Registry.trains[37]
+                     session.trains[37]
                  ]
             }
         }
@@ -9,6 +9,7 @@ __all__ = [
     "daterange",
     "check_input_dates_planning",
     "check_input_dates_usage",
+    "get_work_calendar",
     "print_result_services_to_file",
     "print_service_wagons_to_file",
     "print_standing_dates_to_file",
@@ -53,34 +54,23 @@ def daterange(start_date: datetime.date,
 
 def workdayrange(start_date: datetime.date,
                  end_date: datetime.date,
-                 delta: datetime.timedelta = datetime.timedelta(days=1)):
+                 delta: datetime.timedelta = datetime.timedelta(days=1),
+                 session=None):
     """
     Генерирует рабочие даты из диапазона от start_date (включая) до end_date (не включая)
     с шагом delta. Аналог range для рабочих дней.
     """
-    from classes import Registry
     if isinstance(start_date, datetime.date) and \
             isinstance(end_date, datetime.date):
         if isinstance(delta, datetime.timedelta):
             if not delta.days:
                 raise ValueError("Значение шага не должно быть равно нулю!")
             dur = (end_date - start_date).days
-            res_date = start_date
-            count = 0
-            if dur > 0 and delta.days > 0:
-                while res_date < end_date:
-                    if not Registry.transportation_values[res_date]["holiday"]:
-                        if count % delta.days == 0:
-                            yield res_date
-                        count += 1
-                    res_date += datetime.timedelta(days=1)
-            elif dur < 0 and delta.days < 0:
-                while res_date > end_date:
-                    if not Registry.transportation_values[res_date]["holiday"]:
-                        if count % delta.days == 0:
-                            yield res_date
-                        count -= 1
-                    res_date -= datetime.timedelta(days=1)
+            if (dur > 0 and delta.days > 0) or \
+                    (dur < 0 and delta.days < 0):
+                calendar = get_work_calendar(session=session)
+                for index in calendar.workdays_range(start_date, end_date, delta.days):
+                    yield calendar.date(index)
             elif not dur:
                 pass
             else:
@@ -92,68 +82,79 @@ def workdayrange(start_date: datetime.date,
             "Даты начала и конца диапазона должны быть типа datetime.date!")
 
 
-def workdate(start_date: datetime.date, delta: datetime.timedelta):
+def workdate(start_date: datetime.date, delta: datetime.timedelta, session=None):
     """
     Возвращает дату, которая будет через delta рабочих дней после start_date.
     (start_date включается, end_date не включается).
     """
-    from classes import Registry
     days = delta.days
     if days > 0:
-        res_date = start_date
-        count = 0
-        while count < days:
-            current_date = Registry.transportation_values.get(res_date)
-            if current_date is not None:
-                if not current_date["holiday"]:
-                    count += 1
-            else:
-                return None
-            res_date += datetime.timedelta(days=1)
-        return res_date
+        return get_work_calendar(session=session).workdate(start_date, days)
     else:
         raise ValueError("Значение шага должно быть больше нуля!")
 
 
+def get_work_calendar(session=None):
+    """
+    Возвращает календарь рабочих дней (объект WorkCalendar) для текущих
+    Registry.transportation_values. Календарь создается один раз
+    и пересоздается только при замене Registry.transportation_values.
+    """
+    from .classes import Registry, WorkCalendar
+
+    if session is None:
+        session = Registry
+
+    calendar = session.calendar
+    if (calendar is None or
+            calendar.transportation_values is not session.transportation_values):
+        calendar = WorkCalendar(session.transportation_values)
+        session.calendar = calendar
+    return calendar
+
+
 def print_standing_dates_to_file(standing_dates: dict,
-                                 debug_file_path,
+                                 debug_file,
                                  delta: datetime.date = None,
                                  priority: str = None,
-                                 priority_data: dict = None):
+                                 priority_data: dict = None,
+                                 session=None):
     """
-    Выводит на печать информацию из standing_dates
+    Выводит в открытый файл debug_file информацию из standing_dates
     """
-    from classes import Registry
+    from .classes import Registry
+
+    if session is None:
+        session = Registry
 
     def subfunc(standing_dates: dict,
                 delta: datetime.date,
                 priority: str,
                 priority_data: dict,
-                debug_file_path):
-        with open(debug_file_path, mode="at", encoding="utf-8") as debug_file:
-            print("*****Начало выгрузки print_standing_dates_to_file*****",
-                  file=debug_file)
-            print(f"Норма простоя: {delta.days} дней. ",
-                  f"В {'основные' if priority == 'main' else 'дополнительные'} периоды "
-                  f"возможных ТОиР суммарно: ",
-                  f"{priority_data['available_train_services_count']}", sep="", file=debug_file)
-            for period, period_data in sorted(priority_data["periods"].items()):
-                if period_data['surplus_wagons_count'] // Registry.train_lenght >= 1:
-                    if (len(period_data["trains"]) or
-                            len(period_data["single_wagons"])):
-                        print(f"    Период: {[str(date) for date in period]}. Возможна постановка ",
-                              f"в ТОиР {period_data['surplus_wagons_count']} ",
-                              "вагонов.", sep="", file=debug_file)
-                        for unit, unit_data in period_data.items():
-                            if unit == "single_wagons":
-                                for wagon_number, wagon_mileage in unit_data.items():
-                                    print(f"        Вагон {wagon_number}, "
-                                          f"доля пробега от максимальной нормы на начало периода {wagon_mileage}", sep="", file=debug_file)
-                            elif unit == "trains":
-                                for train_obj, train_mileage in sorted(unit_data.items()):
-                                    print(f"        Сцеп {train_obj.train_number:3d} из вагонов ",
-                                          f"{sorted([wag_num for wag_num in train_obj.wagons.keys()])}, ",
-                                          f"доля пробега от максимальной нормы на начало периода {train_mileage}", sep="", file=debug_file)
+                debug_file):
+        print("*****Начало выгрузки print_standing_dates_to_file*****",
+              file=debug_file)
+        print(f"Норма простоя: {delta.days} дней. ",
+              f"В {'основные' if priority == 'main' else 'дополнительные'} периоды "
+              f"возможных ТОиР суммарно: ",
+              f"{priority_data['available_train_services_count']}", sep="", file=debug_file)
+        for period, period_data in sorted(priority_data["periods"].items()):
+            if period_data['surplus_wagons_count'] // session.train_lenght >= 1:
+                if (len(period_data["trains"]) or
+                        len(period_data["single_wagons"])):
+                    print(f"    Период: {[str(date) for date in period]}. Возможна постановка ",
+                          f"в ТОиР {period_data['surplus_wagons_count']} ",
+                          "вагонов.", sep="", file=debug_file)
+                    for unit, unit_data in period_data.items():
+                        if unit == "single_wagons":
+                            for wagon_number, wagon_mileage in unit_data.items():
+                                print(f"        Вагон {wagon_number}, "
+                                      f"доля пробега от максимальной нормы на начало периода {wagon_mileage}", sep="", file=debug_file)
+                        elif unit == "trains":
+                            for train_obj, train_mileage in sorted(unit_data.items()):
+                                print(f"        Сцеп {train_obj.train_number:3d} из вагонов ",
+                                      f"{sorted([wag_num for wag_num in train_obj.wagons.keys()])}, ",
+                                      f"доля пробега от максимальной нормы на начало периода {train_mileage}", sep="", file=debug_file)
     if (delta is None and
         priority is None and
             priority_data is None):
@@ -163,25 +164,27 @@ def print_standing_dates_to_file(standing_dates: dict,
                         delta,
                         priority,
                         priority_data,
-                        debug_file_path)
+                        debug_file)
     else:
         subfunc(standing_dates,
                 delta,
                 priority,
                 priority_data,
-                debug_file_path)
+                debug_file)
 
 
-def print_result_services_to_file(result_file_path):
+def print_result_services_to_file(result_file_path, session=None):
     """
     Выводит на печать информацию обо всех ТОиР в периоде планирования.
     Вывод отсортирован по дате окончания ТОиР.
     """
-    from classes import Registry
+    from .classes import Registry
+    if session is None:
+        session = Registry
     delta = datetime.timedelta(days=1)
     current_month_year = ""
     with open(result_file_path, mode="wt", encoding="utf-8") as result_file:
-        for service_type, service_data in Registry.result_services.items():
+        for service_type, service_data in session.result_services.items():
             print(f"ЗАПЛАНИРОВАННЫЕ {service_type}:", file=result_file)
             for (start_date, end_date), period_data in sorted(service_data.items(),
                                                               key=lambda x: x[0][1]):
@@ -207,43 +210,46 @@ def print_service_wagons_to_file(service_wagons: dict,
                                  service_type: str,
                                  sim_service_trains: list,
                                  single_service_wagons: list,
-                                 debug_file_path):
+                                 debug_file):
     """
-    Выводит в файл информацию из service_wagons.
+    Выводит в открытый файл debug_file информацию из service_wagons.
     Для сцепов с посоставным ремонтом вывод сгруппирован по сцепам.
     service_wagons = {
     номер_вагона: {
         "periods":  [
-            [список_дат_ТОиР],
+            множество_дат_ТОиР (DateIntervals),
             ...     ],
         "delta": норма_простоя_на_ТОиР
                   }
                  }
     """
-    with open(debug_file_path, mode="at", encoding="utf-8") as debug_file:
-        print("*****Начало выгрузки print_service_wagons_to_file*****", file=debug_file)
-        for train_object in sorted(sim_service_trains):
-            if all([service_wagons.get(wagon_number) is not None for wagon_number in train_object.wagons.keys()]):
-                print(f"Вид ТОиР: {service_type}, сцеп № {train_object.train_number}",
-                      f"из вагонов {sorted([wagon_number for wagon_number in train_object.wagons.keys()])}.",
-                      "\n", f"диапазоны дат начала ТОиР: {sorted([(str(datelist[0]), str(datelist[-1])) for datelist in service_wagons[min([wagon_number for wagon_number in train_object.wagons.keys()])]['periods'] if len(datelist)])}", file=debug_file)
-        for wagon_object in single_service_wagons:
-            if service_wagons.get(wagon_object.wagon_number) is not None:
-                print(f"Вид ТОиР: {service_type}, вагон № {wagon_object.wagon_number}", "\n",
-                      f"диапазоны дат начала ТОиР: {sorted([(str(datelist[0]), str(datelist[-1])) for datelist in service_wagons[wagon_object.wagon_number]['periods'] if len(datelist)])}", file=debug_file)
+    print("*****Начало выгрузки print_service_wagons_to_file*****", file=debug_file)
+    for train_object in sorted(sim_service_trains):
+        if all([service_wagons.get(wagon_number) is not None for wagon_number in train_object.wagons.keys()]):
+            print(f"Вид ТОиР: {service_type}, сцеп № {train_object.train_number}",
+                  f"из вагонов {sorted([wagon_number for wagon_number in train_object.wagons.keys()])}.",
+                  "\n", f"диапазоны дат начала ТОиР: {sorted([(str(datelist[0]), str(datelist[-1])) for datelist in service_wagons[min([wagon_number for wagon_number in train_object.wagons.keys()])]['periods'] if len(datelist)])}", file=debug_file)
+    for wagon_object in single_service_wagons:
+        if service_wagons.get(wagon_object.wagon_number) is not None:
+            print(f"Вид ТОиР: {service_type}, вагон № {wagon_object.wagon_number}", "\n",
+                  f"диапазоны дат начала ТОиР: {sorted([(str(datelist[0]), str(datelist[-1])) for datelist in service_wagons[wagon_object.wagon_number]['periods'] if len(datelist)])}", file=debug_file)
 
 
 def check_input_dates_planning(start_date: datetime.date,
-                               end_date: datetime.date):
+                               end_date: datetime.date,
+                               session=None):
     """
     Проверяет переданные границы диапазона на попадание
     в границы периода планирования.
     Возвращает значения начала и конца периода.
     """
-    from classes import Registry
+    from .classes import Registry
+
+    if session is None:
+        session = Registry
 
-    planning_start_date = Registry.planning_start_date
-    planning_end_date = Registry.planning_end_date
+    planning_start_date = session.planning_start_date
+    planning_end_date = session.planning_end_date
     if end_date is None:
         end_date = planning_end_date
     else:
@@ -266,16 +272,20 @@ def check_input_dates_planning(start_date: datetime.date,
 
 def check_input_dates_usage(wagon_number: int,
                             start_date: datetime.date,
-                            end_date: datetime.date):
+                            end_date: datetime.date,
+                            session=None):
     """
     Проверяет переданные границы диапазона на попадание
     в границы периода эксплуатации вагона.
     Возвращает значения начала и конца периода.
     """
-    from classes import Registry
+    from .classes import Registry
+
+    if session is None:
+        session = Registry
 
-    usage_start_date = Registry.wagons[wagon_number].usage_start_date
-    usage_end_date = Registry.wagons[wagon_number].usage_end_date
+    usage_start_date = session.wagons[wagon_number].usage_start_date
+    usage_end_date = session.wagons[wagon_number].usage_end_date
     if end_date is None:
         end_date = usage_end_date
     else:
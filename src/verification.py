@@ -7,25 +7,28 @@
 
 __all__ = [
     "verify_allowed_service_start_date",
+    "verify_fleet_counters",
     "verify_planning_results"
 ]
 
 import datetime
-from utility import daterange
-from classes import Registry
+from .utility import daterange
+from .classes import DebugLog, Registry
 
 
-def verify_allowed_service_start_date(service_type: str, date: datetime.date, service_duration: datetime.timedelta):
+def verify_allowed_service_start_date(service_type: str, date: datetime.date, service_duration: datetime.timedelta, session=None):
     """
     Проверяет по delta_month и выходным дням,
     возможно ли начало ТОиР в указанную дату.
     Возвращает bool
     """
+    if session is None:
+        session = Registry
     delta_month = {"kr": 7, "sr": 4,
                    "tr3": 2, "tr2": 0, "tr1": 0,
                    "to3": 0, "to2": 0, "to1": 0}
     if (service_type in ("kr", "sr", "tr3") or
-            not Registry.transportation_values[date]["holiday"]):
+            not session.transportation_values[date]["holiday"]):
         service_start_month = date.month
         service_end_month = (
             date + service_duration).month
@@ -37,67 +40,116 @@ def verify_allowed_service_start_date(service_type: str, date: datetime.date, se
             return False
 
 
-def verify_planning_results(service_types):
+def verify_fleet_counters(debug_file=None, session=None):
+    """
+    Проверяет, что поддерживаемые инкрементально счетчики
+    Registry.wagons_in_motion и Registry.idle_wagons совпадают с результатом
+    полного подсчета по всем вагонам всех сцепов.
+    Расхождения выводит в debug_file (при его наличии),
+    счетчики заменяет результатами полного подсчета.
+    Возвращает bool.
+    """
+    from .calculation import count_idle_wagons, count_wagons_in_motion
+
+    if session is None:
+        session = Registry
+
+    wagons_in_motion = (session.wagons_in_motion.copy()
+                        if session.wagons_in_motion is not None else {})
+    idle_wagons = {idle_reason: counter.copy()
+                   for idle_reason, counter in session.idle_wagons.items()}
+    count_wagons_in_motion(session=session)
+    count_idle_wagons(session=session)
+    res = True
+    for date in daterange(session.planning_start_date, session.planning_end_date):
+        if wagons_in_motion.get(date) != session.wagons_in_motion[date]:
+            res = False
+            if debug_file is not None:
+                print(f"На дату {str(date)} количество вагонов в движении {wagons_in_motion.get(date)}",
+                      f"не совпадает с полным подсчетом {session.wagons_in_motion[date]}!", file=debug_file)
+        for idle_reason, counter in session.idle_wagons.items():
+            count = counter[date]
+            previous_count = idle_wagons.get(idle_reason, {}).get(date, 0)
+            if previous_count != count:
+                res = False
+                if debug_file is not None:
+                    print(f"На дату {str(date)} количество вагонов в {idle_reason}",
+                          f"{previous_count}",
+                          f"не совпадает с полным подсчетом {count}!", file=debug_file)
+    return res
+
+
+def verify_planning_results(service_types, session=None):
     """
     Получает список видов ТОиР
     Проверяет, что для каждого вагона из Registry.wagons во всем 
     диапазоне планирования соблюдаются нормативы межремонтных пробегов.
+    Замечания выводятся в session.debug_log (если он не задан - в файл Data/debug.txt).
     """
     # service_types = ("kr", "sr", "tr3",
     #                  "tr2", "tr1",
     #                  "to3", "to2", "to1")
-    from selection import select_debug_data_path
+    from .selection import select_debug_data_path
+
+    if session is None:
+        session = Registry
 
-    debug_file_path = select_debug_data_path()
+    debug_log = session.debug_log
+    if debug_log is None:
+        debug_log = DebugLog(select_debug_data_path())
     delta = datetime.timedelta(days=1)
     no_problem_flag = True
-    with open(debug_file_path, mode="at", encoding="utf-8") as debug_file:
-        for train_number, train_object in sorted(Registry.trains.items()):
-            for wagon_number, wagon_object in sorted(train_object.wagons.items()):
-                mileage_standards = wagon_object.define_wagon_mileage_stardards()
-                wagon_usage_start_date = wagon_object.usage_start_date
-                wagon_usage_end_date = wagon_object.usage_end_date
-                for date in daterange(wagon_usage_start_date,
-                                      wagon_usage_end_date):
-                    date_mileages = wagon_object.mileage[date]
-                    for service_type in service_types:
-                        service_mileage_type = "kr_sr" if service_type in (
-                            "kr", "sr") else service_type
-                        if date_mileages[service_mileage_type] is None:
-                            if date_mileages["ne"] > mileage_standards[service_type]["max"]:
-                                print(f"Вагон № {wagon_number:5d}, сцеп № {train_number:3d}:",
-                                      f"на дату {str(date)} перепробег от н.э. для {service_type}!", file=debug_file)
-                                no_problem_flag = False
-                        else:
-                            if date_mileages[service_mileage_type] > mileage_standards[service_type]["max"]:
-                                print(f"Вагон № {wagon_number:5d}, сцеп № {train_number:3d}:",
-                                      f"на дату {str(date)} перепробег от {service_type}!", file=debug_file)
-                                no_problem_flag = False
-                            elif (date_mileages[service_mileage_type] == 0 and
-                                  date_mileages["idle_reason"] in service_types):
-                                previous_date = date - delta
-                                if previous_date >= wagon_usage_start_date:
-                                    previous_date_mileages = wagon_object.mileage[previous_date]
-                                    if previous_date_mileages[service_mileage_type] is None:
-                                        service_standing_mileage = date_mileages["ne"]
-                                    elif previous_date_mileages[service_mileage_type]:
-                                        service_standing_mileage = (previous_date_mileages[service_type] +
-                                                                    previous_date_mileages["daily"])
-                                        if service_standing_mileage > mileage_standards[service_type]["max"]:
+    debug_file = debug_log.file
+    for train_number, train_object in sorted(session.trains.items()):
+        for wagon_number, wagon_object in sorted(train_object.wagons.items()):
+            mileage_standards = wagon_object.define_wagon_mileage_stardards()
+            wagon_usage_start_date = wagon_object.usage_start_date
+            wagon_usage_end_date = wagon_object.usage_end_date
+            for date in daterange(wagon_usage_start_date,
+                                  wagon_usage_end_date):
+                date_mileages = wagon_object.mileage[date]
+                for service_type in service_types:
+                    service_mileage_type = "kr_sr" if service_type in (
+                        "kr", "sr") else service_type
+                    if date_mileages[service_mileage_type] is None:
+                        if date_mileages["ne"] > mileage_standards[service_type]["max"]:
+                            print(f"Вагон № {wagon_number:5d}, сцеп № {train_number:3d}:",
+                                  f"на дату {str(date)} перепробег от н.э. для {service_type}!", file=debug_file)
+                            no_problem_flag = False
+                    else:
+                        if date_mileages[service_mileage_type] > mileage_standards[service_type]["max"]:
+                            print(f"Вагон № {wagon_number:5d}, сцеп № {train_number:3d}:",
+                                  f"на дату {str(date)} перепробег от {service_type}!", file=debug_file)
+                            no_problem_flag = False
+                        elif (date_mileages[service_mileage_type] == 0 and
+                              date_mileages["idle_reason"] in service_types):
+                            previous_date = date - delta
+                            if previous_date >= wagon_usage_start_date:
+                                previous_date_mileages = wagon_object.mileage[previous_date]
+                                if previous_date_mileages[service_mileage_type] is None:
+                                    service_standing_mileage = date_mileages["ne"]
+                                elif previous_date_mileages[service_mileage_type]:
+                                    service_standing_mileage = (previous_date_mileages[service_type] +
+                                                                previous_date_mileages["daily"])
+                                    if service_standing_mileage > mileage_standards[service_type]["max"]:
 
+                                        print(f"Вагон № {wagon_number:5d}, сцеп № {train_number:3d}:",
+                                              f"{str(date)} запланирован {date_mileages['idle_reason']}.",
+                                              f"От {service_type} перепробег!", file=debug_file)
+                                        no_problem_flag = False
+                                    elif service_standing_mileage < mileage_standards[service_type]["min"]:
+                                        if (date_mileages['idle_reason'] != service_type and
+                                                (service_type != "to1" and
+                                                 service_type != "to2" and
+                                                 service_type != "tr1")):
                                             print(f"Вагон № {wagon_number:5d}, сцеп № {train_number:3d}:",
                                                   f"{str(date)} запланирован {date_mileages['idle_reason']}.",
-                                                  f"От {service_type} перепробег!", file=debug_file)
-                                            no_problem_flag = False
-                                        elif service_standing_mileage < mileage_standards[service_type]["min"]:
-                                            if (date_mileages['idle_reason'] != service_type and
-                                                    (service_type != "to1" and
-                                                     service_type != "to2" and
-                                                     service_type != "tr1")):
-                                                print(f"Вагон № {wagon_number:5d}, сцеп № {train_number:3d}:",
-                                                      f"{str(date)} запланирован {date_mileages['idle_reason']}.",
-                                                      f"От {service_type} недопробег!", file=debug_file)
-                                            no_problem_flag = False
+                                                  f"От {service_type} недопробег!", file=debug_file)
+                                        no_problem_flag = False
+    if not verify_fleet_counters(debug_file, session=session):
+        no_problem_flag = False
+    if debug_log is not session.debug_log:
+        debug_log.close()
     if no_problem_flag:
         print("Замечаний по расчету не обнаружено!")
     else: